@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Analysis Worker
+Long-lived analysis process for the DriveGuard AI backend server
+
+Spawning a fresh Python process per upload re-imports torch / ultralytics,
+re-runs the GPU check and reloads the YOLO weights every time. The worker
+pays that once: it listens on a Unix socket and runs analyze jobs with
+models and thread pools kept warm. It runs one job at a time; a job that
+arrives while another is running is turned away at once, and its client
+analyzes in its own process, so concurrent uploads run side by side as
+they did before the worker.
+
+Protocol (one connection per job, newline-delimited JSON):
+    request   {"video_path": ..., "video_filename": ..., "user": optional email}
+    response  {"log": line} ... then {"result": {...}} or {"error": msg},
+              or {"busy": true} straight away while another job runs
+
+    request   {"metrics": true}
+    response  {"models": [...]}  load / warm-up time and memory of the
+              loaded YOLO models (see yolo_models.model_metrics)
+
+analyze_video_single.py is the client (request_analysis) and runs the same
+job in-process (run_analysis_job) when no worker is listening.
+
+Usage:
+    python3 analysis_worker.py
+"""
+
+import os
+import sys
+import json
+import signal
+import socket
+import socketserver
+import tempfile
+import threading
+import traceback
+from contextlib import redirect_stdout
+from typing import Any, Callable, Dict, Optional
+
+WORKER_SOCKET = os.getenv("ANALYSIS_WORKER_SOCKET",
+                          os.path.join(tempfile.gettempdir(), "driveguard-analysis.sock"))
+CONNECT_TIMEOUT_SEC = 2.0
+
+# One analysis at a time (stdout redirection and the models are per
+# process); jobs arriving meanwhile are sent back to run in-process
+_JOB_LOCK = threading.Lock()
+_RESULTS_STORE = None
+
+
+def run_analysis_job(video_path: str, video_filename: str, user: Optional[str] = None) -> Dict[str, Any]:
+    """Analyze one upload, write its individual JSON and upsert it into the results store"""
+    global _RESULTS_STORE
+    # Heavy imports (torch, ultralytics) stay out of the client path
+    from main_v2 import analyze_video, convert_to_python_types, CONFIG_FOLDER, OUTPUT_FOLDER
+
+    # Load calibrations
+    calib_file = os.path.join(CONFIG_FOLDER, "video_calibrations.json")
+    print(f"📋 Loading calibration from: {calib_file}")
+    try:
+        with open(calib_file, "r") as f:
+            calibrations = json.load(f)
+    except:
+        calibrations = {}
+
+    # Show calibration being used
+    calib = calibrations.get(video_filename, {})
+    if calib:
+        print(f"\n📊 Using calibration for {video_filename}:")
+        print(f"   - meters_per_pixel: {calib.get('meters_per_pixel', 'default')}")
+        print(f"   - roi_top: {calib.get('roi_top', 'default')}")
+        print(f"   - roi_bottom: {calib.get('roi_bottom', 'default')}\n")
+
+    print(f"{'='*60}")
+    print(f"🔄 Analyzing: {video_filename}")
+    print(f"{'='*60}\n")
+
+    stem = os.path.splitext(video_filename)[0]
+    timeseries_file = os.path.join(OUTPUT_FOLDER, f"{stem}_timeseries.npz")
+    result = convert_to_python_types(analyze_video(video_path, video_filename, calibrations, timeseries_file))
+
+    # Save individual analysis file
+    output_file = os.path.join(OUTPUT_FOLDER, f"{stem}_analysis.json")
+    with open(output_file, "w") as f:
+        json.dump(result, f, indent=4)
+    print(f"\n💾 Saved individual analysis: {output_file}")
+
+    # One row per video, then the merged JSON the servers read for the frontend
+    from results_store import ResultsStore, MERGED_OUTPUT_JSON
+    if _RESULTS_STORE is None:
+        _RESULTS_STORE = ResultsStore()
+    _RESULTS_STORE.upsert(video_filename, result, user)
+    print(f"💾 Updated results store: {_RESULTS_STORE.db_path}")
+    if _RESULTS_STORE.export_merged():
+        print(f"💾 Exported merged analysis: {MERGED_OUTPUT_JSON}")
+    return result
+
+
+# ===================== CLIENT =====================
+def _connect(socket_path: str) -> Optional[socket.socket]:
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(socket_path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CONNECT_TIMEOUT_SEC)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        return None
+    sock.settimeout(None)  # jobs take as long as they take
+    return sock
+
+
+def request_analysis(video_path: str, video_filename: str, user: Optional[str] = None,
+                     on_log: Callable[[str], None] = lambda line: print(line, flush=True),
+                     socket_path: str = WORKER_SOCKET) -> Optional[Dict[str, Any]]:
+    """
+    Run one job on the worker, passing its log lines to `on_log`.
+
+    Returns the analysis result, or None if no worker is listening, it is
+    busy with another job or it went away before answering (the caller
+    should analyze in-process).
+    Raises RuntimeError if the analysis itself failed.
+    """
+    sock = _connect(socket_path)
+    if sock is None:
+        return None
+    with sock, sock.makefile("rwb") as stream:
+        request = {"video_path": os.path.abspath(video_path), "video_filename": video_filename, "user": user}
+        stream.write((json.dumps(request) + "\n").encode())
+        stream.flush()
+        for raw in stream:
+            message = json.loads(raw)
+            if "log" in message:
+                on_log(message["log"])
+            elif "result" in message:
+                return message["result"]
+            elif "error" in message:
+                raise RuntimeError(message["error"])
+            elif message.get("busy"):
+                print("ℹ️  Analysis worker is busy with another upload")
+                return None
+    print("⚠️  Analysis worker closed the connection before finishing")
+    return None
+
+
+# ===================== SERVER =====================
+class _LogStream:
+    """stdout replacement that echoes to the console and streams lines to the client"""
+
+    def __init__(self, send: Callable[[Dict[str, Any]], None], console):
+        self.send = send
+        self.console = console
+        self.partial = ""
+
+    def write(self, text: str) -> int:
+        self.console.write(text)
+        lines = (self.partial + text).split("\n")
+        self.partial = lines.pop()
+        for line in lines:
+            self.send({"log": line})
+        return len(text)
+
+    def flush(self):
+        self.console.flush()
+
+
+class _JobHandler(socketserver.StreamRequestHandler):
+
+    def _send(self, message: Dict[str, Any]):
+        if self.client_gone:
+            return
+        try:
+            self.wfile.write((json.dumps(message) + "\n").encode())
+            self.wfile.flush()
+        except OSError:
+            # Keep analyzing; the results are still written to disk
+            self.client_gone = True
+
+    def handle(self):
+        self.client_gone = False
+        try:
+            request = json.loads(self.rfile.readline())
+            if request.get("metrics"):
+                from yolo_models import model_metrics
+                self._send({"models": model_metrics()})
+                return
+            video_path, video_filename = request["video_path"], request["video_filename"]
+            user = request.get("user")
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self._send({"error": f"Bad request: {e}"})
+            return
+
+        if not _JOB_LOCK.acquire(blocking=False):
+            self._send({"busy": True})
+            return
+        try:
+            stream = _LogStream(self._send, sys.__stdout__)
+            try:
+                with redirect_stdout(stream):
+                    result = run_analysis_job(video_path, video_filename, user)
+                    print()
+                self._send({"result": result})
+            except Exception as e:
+                traceback.print_exc()
+                self._send({"error": str(e)})
+        finally:
+            _JOB_LOCK.release()
+
+
+class _WorkerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(socket_path: str = WORKER_SOCKET):
+    """Warm up the models and serve analyze jobs until terminated"""
+    if os.path.exists(socket_path):
+        sock = _connect(socket_path)
+        if sock is not None:
+            sock.close()
+            print(f"✅ Analysis worker already running on {socket_path}")
+            return
+        os.unlink(socket_path)  # left over from a worker that was killed
+
+    print("🔥 Warming up analysis worker...")
+    import main_v2
+    main_v2.preload_models()
+
+    server = _WorkerServer(socket_path, _JobHandler)
+    os.chmod(socket_path, 0o600)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f"✅ Analysis worker ready on {socket_path}", flush=True)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+if __name__ == "__main__":
+    serve()
@@ -3,29 +3,35 @@
 Single Video Analysis Wrapper
 Analyzes a single video file for the DriveGuard AI backend server
 Supports both full path and filename-only usage
+
+Hands the job to the warm analysis worker (analysis_worker.py) when one is
+running, and analyzes in-process otherwise.
 """
 
 import sys
 import os
-import json
 
 # Add parent directory to path to import from analysis modules
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from main_v2 import analyze_video, MODELS_FOLDER, CONFIG_FOLDER, OUTPUT_FOLDER, BASE_DIR
+# Only the light client side; main_v2 (torch, YOLO) is imported on fallback
+from analysis_worker import request_analysis, run_analysis_job
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 def main():
     # Support both old usage (path + filename) and new usage (filename only)
     if len(sys.argv) < 2:
         print("Usage:")
         print("  python3 analyze_video_single.py <video_filename>")
-        print("  python3 analyze_video_single.py <video_path> <video_filename>")
+        print("  python3 analyze_video_single.py <video_path> <video_filename> [user_email]")
         print("\nExamples:")
         print("  python3 analyze_video_single.py Dashcam004.mp4")
         print("  python3 analyze_video_single.py /path/to/video.mp4 video.mp4")
         sys.exit(1)
     
     # Determine if using new (filename only) or old (path + filename) format
+    user = None
     if len(sys.argv) == 2:
         # New format: just filename
         video_filename = sys.argv[1]
@@ -34,55 +40,19 @@ def main():
         # Old format: path + filename (for backward compatibility)
         video_path = sys.argv[1]
         video_filename = sys.argv[2]
+        # Optional uploader, indexed in the results store
+        user = sys.argv[3] if len(sys.argv) > 3 else None
     
     if not os.path.exists(video_path):
         print(f"❌ Error: Video file not found: {video_path}")
         sys.exit(1)
     
-    # Load calibrations
-    calib_file = os.path.join(CONFIG_FOLDER, "video_calibrations.json")
-    print(f"📋 Loading calibration from: {calib_file}")
-    try:
-        with open(calib_file, "r") as f:
-            calibrations = json.load(f)
-    except:
-        calibrations = {}
-    
-    # Show calibration being used
-    calib = calibrations.get(video_filename, {})
-    if calib:
-        print(f"\n📊 Using calibration for {video_filename}:")
-        print(f"   - meters_per_pixel: {calib.get('meters_per_pixel', 'default')}")
-        print(f"   - roi_top: {calib.get('roi_top', 'default')}")
-        print(f"   - roi_bottom: {calib.get('roi_bottom', 'default')}\n")
-    
     # Analyze the video
     try:
-        print(f"{'='*60}")
-        print(f"🔄 Analyzing: {video_filename}")
-        print(f"{'='*60}\n")
-        
-        result = analyze_video(video_path, video_filename, calibrations)
-        
-        # Save individual analysis file
-        output_file = os.path.join(OUTPUT_FOLDER, f"{os.path.splitext(video_filename)[0]}_analysis.json")
-        with open(output_file, "w") as f:
-            json.dump(result, f, indent=4)
-        print(f"\n💾 Saved individual analysis: {output_file}")
-        
-        # Update merged analysis file (important for frontend)
-        merged_output_file = os.path.join(OUTPUT_FOLDER, "merged_output_analysis.json")
-        if os.path.exists(merged_output_file):
-            with open(merged_output_file, 'r') as f:
-                merged_data = json.load(f)
-        else:
-            merged_data = {}
-        
-        merged_data[video_filename] = result
-        
-        with open(merged_output_file, 'w') as f:
-            json.dump(merged_data, f, indent=4)
-        print(f"💾 Updated merged analysis: {merged_output_file}")
+        result = request_analysis(video_path, video_filename, user)
+        if result is None:
+            print("ℹ️  No analysis worker available, analyzing in-process")
+            result = run_analysis_job(video_path, video_filename, user)
         
         # Display summary
         print(f"\n{'='*60}")
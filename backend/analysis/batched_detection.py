@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Batched Detection
+Batched YOLO inference and a lightweight IoU tracker for DriveGuard AI
+
+The close-encounter analyzers called model.track() once per sampled frame.
+On CPU a batch of one wastes much of the inference budget: every call pays
+the pre/post-processing and Python overhead, and the forward pass cannot
+vectorize across frames. BatchedDetector gathers sampled frames and runs
+one model.predict() on up to batch_size of them. IoUTracker then assigns
+track IDs to the detections in frame order: greedy IoU matching against
+constant-velocity predictions of the live tracks.
+
+Batching is tuned in config/analysis_config.json ("inference"):
+
+    batch_size       frames per forward pass. 1 keeps the per-frame
+                     model.track() path (BoT-SORT IDs); 8-16 suits offline
+                     analysis
+    max_latency_ms   low-latency mode: run a partial batch once its oldest
+                     frame has waited this long. null waits for full
+                     batches (offline)
+    engine           "ultralytics" (model.predict) or "lean" (LeanDetector,
+                     see lean_detection.py; always batched, any batch_size)
+    roi              {"enabled", "min_object_px"}: run the model on the
+                     analyzer's region of interest only (InferenceRoi),
+                     at a reduced imgsz; always batched
+
+YOLO_BATCH_SIZE overrides batch_size and YOLO_ROI (0/1) roi.enabled.
+Results are delivered late (up to a batch behind), so analyzers must
+flush() before finalizing or exporting.
+
+The close-encounter analyzers throw most of the frame away: the proximity
+detector drops boxes shorter than 20% of the frame height, the band
+analyzer only scores boxes in the lower centre. InferenceRoi crops the
+frame to that region and picks the smallest imgsz at which the smallest
+box of interest is still min_object_px tall in the model input, capped
+at the resolution of full-frame inference; boxes are shifted back to
+frame pixels before tracking. Boxes cut by the crop edge come back
+truncated. utils/benchmark_roi.py reports the throughput gain and the
+recall of the boxes of interest against full-frame inference.
+"""
+
+import os
+import math
+import time
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
+
+from detection_store import FrameDetections
+from yolo_models import YOLO_IMGSZ, predict_args
+from lean_detection import LeanDetector
+
+DEFAULT_BATCH_SIZE = 1
+ENGINES = ("ultralytics", "lean")
+
+# IoUTracker: minimum IoU to continue a track, and how many processed
+# frames a track survives without a match
+TRACK_IOU = 0.3
+TRACK_MAX_AGE = 5
+
+# InferenceRoi: height of the smallest box of interest in model input
+# pixels (YOLOv8's finest head has stride 8), and the imgsz granularity
+MIN_OBJECT_PX = 24
+IMGSZ_STRIDE = 32
+
+
+def inference_settings(config: Dict[str, Any]) -> Tuple[int, Optional[float], str]:
+    """(batch_size, max_latency_ms, engine) from the "inference" block of analysis_config.json"""
+    block = config.get("inference") or {}
+    batch_size = int(os.getenv("YOLO_BATCH_SIZE", block.get("batch_size", DEFAULT_BATCH_SIZE)))
+    max_latency_ms = block.get("max_latency_ms")
+    engine = block.get("engine", "ultralytics")
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown inference engine '{engine}' (choose from {', '.join(ENGINES)})")
+    return max(1, batch_size), (float(max_latency_ms) if max_latency_ms else None), engine
+
+
+def roi_settings(config: Dict[str, Any]) -> Optional[int]:
+    """min_object_px if ROI inference is enabled in the "inference" block, else None"""
+    block = (config.get("inference") or {}).get("roi") or {}
+    enabled = os.getenv("YOLO_ROI", "1" if block.get("enabled", False) else "0") == "1"
+    return int(block.get("min_object_px", MIN_OBJECT_PX)) if enabled else None
+
+
+def roi_imgsz(long_side: float, min_box: float, frame_long_side: float,
+              min_object_px: int = MIN_OBJECT_PX) -> int:
+    """
+    imgsz (a stride multiple) for a crop whose longer side is long_side:
+    just enough to scale min_box to min_object_px, and never more than the
+    scale full-frame inference at YOLO_IMGSZ gives. Lengths in any one unit.
+    """
+    need = min(min_object_px * long_side / max(min_box, 1e-6), YOLO_IMGSZ * long_side / frame_long_side)
+    return int(min(YOLO_IMGSZ, max(IMGSZ_STRIDE, math.ceil(need / IMGSZ_STRIDE) * IMGSZ_STRIDE)))
+
+
+class InferenceRoi:
+    """
+    Region (x0, y0, x1, y1), in fractions of the frame, run through the
+    model at the imgsz that keeps a box min_box_frac of the frame height
+    tall at min_object_px (see roi_imgsz). imgsz only depends on the frame
+    aspect ratio (width / height), so it is known before the first frame.
+    """
+
+    def __init__(self, frac: Tuple[float, float, float, float], min_box_frac: float,
+                 min_object_px: int, aspect: float):
+        self.frac = tuple(frac)
+        x0, y0, x1, y1 = frac
+        # In units of frame height
+        self.imgsz = roi_imgsz(max((x1 - x0) * aspect, y1 - y0), min_box_frac, max(aspect, 1.0), min_object_px)
+
+    def crop(self, image: np.ndarray) -> Tuple[np.ndarray, Tuple[int, int]]:
+        """(view of the region, its (left, top) offset in the image)"""
+        h, w = image.shape[:2]
+        x0, y0, x1, y1 = self.frac
+        left, top = int(w * x0), int(h * y0)
+        return image[top:int(round(h * y1)), left:int(round(w * x1))], (left, top)
+
+    def settings(self) -> Dict[str, Any]:
+        return {"roi": list(self.frac), "imgsz": self.imgsz}
+
+
+def box_iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """IoU of every box in a (N, 4) with every box in b (M, 4), xyxy"""
+    ix = np.clip(np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0]), 0, None)
+    iy = np.clip(np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1]), 0, None)
+    inter = ix * iy
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+class IoUTracker:
+    """Greedy IoU association with constant-velocity box prediction"""
+
+    name = "iou"
+    # Bump when matching or aging changes, so recorded detections re-run
+    VERSION = 1
+
+    def __init__(self, iou_thresh: float = TRACK_IOU, max_age: int = TRACK_MAX_AGE):
+        self.iou_thresh = iou_thresh
+        self.max_age = max_age
+        self.reset()
+
+    def settings(self) -> Dict[str, Any]:
+        return {"name": self.name, "iou_thresh": self.iou_thresh, "max_age": self.max_age,
+                "version": self.VERSION}
+
+    def reset(self):
+        self.ids = np.empty(0, np.int32)
+        self.cls = np.empty(0, np.int16)
+        self.boxes = np.empty((0, 4), np.float32)
+        self.velocity = np.empty((0, 4), np.float32)
+        self.age = np.empty(0, np.int32)
+        self.next_id = 1
+
+    def update(self, dets: FrameDetections) -> FrameDetections:
+        """The same detections with track_id set; call once per frame, in order"""
+        n = len(dets)
+        track_id = np.full(n, -1, np.int32)
+        matched_tracks = np.zeros(len(self.ids), bool)
+        if len(self.ids) and n:
+            iou = box_iou_matrix(self.boxes + self.velocity, dets.xyxy)
+            iou[self.cls[:, None] != dets.cls[None, :]] = 0.0
+            # Greedy: best remaining pair first
+            for flat in np.argsort(-iou, axis=None):
+                t, d = divmod(int(flat), n)
+                if iou[t, d] < self.iou_thresh:
+                    break
+                if matched_tracks[t] or track_id[d] >= 0:
+                    continue
+                matched_tracks[t] = True
+                track_id[d] = self.ids[t]
+                self.velocity[t] = 0.5 * self.velocity[t] + 0.5 * (dets.xyxy[d] - self.boxes[t])
+                self.boxes[t] = dets.xyxy[d]
+                self.age[t] = 0
+
+        self.age[~matched_tracks] += 1
+        keep = self.age <= self.max_age
+        new = track_id < 0
+        new_ids = np.arange(self.next_id, self.next_id + int(new.sum()), dtype=np.int32)
+        self.next_id += len(new_ids)
+        track_id[new] = new_ids
+        self.ids = np.concatenate([self.ids[keep], new_ids])
+        self.cls = np.concatenate([self.cls[keep], dets.cls[new]])
+        self.boxes = np.concatenate([self.boxes[keep], dets.xyxy[new]]).astype(np.float32)
+        self.velocity = np.concatenate([self.velocity[keep], np.zeros((len(new_ids), 4), np.float32)])
+        self.age = np.concatenate([self.age[keep], np.zeros(len(new_ids), np.int32)])
+        return FrameDetections(track_id, dets.cls, dets.xyxy, dets.conf)
+
+
+class BatchedDetector:
+    """
+    Collects frames and runs them through the model batch_size at a time.
+    submit() and flush() return the finished frames as (idx, detections,
+    payload), in submission order, with track IDs from the IoUTracker.
+    `model` is an ultralytics YOLO or a LeanDetector (built for roi.imgsz
+    when an InferenceRoi is given).
+    """
+
+    def __init__(self, model, batch_size: int, conf: float, iou: float,
+                 max_latency_ms: Optional[float] = None, roi: Optional[InferenceRoi] = None):
+        self.model = model
+        self.batch_size = batch_size
+        self.conf = conf
+        self.iou = iou
+        self.max_latency = max_latency_ms / 1000.0 if max_latency_ms else None
+        self.roi = roi
+        self.tracker = IoUTracker()
+        # (idx, image, payload, (left, top) of the ROI crop)
+        self.pending: List[Tuple[int, np.ndarray, Any, Tuple[int, int]]] = []
+        self._oldest = 0.0
+        self.batches = 0
+        self.frames = 0
+        self.seconds = 0.0
+
+    def submit(self, idx: int, image: np.ndarray, payload: Any = None) -> List[Tuple[int, FrameDetections, Any]]:
+        if not self.pending:
+            self._oldest = time.perf_counter()
+        offset = (0, 0)
+        if self.roi is not None:
+            image, offset = self.roi.crop(image)
+        # Decoder buffers are recycled once on_frame() returns
+        self.pending.append((idx, image.copy(), payload, offset))
+        if len(self.pending) >= self.batch_size or (
+                self.max_latency is not None and time.perf_counter() - self._oldest >= self.max_latency):
+            return self.flush()
+        return []
+
+    def flush(self) -> List[Tuple[int, FrameDetections, Any]]:
+        """Run whatever is pending"""
+        pending, self.pending = self.pending, []
+        if not pending:
+            return []
+        start = time.perf_counter()
+        images = [image for _, image, _, _ in pending]
+        if isinstance(self.model, LeanDetector):
+            dets = [FrameDetections.from_records(r) for r in self.model.detect(images)]
+        else:
+            imgsz = self.roi.imgsz if self.roi is not None else YOLO_IMGSZ
+            results = self.model.predict(images, conf=self.conf, iou=self.iou, verbose=False,
+                                         **predict_args(imgsz=imgsz))
+            dets = [FrameDetections.from_boxes(r.boxes) for r in results]
+        # Back to frame pixels
+        for (_, _, _, (left, top)), d in zip(pending, dets):
+            if left or top:
+                d.xyxy += np.array([left, top, left, top], np.float32)
+        self.seconds += time.perf_counter() - start
+        self.batches += 1
+        self.frames += len(pending)
+        return [(idx, self.tracker.update(d), payload) for (idx, _, payload, _), d in zip(pending, dets)]
+
+    @property
+    def ms_per_frame(self) -> float:
+        return 1000.0 * self.seconds / self.frames if self.frames else 0.0
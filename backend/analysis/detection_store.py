@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Detection Store
+Persistent per-frame YOLO detections for DriveGuard AI
+
+The close-encounter analyzers used to run model.track() and their
+distance / TTC / band thresholds in one loop, so tuning a threshold meant
+re-running inference. Raw tracked detections are now recorded once per
+(video, detector settings) as columnar numpy arrays in an .npz file:
+
+    frames    int32   [F]     processed frame indices, in order
+    times     float64 [F]     frame index / fps
+    offsets   int64   [F+1]   detections of frames[k] are rows offsets[k]:offsets[k+1]
+    track_id  int32   [N]     tracker ID, -1 when the tracker gave none
+    cls       int16   [N]     class index into meta["names"]
+    xyxy      float32 [N, 4]  box in the pixels of the frame the model saw
+    conf      float32 [N]
+
+Frames without detections keep an empty row range, so a replay sees the
+same sample timeline as the live run. The analyzers replay from the store
+instead of calling the model (EnhancedProximityDetector then needs no
+frames at all).
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+from typing import Dict, Any, List, Optional, Iterator, Tuple
+
+from result_cache import evict_lru
+
+DETECTION_CACHE_MAX_MB = float(os.getenv("ANALYSIS_DETECTION_CACHE_MAX_MB", "1024"))
+DETECTION_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_DETECTION_CACHE_MAX_ENTRIES", "200"))
+
+
+# One detection per record; the lean runner (lean_detection.py) returns one
+# array of these per frame
+DETECTION_DTYPE = np.dtype([("xyxy", np.float32, (4,)), ("conf", np.float32),
+                            ("cls", np.int16), ("track_id", np.int32)])
+
+
+def class_names(names) -> Dict[int, str]:
+    """model.names (a dict or a list, depending on the model) as {class index: name}"""
+    return {int(k): v for k, v in (names.items() if isinstance(names, dict) else enumerate(names))}
+
+
+class FrameDetections:
+    """Detections of one frame as parallel arrays (row k is one box)"""
+
+    __slots__ = ("track_id", "cls", "xyxy", "conf")
+
+    def __init__(self, track_id: np.ndarray, cls: np.ndarray, xyxy: np.ndarray, conf: np.ndarray):
+        self.track_id = track_id
+        self.cls = cls
+        self.xyxy = xyxy
+        self.conf = conf
+
+    def __len__(self) -> int:
+        return len(self.cls)
+
+    @classmethod
+    def empty(cls) -> "FrameDetections":
+        return cls(np.empty(0, np.int32), np.empty(0, np.int16),
+                   np.empty((0, 4), np.float32), np.empty(0, np.float32))
+
+    @classmethod
+    def from_records(cls, records: np.ndarray) -> "FrameDetections":
+        """Columns of a DETECTION_DTYPE array (views, no copy)"""
+        return cls(records["track_id"], records["cls"], records["xyxy"], records["conf"])
+
+    @classmethod
+    def from_boxes(cls, boxes) -> "FrameDetections":
+        """Convert an ultralytics Boxes object (one tensor copy per column)"""
+        if boxes is None or len(boxes) == 0:
+            return cls.empty()
+        ids = boxes.id
+        track_id = (ids.cpu().numpy().astype(np.int32) if ids is not None
+                    else np.full(len(boxes), -1, np.int32))
+        return cls(track_id,
+                   boxes.cls.cpu().numpy().astype(np.int16),
+                   boxes.xyxy.cpu().numpy().astype(np.float32, copy=False),
+                   boxes.conf.cpu().numpy().astype(np.float32, copy=False))
+
+
+class DetectionStore:
+    """Read side: one video's recorded detections"""
+
+    def __init__(self, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]):
+        self.frames = arrays["frames"]
+        self.times = arrays["times"]
+        self.offsets = arrays["offsets"]
+        self.track_id = arrays["track_id"]
+        self.cls = arrays["cls"]
+        self.xyxy = arrays["xyxy"]
+        self.conf = arrays["conf"]
+        self.meta = meta
+        self._rows = None
+
+    @classmethod
+    def load(cls, path: str) -> Optional["DetectionStore"]:
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                arrays = {k: data[k] for k in data.files}
+            meta = json.loads(str(arrays.pop("meta")))
+        except (OSError, ValueError, KeyError):
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+        return cls(arrays, meta)
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    @property
+    def frame_size(self) -> Tuple[int, int]:
+        """(w, h) of the frames the detector saw"""
+        return tuple(self.meta["frame_size"])
+
+    @property
+    def names(self) -> Dict[int, str]:
+        return class_names(self.meta["names"])
+
+    def _slice(self, k: int) -> FrameDetections:
+        lo, hi = self.offsets[k], self.offsets[k + 1]
+        return FrameDetections(self.track_id[lo:hi], self.cls[lo:hi], self.xyxy[lo:hi], self.conf[lo:hi])
+
+    def iter_frames(self) -> Iterator[Tuple[int, FrameDetections]]:
+        """(frame index, detections) for every recorded frame, in order"""
+        for k in range(len(self.frames)):
+            yield int(self.frames[k]), self._slice(k)
+
+    def frame(self, idx: int) -> FrameDetections:
+        """Detections recorded for frame `idx` (empty if it was not processed)"""
+        if self._rows is None:
+            self._rows = {int(f): k for k, f in enumerate(self.frames)}
+        k = self._rows.get(idx)
+        return self._slice(k) if k is not None else FrameDetections.empty()
+
+
+class DetectionRecorder:
+    """Write side: collects detections frame by frame during a live run"""
+
+    def __init__(self, fps: float):
+        self.fps = fps
+        self.frames: List[int] = []
+        self.parts: List[FrameDetections] = []
+
+    def add(self, idx: int, dets: FrameDetections):
+        self.frames.append(idx)
+        self.parts.append(dets)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        parts = self.parts or [FrameDetections.empty()]
+        counts = [len(p) for p in self.parts]
+        frames = np.asarray(self.frames, np.int32)
+        return {
+            "frames": frames,
+            "times": frames / float(self.fps),
+            "offsets": np.concatenate(([0], np.cumsum(counts, dtype=np.int64))).astype(np.int64),
+            "track_id": np.concatenate([p.track_id for p in parts]).astype(np.int32),
+            "cls": np.concatenate([p.cls for p in parts]).astype(np.int16),
+            "xyxy": np.concatenate([p.xyxy for p in parts]).astype(np.float32).reshape(-1, 4),
+            "conf": np.concatenate([p.conf for p in parts]).astype(np.float32),
+        }
+
+
+class DetectionCache:
+    """
+    Where the detection stores of one video live. Picklable, so segment
+    workers get the same cache as the parent.
+    """
+
+    def __init__(self, folder: str, video_hash: str, context: Optional[Dict[str, Any]] = None,
+                 max_mb: float = DETECTION_CACHE_MAX_MB, max_entries: int = DETECTION_CACHE_MAX_ENTRIES):
+        self.folder = folder
+        self.video_hash = video_hash
+        self.context = context or {}
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_entries = max_entries
+
+    def path(self, settings: Dict[str, Any]) -> str:
+        """Store file for one set of detector settings (model, conf, width, sampling...)"""
+        h = hashlib.blake2b(digest_size=20)
+        h.update(self.video_hash.encode())
+        h.update(json.dumps([settings, self.context], sort_keys=True, default=str).encode())
+        return os.path.join(self.folder, f"{h.hexdigest()}.npz")
+
+    def load(self, settings: Dict[str, Any]) -> Optional[DetectionStore]:
+        return DetectionStore.load(self.path(settings))
+
+    def save(self, settings: Dict[str, Any], recorder: DetectionRecorder,
+             frame_size: Tuple[int, int], names):
+        os.makedirs(self.folder, exist_ok=True)
+        arrays = recorder.arrays()
+        meta = {"settings": settings, "frame_size": list(frame_size),
+                "names": {str(k): v for k, v in class_names(names).items()}}
+        arrays["meta"] = np.array(json.dumps(meta))
+        # Write then rename, so a concurrent reader never sees half a file
+        fd, tmp = tempfile.mkstemp(dir=self.folder, suffix=".npz.tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp, self.path(settings))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        evict_lru(self.folder, "*.npz", self.max_bytes, self.max_entries)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Ego-Motion Estimation
+One camera-motion estimate per sampled frame, shared by several analyzers
+
+The speed, turn and lane-change analyzers each estimated camera motion on
+their own (LK features for forward speed, ORB + BFMatcher + affine fit for
+yaw, dense Farneback for lateral shift), so every sampled frame paid for
+three motion estimates. EgoMotionEstimator does one feature-tracking pass
+instead:
+
+- Shi-Tomasi corners on the road band of the previous sample
+- pyramidal LK to the current sample
+- a RANSAC partial-affine fit to reject outliers (other vehicles)
+- yaw from the sideways shift of the inliers through a pinhole camera
+  with EGO_FOV_DEG horizontal field of view (camera yaw moves the whole
+  image sideways; it barely rotates it in-plane)
+
+Each sample becomes an EgoMotion: forward translation, yaw rate, lateral
+shift and a confidence, plus the tracked points so each analyzer can take
+its own statistic over the region it cares about.
+
+Analyzers built with the same estimator sample the same frames, and the
+first one fed a frame computes its motion; the others reuse it. Enabled
+with "ego_motion": {"enabled": true} in config/analysis_config.json.
+"""
+
+from math import atan, degrees, radians, tan
+import cv2
+import numpy as np
+from typing import Optional
+
+EGO_WIDTH = 480          # analysis width of the tracking pass
+EGO_HZ = 10.0            # motion samples per second
+EGO_ROI_Y0 = 0.35        # road band tracked: top...
+EGO_ROI_Y1 = 0.95        # ...and bottom, as fractions of the frame height
+EGO_FEATURES = dict(maxCorners=400, qualityLevel=0.01, minDistance=8, blockSize=7)
+EGO_LK_PARAMS = dict(winSize=(21, 21), maxLevel=3,
+                     criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+EGO_RANSAC_THRESH = 3.0
+EGO_FOV_DEG = 90.0       # typical dashcam, as in enhanced_proximity_detection
+EGO_MIN_POINTS = 6
+
+
+class EgoMotion:
+    """
+    Camera motion between two samples. Rates are per second and in native
+    video pixels, so they do not depend on the sampling or analysis width.
+
+    pts       (N, 2) tracked points in the earlier sample, as fractions of (width, height)
+    flow      (N, 2) their motion, native px/s
+    inliers   (N,) bool, points consistent with the affine fit
+    """
+
+    __slots__ = ("t", "dt", "pts", "flow", "inliers", "yaw_dps", "forward_pps", "lateral_pps", "confidence")
+
+    def __init__(self, t, dt, pts, flow, inliers, yaw_dps, forward_pps, lateral_pps, confidence):
+        self.t = t
+        self.dt = dt
+        self.pts = pts
+        self.flow = flow
+        self.inliers = inliers
+        self.yaw_dps = yaw_dps            # positive = turning right; None without a fit
+        self.forward_pps = forward_pps    # median downward flow of the inliers
+        self.lateral_pps = lateral_pps    # median sideways flow of the inliers
+        self.confidence = confidence      # 0-1: inlier ratio times point support
+
+    @property
+    def yaw_deg(self) -> Optional[float]:
+        """Rotation between the two samples, in degrees"""
+        return None if self.yaw_dps is None else self.yaw_dps * self.dt
+
+    def band(self, y0: float, y1: float, inliers_only: bool = False) -> np.ndarray:
+        """Mask of the points between rows y0 and y1 (fractions of the height)"""
+        y = self.pts[:, 1]
+        mask = (y >= y0) & (y < y1)
+        return mask & self.inliers if inliers_only else mask
+
+
+class EgoMotionEstimator:
+    """Per-video motion estimator; share one instance between analyzers"""
+
+    def __init__(self, hz: float = EGO_HZ, width: int = EGO_WIDTH):
+        self.hz = hz
+        self.width = width
+        self.meta = None
+        self.fps = None
+        self.native_width = None
+        self.step = 1
+        self._prev = None          # (idx, gray) of the last sample
+        self._last = (None, None)  # (idx, EgoMotion) memo for the other consumers
+
+    def init(self, meta):
+        """Called by every consumer's init(); returns the sampling step to use"""
+        if meta is not self.meta:  # a new run (all consumers get the same meta)
+            self.meta = meta
+            self.fps = meta.fps
+            self.native_width = meta.width
+            self.step = max(1, int(round(meta.fps / self.hz)))
+            self._prev = None
+            self._last = (None, None)
+        return self.step
+
+    def motion(self, idx: int, frame) -> Optional[EgoMotion]:
+        """EgoMotion from the previous sample to frame `idx` (None for the first sample)"""
+        last_idx, last = self._last
+        if idx == last_idx:
+            return last
+        gray = frame.gray(self.width)
+        prev = self._prev
+        self._prev = (idx, gray)
+        result = None
+        if prev is not None and idx > prev[0]:
+            result = self._estimate(prev[1], gray, idx, (idx - prev[0]) / self.fps)
+        self._last = (idx, result)
+        return result
+
+    def _estimate(self, prev_gray, gray, idx, dt) -> Optional[EgoMotion]:
+        h, w = prev_gray.shape
+        mask = np.zeros_like(prev_gray)
+        mask[int(h * EGO_ROI_Y0):int(h * EGO_ROI_Y1), :] = 255
+        p0 = cv2.goodFeaturesToTrack(prev_gray, mask=mask, **EGO_FEATURES)
+        if p0 is None or len(p0) < EGO_MIN_POINTS:
+            return None
+        p1, st, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, p0, None, **EGO_LK_PARAMS)
+        if p1 is None or st is None:
+            return None
+        ok = st.ravel() == 1
+        p0, p1 = p0[ok].reshape(-1, 2), p1[ok].reshape(-1, 2)
+        if len(p0) < EGO_MIN_POINTS:
+            return None
+
+        M, inl = cv2.estimateAffinePartial2D(p0, p1, method=cv2.RANSAC,
+                                             ransacReprojThreshold=EGO_RANSAC_THRESH,
+                                             maxIters=1000, confidence=0.99)
+        fitted = M is not None and inl is not None and inl.any()
+        inliers = inl.ravel().astype(bool) if fitted else np.ones(len(p0), bool)
+
+        to_native = self.native_width / float(w)
+        flow = (p1 - p0) * (to_native / dt)
+        pts = p0 / np.array([w, h], np.float32)
+        forward, lateral = np.median(flow[inliers, 1]), np.median(flow[inliers, 0])
+        yaw_dps = None
+        if fitted:
+            # The scene shifts left when the camera turns right
+            focal = (self.native_width / 2.0) / tan(radians(EGO_FOV_DEG / 2.0))
+            yaw_dps = -degrees(atan(lateral * dt / focal)) / dt
+        confidence = float(inliers.mean()) * min(inliers.sum() / 50.0, 1.0)
+        return EgoMotion(idx / self.fps, dt, pts, flow, inliers, yaw_dps,
+                         float(forward), float(lateral), confidence)
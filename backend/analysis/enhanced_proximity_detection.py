@@ -4,16 +4,20 @@ Enhanced Proximity Detection with Distance and Motion Analysis
 Integrated version for DriveGuard AI
 """
 
-import cv2
+import os
 import numpy as np
 from typing import Dict, List, Tuple, Optional
 from collections import defaultdict
 
-try:
-    from ultralytics import YOLO
-    HAS_YOLO = True
-except ImportError:
-    HAS_YOLO = False
+from frame_pipeline import FrameAnalyzer, FramePyramid, VideoMeta, run_frame_pipeline, TRACK_WARMUP_SEC
+
+from yolo_models import HAS_YOLO, YOLO_IMGSZ, YOLO_PRECISION, get_device, get_yolo, predict_args
+from detection_store import DetectionCache, DetectionRecorder, FrameDetections, class_names
+from batched_detection import BatchedDetector, InferenceRoi, IoUTracker
+from lean_detection import LeanDetector
+
+# Width of the frames passed to the detector (shared pyramid level with main_v2)
+INFERENCE_WIDTH = 896
 
 
 def detect_close_encounters_enhanced(video_path: str, model_path: str = 'models/yolov8n.pt') -> Dict:
@@ -38,7 +42,12 @@ def detect_close_encounters_enhanced(video_path: str, model_path: str = 'models/
     return detector.detect_encounters()
 
 
-class EnhancedProximityDetector:
+def load_proximity_model(model_path: str, imgsz: int = YOLO_IMGSZ):
+    """The (per-process cached) YOLO model used by EnhancedProximityDetector"""
+    return get_yolo(model_path, get_device(), imgsz=imgsz)
+
+
+class EnhancedProximityDetector(FrameAnalyzer):
     """
     Improved close encounter detection with:
     - Distance estimation from box size + position
@@ -53,24 +62,139 @@ class EnhancedProximityDetector:
     TTC_THRESHOLD_SEC = 4.0        # Time-to-collision < 4 seconds
     MIN_TRACK_FRAMES = 5           # Need 5 frames to validate
     MIN_BOX_HEIGHT_RATIO = 0.20    # Box must be at least 20% of frame height
+    VEHICLES = ('car', 'truck', 'bus', 'motorcycle')
+    # ROI inference: boxes this short are dropped anyway; near vehicles sit
+    # below the top fifth of the frame. Full width for the lateral checks
+    ROI = (0.0, 0.2, 1.0, 1.0)
+
+    # Real-world vehicle heights (meters)
+    REAL_HEIGHTS_M = {
+        'car': 1.5,
+        'truck': 3.0,
+        'bus': 3.5,
+        'motorcycle': 1.2,
+        'bicycle': 1.5
+    }
+
+    # Detector settings (part of the detection store key)
+    DETECT_CONF = 0.3
+    DETECT_IOU = 0.5
+
+    name = "close_encounters"
+    # Skip frames for performance: every 2nd frame, counting from 1
+    step, phase = 2, 1
+    # YOLO letterboxes to 640 px internally, so wider frames add no detail
+    max_width = INFERENCE_WIDTH
+    splittable = True
     
-    def __init__(self, video_path: str, model_path: str):
+    def __init__(self, video_path: str, model_path: str, detections: Optional[DetectionCache] = None,
+                 batch_size: int = 1, max_latency_ms: Optional[float] = None,
+                 engine: str = "ultralytics", roi_min_object_px: Optional[int] = None):
+        super().__init__()
         self.video_path = video_path
         self.model_path = model_path
+        # Recorded detections are replayed instead of running the model
+        self.detections = detections
+        # batch_size > 1, the lean engine or ROI inference: batched inference
+        # + IoUTracker instead of per-frame track()
+        self.batch_size = batch_size
+        self.max_latency_ms = max_latency_ms
+        self.engine = engine
+        self.roi_min_object_px = roi_min_object_px
+        self.batched = batch_size > 1 or engine == "lean" or roi_min_object_px is not None
+
+    def cache_params(self):
+        return {"model": os.path.basename(self.model_path), "batch_size": self.batch_size, "engine": self.engine,
+                "roi": self.roi_min_object_px}
         
-        self.cap = cv2.VideoCapture(video_path)
-        if not self.cap.isOpened():
-            raise RuntimeError(f"Cannot open video: {video_path}")
-        
-        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
-        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    def init(self, meta: VideoMeta):
+        super().init(meta)
+        self.fps = meta.fps
         
         # Calibration (adjust for your dashcam)
         self.camera_height_m = 1.5      # Dashcam mounted 1.5m above ground
         self.camera_fov_deg = 90        # Typical dashcam FOV
-        self.focal_length = self.width / (2 * np.tan(np.radians(self.camera_fov_deg / 2)))
+        # Never upsample narrower videos
+        self.max_width = min(INFERENCE_WIDTH, meta.width)
+        self._set_geometry(meta.width, meta.height)
+
+        # Track vehicles across frames
+        self.vehicle_tracks = defaultdict(lambda: {
+            'history': [],
+            'first_frame': 0,
+            'last_frame': 0,
+            'min_distance': float('inf'),
+            'max_danger_score': 0.0,
+            'is_dangerous': False
+        })
+        # Keys of the tracks absorbed from the previous segment
+        self._segment_keys = []
+        self._segments = 0
+        self.class_names = None
+        self._recorder = None
+        self.batch = None
+        self.roi = (InferenceRoi(self.ROI, self.MIN_BOX_HEIGHT_RATIO, self.roi_min_object_px, meta.width / meta.height)
+                    if self.roi_min_object_px is not None else None)
+        self._replay = self.detections.load(self._detector_settings()) if self.detections else None
+        if self._replay is not None:
+            # Scored in finalize() straight from the store; no frames needed
+            self.done = True
+            return
+
+        if not HAS_YOLO:
+            self.done = True
+            return
+
+        # In a segment, let the tracker see a couple of seconds first
+        self.lead_in = max(1, int(round(TRACK_WARMUP_SEC * self.fps / self.step)))
+        self.model = None
+
+    def _load_model(self):
+        print(f"Enhanced proximity detection for: {self.video_path}")
         
+        imgsz = self.roi.imgsz if self.roi is not None else YOLO_IMGSZ
+        if self.engine == "lean":
+            self.model = LeanDetector(self.model_path, self.DETECT_CONF, self.DETECT_IOU, self.batch_size, imgsz,
+                                      device=get_device())
+        else:
+            self.model = load_proximity_model(self.model_path, imgsz)
+        self._set_class_names(class_names(self.model.names))
+        if self.batched:
+            self.batch = BatchedDetector(self.model, self.batch_size, self.DETECT_CONF, self.DETECT_IOU,
+                                         self.max_latency_ms, self.roi)
+
+    def _detector_settings(self) -> Dict:
+        return {
+            "detector": type(self).__name__,
+            "model": os.path.basename(self.model_path),
+            "conf": self.DETECT_CONF,
+            "iou": self.DETECT_IOU,
+            "width": self.max_width,
+            "imgsz": YOLO_IMGSZ,
+            "precision": YOLO_PRECISION,
+            "step": self.step,
+            "phase": self.phase,
+            **({"tracker": IoUTracker().settings()} if self.batched else {}),
+            **({"engine": self.engine} if self.engine != "ultralytics" else {}),
+            **(self.roi.settings() if self.roi is not None else {}),
+        }
+
+    def _set_class_names(self, names: Dict[int, str]):
+        """Class names plus per-class-id lookup tables for _score_detections"""
+        self.class_names = names
+        size = max(names, default=-1) + 1
+        self._is_vehicle = np.zeros(size, bool)
+        self._real_height = np.full(size, 1.5)
+        for cls_id, name in names.items():
+            self._is_vehicle[cls_id] = name in self.VEHICLES
+            self._real_height[cls_id] = self.REAL_HEIGHTS_M.get(name, 1.5)
+
+    def _set_geometry(self, width: int, height: int):
+        """Pixel geometry of the frames handed to the model"""
+        self.width = width
+        self.height = height
+        self.focal_length = self.width / (2 * np.tan(np.radians(self.camera_fov_deg / 2)))
+
     def estimate_distance(self, box: Tuple[int, int, int, int], vehicle_class: str) -> float:
         """
         Estimate distance to vehicle using pinhole camera model
@@ -88,16 +212,7 @@ class EnhancedProximityDetector:
         if box_height_px <= 0:
             return 100.0
         
-        # Real-world vehicle heights (meters)
-        real_heights = {
-            'car': 1.5,
-            'truck': 3.0,
-            'bus': 3.5,
-            'motorcycle': 1.2,
-            'bicycle': 1.5
-        }
-        
-        real_height = real_heights.get(vehicle_class, 1.5)
+        real_height = self.REAL_HEIGHTS_M.get(vehicle_class, 1.5)
         
         # Distance = (real_height * focal_length) / box_height_px
         distance = (real_height * self.focal_length) / box_height_px
@@ -114,6 +229,13 @@ class EnhancedProximityDetector:
         distance = np.clip(distance, 1.0, 100.0)
         
         return distance
+
+    def estimate_distances(self, boxes: np.ndarray, real_heights: np.ndarray) -> np.ndarray:
+        """estimate_distance() for (N, 4) integer boxes with positive heights"""
+        distance = (real_heights * self.focal_length) / (boxes[:, 3] - boxes[:, 1])
+        y_center = (boxes[:, 1] + boxes[:, 3]) / 2
+        distance[y_center < self.height * 0.45] *= 1.5
+        return np.clip(distance, 1.0, 100.0)
     
     def calculate_ttc(self, track_history: List[Dict]) -> float:
         """
@@ -168,129 +290,216 @@ class EnhancedProximityDetector:
         # If moving more than 30% of frame width, it's lateral
         return x_movement > (self.width * 0.3)
     
-    def detect_encounters(self) -> Dict:
-        """
-        Main detection loop with enhanced logic
-        """
-        print(f"Enhanced proximity detection for: {self.video_path}")
-        
-        model = YOLO(self.model_path)
-        model.to('mps' if cv2.ocl.haveOpenCL() else 'cpu')
-        
-        # Track vehicles across frames
-        vehicle_tracks = defaultdict(lambda: {
-            'history': [],
-            'first_frame': 0,
-            'last_frame': 0,
-            'min_distance': float('inf'),
-            'max_danger_score': 0.0,
-            'is_dangerous': False
-        })
-        
-        frame_idx = 0
-        
-        while True:
-            ret, frame = self.cap.read()
-            if not ret:
-                break
+    def on_frame(self, idx: int, frame: FramePyramid):
+        if self.model is None:
+            self._load_model()
+            # Only a whole-video run is recorded; segments see a warmed-up
+            # tracker whose IDs differ from the serial run
+            if self.detections and self.segment_start == 0 and self.window[1] is None:
+                self._recorder = DetectionRecorder(self.fps)
+        
+        image = frame.bgr(self.max_width)
+        if image.shape[1] != self.width or image.shape[0] != self.height:
+            self._set_geometry(image.shape[1], image.shape[0])
+        
+        if self.batch is not None:
+            # Scored once its batch has run
+            for done_idx, dets, _ in self.batch.submit(idx, image):
+                self._on_detections(done_idx, dets)
+            return
+
+        # Run detection with tracking
+        results = self.model.track(image, persist=True, conf=self.DETECT_CONF, iou=self.DETECT_IOU, verbose=False,
+                                   **predict_args())
+        self._on_detections(idx, FrameDetections.from_boxes(results[0].boxes))
+
+    def _on_detections(self, idx: int, dets: FrameDetections):
+        if self._recorder is not None:
+            self._recorder.add(idx, dets)
+        self._score_detections(idx, dets)
+
+    def _flush_batch(self):
+        if self.batch is not None:
+            for idx, dets, _ in self.batch.flush():
+                self._on_detections(idx, dets)
+
+    def _score_detections(self, idx: int, dets: FrameDetections):
+        """Distance / TTC / danger logic for one frame's tracked detections"""
+        vehicle_tracks = self.vehicle_tracks
+        frame_idx = idx + 1
+        time_sec = frame_idx / self.fps
+        # Before the segment start only the tracker and track histories are
+        # warmed up; the previous segment scores these frames
+        warm_up = idx < self.segment_start
+        if len(dets) == 0:
+            return
+
+        # Filter the whole frame at once: tracked vehicles whose box is not
+        # too small (far away or detection errors)
+        cls_ids = dets.cls.astype(np.int64)
+        boxes = dets.xyxy.astype(np.int64)  # truncates like int()
+        heights = boxes[:, 3] - boxes[:, 1]
+        known = cls_ids < len(self._is_vehicle)
+        keep = np.nonzero(known & self._is_vehicle[np.where(known, cls_ids, 0)]
+                          & (heights >= self.height * self.MIN_BOX_HEIGHT_RATIO)
+                          & (dets.track_id >= 0))[0]
+        if len(keep) == 0:
+            return
+        distances = self.estimate_distances(boxes[keep], self._real_height[cls_ids[keep]])
+
+        for k, distance in zip(keep.tolist(), distances):
+            cls_name = self.class_names[int(cls_ids[k])]
+            x1, y1, x2, y2 = boxes[k].tolist()
+            box_height = y2 - y1
+            track_id = int(dets.track_id[k])
             
-            frame_idx += 1
-            time_sec = frame_idx / self.fps
+            # Calculate center
+            center_x = (x1 + x2) / 2
+            center_y = (y1 + y2) / 2
             
-            # Skip frames for performance
-            if frame_idx % 2 != 0:
-                continue
+            # Check if vehicle is in center region (frontal)
+            is_frontal = (self.width * 0.3 < center_x < self.width * 0.7)
             
-            # Run detection with tracking
-            results = model.track(frame, persist=True, conf=0.3, iou=0.5, verbose=False)
+            # Update track history
+            track_data = {
+                'time': time_sec,
+                'distance': distance,
+                'box': (x1, y1, x2, y2),
+                'box_height': box_height,
+                'center_x': center_x,
+                'center_y': center_y,
+                'class': cls_name,
+                'is_frontal': is_frontal
+            }
             
-            if results[0].boxes is None or len(results[0].boxes) == 0:
+            vehicle_tracks[track_id]['history'].append(track_data)
+            if warm_up:
                 continue
+            vehicle_tracks[track_id]['last_frame'] = frame_idx
             
-            for box in results[0].boxes:
-                cls_id = int(box.cls[0])
-                cls_name = model.names[cls_id]
-                
-                # Only track vehicles
-                if cls_name not in ['car', 'truck', 'bus', 'motorcycle']:
-                    continue
-                
-                # Get bounding box
-                x1, y1, x2, y2 = map(int, box.xyxy[0].tolist())
-                box_height = y2 - y1
-                
-                # Filter out small boxes (far away or detection errors)
-                if box_height < self.height * self.MIN_BOX_HEIGHT_RATIO:
-                    continue
-                
-                # Get track ID
-                if box.id is None:
-                    continue
-                track_id = int(box.id[0])
-                
-                # Calculate distance
-                distance = self.estimate_distance((x1, y1, x2, y2), cls_name)
-                
-                # Calculate center
-                center_x = (x1 + x2) / 2
-                center_y = (y1 + y2) / 2
-                
-                # Check if vehicle is in center region (frontal)
-                is_frontal = (self.width * 0.3 < center_x < self.width * 0.7)
-                
-                # Update track history
-                track_data = {
-                    'time': time_sec,
-                    'distance': distance,
-                    'box': (x1, y1, x2, y2),
-                    'box_height': box_height,
-                    'center_x': center_x,
-                    'center_y': center_y,
-                    'class': cls_name,
-                    'is_frontal': is_frontal
-                }
-                
-                vehicle_tracks[track_id]['history'].append(track_data)
-                vehicle_tracks[track_id]['last_frame'] = frame_idx
+            if vehicle_tracks[track_id]['first_frame'] == 0:
+                vehicle_tracks[track_id]['first_frame'] = frame_idx
+            
+            # Update minimum distance
+            if distance < vehicle_tracks[track_id]['min_distance']:
+                vehicle_tracks[track_id]['min_distance'] = distance
+            
+            # Evaluate danger if we have enough frames
+            if len(vehicle_tracks[track_id]['history']) >= self.MIN_TRACK_FRAMES:
+                ttc = self.calculate_ttc(vehicle_tracks[track_id]['history'])
+                is_lateral = self.is_lateral_movement(vehicle_tracks[track_id]['history'])
                 
-                if vehicle_tracks[track_id]['first_frame'] == 0:
-                    vehicle_tracks[track_id]['first_frame'] = frame_idx
+                # Danger criteria:
+                # 1. Close distance
+                # 2. Frontal position (not just passing by)
+                # 3. Approaching (TTC < threshold)
+                # 4. Not lateral movement
                 
-                # Update minimum distance
-                if distance < vehicle_tracks[track_id]['min_distance']:
-                    vehicle_tracks[track_id]['min_distance'] = distance
+                is_close = distance < self.DANGEROUS_DISTANCE_M
+                is_critical = distance < self.CRITICAL_DISTANCE_M
+                is_approaching = ttc < self.TTC_THRESHOLD_SEC
                 
-                # Evaluate danger if we have enough frames
-                if len(vehicle_tracks[track_id]['history']) >= self.MIN_TRACK_FRAMES:
-                    ttc = self.calculate_ttc(vehicle_tracks[track_id]['history'])
-                    is_lateral = self.is_lateral_movement(vehicle_tracks[track_id]['history'])
+                if (is_close and is_frontal and (is_approaching or is_critical) and not is_lateral):
+                    # Calculate danger score
+                    distance_factor = 1.0 / max(distance, 0.5)
+                    ttc_factor = 1.0 / max(ttc, 0.5) if ttc != float('inf') else 0.5
+                    box_factor = box_height / self.height
                     
-                    # Danger criteria:
-                    # 1. Close distance
-                    # 2. Frontal position (not just passing by)
-                    # 3. Approaching (TTC < threshold)
-                    # 4. Not lateral movement
+                    danger_score = distance_factor * 0.5 + ttc_factor * 0.3 + box_factor * 0.2
                     
-                    is_close = distance < self.DANGEROUS_DISTANCE_M
-                    is_critical = distance < self.CRITICAL_DISTANCE_M
-                    is_approaching = ttc < self.TTC_THRESHOLD_SEC
-                    
-                    if (is_close and is_frontal and (is_approaching or is_critical) and not is_lateral):
-                        # Calculate danger score
-                        distance_factor = 1.0 / max(distance, 0.5)
-                        ttc_factor = 1.0 / max(ttc, 0.5) if ttc != float('inf') else 0.5
-                        box_factor = box_height / self.height
-                        
-                        danger_score = distance_factor * 0.5 + ttc_factor * 0.3 + box_factor * 0.2
-                        
-                        if danger_score > vehicle_tracks[track_id]['max_danger_score']:
-                            vehicle_tracks[track_id]['max_danger_score'] = danger_score
-                            vehicle_tracks[track_id]['is_dangerous'] = True
-                            vehicle_tracks[track_id]['peak_time'] = time_sec
-                            vehicle_tracks[track_id]['peak_distance'] = distance
-                            vehicle_tracks[track_id]['ttc'] = ttc if ttc != float('inf') else 0
-        
-        self.cap.release()
+                    if danger_score > vehicle_tracks[track_id]['max_danger_score']:
+                        vehicle_tracks[track_id]['max_danger_score'] = danger_score
+                        vehicle_tracks[track_id]['is_dangerous'] = True
+                        vehicle_tracks[track_id]['peak_time'] = time_sec
+                        vehicle_tracks[track_id]['peak_distance'] = distance
+                        vehicle_tracks[track_id]['ttc'] = ttc if ttc != float('inf') else 0
+    
+    def export_segment(self) -> Dict:
+        """
+        Tracks scored in this segment, with warm-up entries split off. The
+        last warm-up box of a track lets the next stitch step link it to the
+        same vehicle in the previous segment.
+        """
+        self._flush_batch()
+        start_time = (self.segment_start + 1) / self.fps
+        tracks = []
+        for track_id, track_data in self.vehicle_tracks.items():
+            history = track_data['history']
+            live = [h for h in history if h['time'] >= start_time]
+            if not live:
+                continue
+            warm = history[:len(history) - len(live)]
+            track = dict(track_data, history=live)
+            track['link'] = (warm[-1]['time'], warm[-1]['box']) if warm else None
+            tracks.append(track)
+        return {'geometry': (self.width, self.height), 'tracks': tracks}
+
+    def absorb_segment(self, part: Dict):
+        self._set_geometry(*part['geometry'])
+        keys = []
+        for track in part['tracks']:
+            link = track.pop('link')
+            key = self._linked_track(link) if link else None
+            if key is None:
+                key = (self._segments, len(keys))
+                self.vehicle_tracks[key] = track
+            else:
+                self._merge_track(self.vehicle_tracks[key], track)
+            keys.append(key)
+        self._segment_keys = keys
+        self._segments += 1
+
+    def _linked_track(self, link):
+        """Track of the previous segment holding the same box at that time"""
+        time_sec, box = link
+        for key in self._segment_keys:
+            for h in reversed(self.vehicle_tracks[key]['history']):
+                if h['time'] < time_sec:
+                    break
+                if h['time'] == time_sec and _box_iou(h['box'], box) >= 0.5:
+                    return key
+        return None
+
+    @staticmethod
+    def _merge_track(track: Dict, more: Dict):
+        track['history'].extend(more['history'])
+        track['last_frame'] = more['last_frame']
+        track['min_distance'] = min(track['min_distance'], more['min_distance'])
+        if more['max_danger_score'] > track['max_danger_score']:
+            for k in ('max_danger_score', 'is_dangerous', 'peak_time', 'peak_distance', 'ttc'):
+                if k in more:
+                    track[k] = more[k]
+
+    def detect_encounters(self) -> Dict:
+        """
+        Main detection loop with enhanced logic
+        """
+        return run_frame_pipeline(self.video_path, [self])[self.name]
+
+    def _replay_store(self):
+        store, self._replay = self._replay, None
+        self._set_geometry(*store.frame_size)
+        self._set_class_names(store.names)
+        for idx, dets in store.iter_frames():
+            self._score_detections(idx, dets)
+        print(f"  Replayed {len(store)} frames of stored detections")
+
+    def finalize(self) -> Dict:
+        self._flush_batch()
+        if self._replay is not None:
+            self._replay_store()
+        elif self._recorder is not None:
+            self.detections.save(self._detector_settings(), self._recorder,
+                                 (self.width, self.height), self.class_names)
+            self._recorder = None
+        elif not HAS_YOLO:
+            return {
+                'close_encounters': [],
+                'event_count': 0,
+                'error': 'YOLO not available'
+            }
+
+        vehicle_tracks = self.vehicle_tracks
         
         # Convert dangerous tracks to close encounters
         close_encounters = []
@@ -338,3 +547,21 @@ class EnhancedProximityDetector:
             'event_count': len(close_encounters),
             'method': 'enhanced_proximity_v2'
         }
+
+    def timeseries(self) -> Dict:
+        """Distance to the nearest frontal vehicle at each time one was tracked"""
+        nearest = {}
+        for track_data in self.vehicle_tracks.values():
+            for h in track_data['history']:
+                if h['is_frontal'] and h['distance'] < nearest.get(h['time'], float('inf')):
+                    nearest[h['time']] = h['distance']
+        times = sorted(nearest)
+        return {'t': times, 'nearest_m': [nearest[t] for t in times]}
+
+
+def _box_iou(a: Tuple[int, int, int, int], b: Tuple[int, int, int, int]) -> float:
+    ix = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
@@ -8,6 +8,9 @@ This module consolidates all speed detection functionality:
 - Dynamic scale estimation for realistic speeds
 - Built-in calibration tool for testing and tuning
 - Speed analysis and validation
+- Streaming summary: samples feed bounded-memory statistics
+  (streaming_stats.QuantileDigest) as they are measured, so hour-long
+  videos do not accumulate per-sample lists
 
 Previously separate files merged into this module:
 - improved_speed_detection.py (alternative methods)
@@ -17,9 +20,20 @@ Previously separate files merged into this module:
 
 import cv2
 import numpy as np
-from typing import Dict, List, Tuple, Optional
+from array import array
+from typing import Dict, Sequence, Tuple, Optional
 from pathlib import Path
 
+from frame_pipeline import FrameAnalyzer, FramePyramid, VideoMeta, run_frame_pipeline
+from ego_motion import EgoMotion, EgoMotionEstimator
+from streaming_stats import QuantileDigest
+from speed_profile import SecondBins
+
+# Tracking width: the width the scale factors were calibrated at (the
+# estimate drifts at lower widths). Displacements and positions of wider
+# videos are converted back to native pixels.
+ANALYSIS_WIDTH = 1280
+
 def estimate_speed_multimethod(video_path: str) -> Dict[str, float]:
     """
     Enhanced speed detection using multiple methods
@@ -35,150 +49,205 @@ def estimate_speed_multimethod(video_path: str) -> Dict[str, float]:
     return detector.detect_speed()
 
 
-class EnhancedSpeedDetector:
+class EnhancedSpeedDetector(FrameAnalyzer):
     """Multi-method speed detection with confidence scoring"""
-    
-    def __init__(self, video_path: str):
+
+    name = "enhanced_speed"
+    step = 3  # First frame seeds the tracker, then every 3rd frame is processed
+    max_width = ANALYSIS_WIDTH
+    # Not splittable: the tracked feature set evolves over the whole video,
+    # so re-seeding it per segment changes the estimate
+
+    # Feature detection parameters - more features for highway
+    FEATURE_PARAMS = dict(
+        maxCorners=300,  # Increased for highway detection
+        qualityLevel=0.01,
+        minDistance=15,  # Reduced to find more features
+        blockSize=7
+    )
+
+    # Optical flow parameters
+    LK_PARAMS = dict(
+        winSize=(21, 21),  # Larger window for better tracking
+        maxLevel=3,  # More pyramid levels
+        criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03)
+    )
+
+    def __init__(self, video_path: str, ego: Optional[EgoMotionEstimator] = None):
+        super().__init__()
         self.video_path = video_path
-        self.cap = cv2.VideoCapture(video_path)
-        
-        if not self.cap.isOpened():
-            raise RuntimeError(f"Cannot open video: {video_path}")
-        
-        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
-        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        
-    def method_ego_motion(self) -> Tuple[float, float]:
-        """
-        Estimate speed using feature tracking on road surface
-        Best accuracy for typical dashcam footage
-        """
-        # Feature detection parameters - more features for highway
-        feature_params = dict(
-            maxCorners=300,  # Increased for highway detection
-            qualityLevel=0.01,
-            minDistance=15,  # Reduced to find more features
-            blockSize=7
-        )
-        
-        # Optical flow parameters
-        lk_params = dict(
-            winSize=(21, 21),  # Larger window for better tracking
-            maxLevel=3,  # More pyramid levels
-            criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03)
-        )
-        
-        speeds = []
-        confidences = []
-        
-        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-        ret, old_frame = self.cap.read()
-        
-        if not ret:
-            return 0.0, 0.0
-        
-        old_gray = cv2.cvtColor(old_frame, cv2.COLOR_BGR2GRAY)
-        
+        # With a shared estimator, road motion comes from its tracked points
+        self.ego = ego
+
+    def cache_params(self) -> Dict[str, bool]:
+        return {"ego_motion": self.ego is not None}
+
+    def init(self, meta: VideoMeta):
+        super().init(meta)
+        print(f"Analyzing speed for: {self.video_path}")
+        self.fps = meta.fps
+        self.width = meta.width
+        self.height = meta.height
+
+        self.valid_frames = 0
+        # Summary statistics of the reasonable (3-150 km/h) speeds, updated per sample
+        self.reasonable = QuantileDigest()
+        self.confidence_sum = 0.0
+        self.weighted_speed_sum = 0.0
+        # Range of the samples behind the estimate (3 km/h up to the IQR fences)
+        self.speed_bounds = None
+        # Per-second bins for the speed profile; the per-sample signals only
+        # when a timeseries is collected (compact float32 buffers)
+        self.bins = SecondBins()
+        self.times = self.speeds = self.confidences = None
+        if self.keep_samples:
+            self.times = array('f')
+            self.speeds = array('f')
+            self.confidences = array('f')
+        self.old_gray = None
+        self.p0 = None
+        if self.ego is not None:
+            self.step = self.ego.init(meta)
+            self.max_width = self.ego.width
+
+    def on_frame(self, idx: int, frame: FramePyramid):
+        if self.ego is not None:
+            self._on_motion(idx, self.ego.motion(idx, frame))
+            return
+        if self.old_gray is None:
+            self._seed(frame)
+            return
+
+        feature_params = self.FEATURE_PARAMS
+        roi_mask = self.roi_mask
+        old_gray, p0 = self.old_gray, self.p0
+
+        frame_gray = frame.gray(self.max_width)
+
+        # Calculate optical flow
+        p1, st, err = cv2.calcOpticalFlowPyrLK(old_gray, frame_gray, p0, None, **self.LK_PARAMS)
+
+        if p1 is None or st is None:
+            self.done = True
+            return
+
+        # Select good points
+        good_new = p1[st == 1]
+        good_old = p0[st == 1]
+
+        if len(good_new) < 10:  # Need at least 10 tracked points
+            # Re-detect features
+            self.p0 = cv2.goodFeaturesToTrack(frame_gray, mask=roi_mask, **feature_params)
+            if self.p0 is None:
+                self.done = True
+                return
+            self.old_gray = frame_gray.copy()
+            return
+
+        # Update for next iteration
+        self.old_gray = frame_gray.copy()
+        self.p0 = good_new.reshape(-1, 1, 2)
+
+        # Calculate motion vectors
+        motion = good_new - good_old
+
+        # Filter outliers using median and std
+        median_y = np.median(motion[:, 1])
+        std_y = np.std(motion[:, 1])
+
+        # Keep only inliers (within 2 std devs)
+        inliers = motion[np.abs(motion[:, 1] - median_y) < 2 * std_y]
+
+        if len(inliers) < 5:
+            return
+
+        # Calculate speed with improved scale estimation
+        avg_displacement_y = np.median(inliers[:, 1]) * self.native_px
+        avg_y_position = good_new[:, 1].mean() * self.native_px
+        self._measure(idx, avg_displacement_y, avg_y_position, len(inliers))
+
+    def _on_motion(self, idx: int, motion: Optional[EgoMotion]):
+        if motion is None:
+            return
+        road = motion.band(0.4, 0.95, inliers_only=True)
+        if road.sum() < 5:
+            return
+        # Same units as the LK path: native pixels moved over 3 frames
+        avg_displacement_y = np.median(motion.flow[road, 1]) * 3 / self.fps
+        avg_y_position = np.mean(motion.pts[road, 1]) * self.height
+        self._measure(idx, avg_displacement_y, avg_y_position, int(road.sum()))
+
+    def _measure(self, idx: int, avg_displacement_y: float, avg_y_position: float, n_inliers: int):
+        """Speed and confidence of one sample from its road displacement over 3 frames"""
+        # Skip if displacement is too small (stationary)
+        if abs(avg_displacement_y) < 0.5:
+            return
+
+        # Dynamic scale estimation based on feature positions
+        # Features lower in frame = closer = larger scale
+        scale_factor = self.estimate_scale_dynamic(avg_y_position)
+
+        # Convert to speed
+        pixels_per_second = abs(avg_displacement_y) * self.fps / 3
+        meters_per_second = pixels_per_second * scale_factor
+        kmh = meters_per_second * 3.6
+
+        # Confidence based on:
+        # 1. Number of inliers (more is better)
+        # 2. Displacement magnitude (larger is more confident)
+        # 3. Consistency with previous speeds
+        inlier_conf = min(n_inliers / 50.0, 1.0)
+        displacement_conf = min(abs(avg_displacement_y) / 10.0, 1.0)
+        confidence = (inlier_conf * 0.6 + displacement_conf * 0.4)
+
+        # Sanity check: typical speeds 0-150 km/h (allow up to 150 for highways)
+        if 0 <= kmh <= 150:
+            self.bins.add(idx / self.fps, kmh, confidence)
+            if self.times is not None:
+                self.speeds.append(kmh)
+                self.confidences.append(confidence)
+                self.times.append(idx / self.fps)
+            self.valid_frames += 1
+            # Remove extreme outliers (speeds < 3) from the summary
+            # Allowing lower minimum (3 km/h) for parking/slow scenarios
+            if kmh >= 3:
+                kmh, confidence = float(kmh), float(confidence)
+                self.reasonable.add(kmh)
+                self.confidence_sum += confidence
+                self.weighted_speed_sum += confidence * kmh
+
+    def _seed(self, old_frame: FramePyramid):
+        old_gray = old_frame.gray(self.max_width)
+        # Native pixels per tracking pixel
+        self.native_px = self.width / float(old_gray.shape[1])
+        height = old_gray.shape[0]
+
         # Enhanced ROI: Cover more area for highway scenarios
         # Lower region for road surface (60-95%)
         # Middle region for lane markers and road features (40-70%)
         roi_mask = np.zeros_like(old_gray)
-        roi_mask[int(self.height * 0.4):int(self.height * 0.95), :] = 255
-        
+        roi_mask[int(height * 0.4):int(height * 0.95), :] = 255
+
         # Detect features in ROI
-        p0 = cv2.goodFeaturesToTrack(old_gray, mask=roi_mask, **feature_params)
-        
-        if p0 is None:
-            return 0.0, 0.0
-        
-        frame_count = 0
-        valid_frames = 0
-        
-        while True:
-            ret, frame = self.cap.read()
-            if not ret:
-                break
-            
-            frame_count += 1
-            if frame_count % 3 != 0:  # Process every 3rd frame
-                continue
-            
-            frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            
-            # Calculate optical flow
-            p1, st, err = cv2.calcOpticalFlowPyrLK(old_gray, frame_gray, p0, None, **lk_params)
-            
-            if p1 is None or st is None:
-                break
-            
-            # Select good points
-            good_new = p1[st == 1]
-            good_old = p0[st == 1]
-            
-            if len(good_new) < 10:  # Need at least 10 tracked points
-                # Re-detect features
-                p0 = cv2.goodFeaturesToTrack(frame_gray, mask=roi_mask, **feature_params)
-                if p0 is None:
-                    break
-                old_gray = frame_gray.copy()
-                continue
-            
-            # Calculate motion vectors
-            motion = good_new - good_old
-            
-            # Filter outliers using median and std
-            median_y = np.median(motion[:, 1])
-            std_y = np.std(motion[:, 1])
-            
-            # Keep only inliers (within 2 std devs)
-            inliers = motion[np.abs(motion[:, 1] - median_y) < 2 * std_y]
-            
-            if len(inliers) < 5:
-                old_gray = frame_gray.copy()
-                p0 = good_new.reshape(-1, 1, 2)
-                continue
-            
-            # Calculate speed with improved scale estimation
-            avg_displacement_y = np.median(inliers[:, 1])
-            
-            # Skip if displacement is too small (stationary)
-            if abs(avg_displacement_y) < 0.5:
-                old_gray = frame_gray.copy()
-                p0 = good_new.reshape(-1, 1, 2)
-                continue
-            
-            # Dynamic scale estimation based on feature positions
-            # Features lower in frame = closer = larger scale
-            avg_y_position = np.mean([p[1] for p in good_new])
-            scale_factor = self.estimate_scale_dynamic(avg_y_position)
-            
-            # Convert to speed
-            pixels_per_second = abs(avg_displacement_y) * self.fps / 3
-            meters_per_second = pixels_per_second * scale_factor
-            kmh = meters_per_second * 3.6
-            
-            # Confidence based on:
-            # 1. Number of inliers (more is better)
-            # 2. Displacement magnitude (larger is more confident)
-            # 3. Consistency with previous speeds
-            inlier_conf = min(len(inliers) / 50.0, 1.0)
-            displacement_conf = min(abs(avg_displacement_y) / 10.0, 1.0)
-            confidence = (inlier_conf * 0.6 + displacement_conf * 0.4)
-            
-            # Sanity check: typical speeds 0-150 km/h (allow up to 150 for highways)
-            if 0 <= kmh <= 150:
-                speeds.append(kmh)
-                confidences.append(confidence)
-                valid_frames += 1
-            
-            # Update for next iteration
-            old_gray = frame_gray.copy()
-            p0 = good_new.reshape(-1, 1, 2)
-        
-        self.cap.release()
-        
-        if not speeds:
+        self.p0 = cv2.goodFeaturesToTrack(old_gray, mask=roi_mask, **self.FEATURE_PARAMS)
+        self.old_gray = old_gray
+        self.roi_mask = roi_mask
+        if self.p0 is None:
+            self.done = True
+
+    def method_ego_motion(self) -> Tuple[float, float]:
+        """
+        Estimate speed using feature tracking on road surface
+        Best accuracy for typical dashcam footage
+        """
+        run_frame_pipeline(self.video_path, [self])
+        return self.speed_estimate
+
+    def _summarize(self) -> Tuple[float, float]:
+        valid_frames = self.valid_frames
+        reasonable = self.reasonable
+
+        if not valid_frames:
             print("  ⚠️  No valid speed measurements detected")
             return 0.0, 0.0
         
@@ -186,38 +255,34 @@ class EnhancedSpeedDetector:
             print(f"  ⚠️  Too few valid frames ({valid_frames}), returning 0")
             return 0.0, 0.0
         
-        print(f"  📊 Analyzed {valid_frames} frames, got {len(speeds)} speed measurements")
-        
-        # Remove extreme outliers first (speeds > 150 or < 3)
-        # Allowing lower minimum (3 km/h) for parking/slow scenarios
-        # Allowing higher maximum (150 km/h) for highway scenarios
-        reasonable_speeds = [s for s in speeds if 3 <= s <= 150]
-        reasonable_confidences = [confidences[i] for i, s in enumerate(speeds) if 3 <= s <= 150]
+        print(f"  📊 Analyzed {valid_frames} frames, got {valid_frames} speed measurements")
         
-        if not reasonable_speeds:
+        n_reasonable = len(reasonable)
+        if not n_reasonable:
             print("  ⚠️  No reasonable speeds detected (all too high/low)")
             return 0.0, 0.0
         
         # Weighted average by confidence
-        if sum(reasonable_confidences) > 0:
-            weighted_speed = np.average(reasonable_speeds, weights=reasonable_confidences)
-            avg_confidence = np.mean(reasonable_confidences)
+        if self.confidence_sum > 0:
+            weighted_speed = self.weighted_speed_sum / self.confidence_sum
+            avg_confidence = self.confidence_sum / n_reasonable
         else:
-            weighted_speed = np.median(reasonable_speeds)
+            weighted_speed = reasonable.quantile(0.5)
             avg_confidence = 0.5
         
         # Additional outlier filtering using IQR method
-        q1 = np.percentile(reasonable_speeds, 25)
-        q3 = np.percentile(reasonable_speeds, 75)
+        q1 = reasonable.percentile(25)
+        q3 = reasonable.percentile(75)
         iqr = q3 - q1
         lower_bound = q1 - 1.5 * iqr
         upper_bound = q3 + 1.5 * iqr
         
-        filtered_speeds = [s for s in reasonable_speeds if lower_bound <= s <= upper_bound]
+        filtered_median, n_filtered = reasonable.trimmed_median(lower_bound, upper_bound)
+        self.speed_bounds = (max(lower_bound, 3.0), upper_bound)
         
-        if filtered_speeds and len(filtered_speeds) >= 3:
-            final_speed = np.median(filtered_speeds)
-            print(f"  ✅ Final speed: {final_speed:.1f} km/h (from {len(filtered_speeds)} measurements)")
+        if n_filtered >= 3:
+            final_speed = filtered_median
+            print(f"  ✅ Final speed: {final_speed:.1f} km/h (from {n_filtered} measurements)")
         else:
             final_speed = weighted_speed
             print(f"  ✅ Final speed: {final_speed:.1f} km/h (weighted average)")
@@ -271,18 +336,29 @@ class EnhancedSpeedDetector:
         """
         Main detection method
         """
-        print(f"Analyzing speed for: {self.video_path}")
-        
-        speed, confidence = self.method_ego_motion()
+        return run_frame_pipeline(self.video_path, [self])[self.name]
+
+    def finalize(self) -> Dict[str, float]:
+        self.speed_estimate = speed, confidence = self._summarize()
         
         print(f"  Speed: {speed:.1f} km/h (confidence: {confidence:.2f})")
         
-        return {
+        result = {
             'average_speed_kmh': round(speed, 2),
             'confidence': round(confidence, 2),
             'method': 'enhanced_ego_motion',
             'successful': confidence > 0.3
         }
+        if self.speed_bounds is not None:
+            # The per-second profile drops the samples the estimate ignored
+            result['speed_bounds_kmh'] = [round(float(b), 3) for b in self.speed_bounds]
+        result['per_second'] = self.bins.as_dict()
+        return result
+
+    def timeseries(self) -> Dict[str, Sequence[float]]:
+        if self.times is None:
+            return {}
+        return {"t": self.times, "speed_kmh": self.speeds, "confidence": self.confidences}
 
 
 # ============================================================================
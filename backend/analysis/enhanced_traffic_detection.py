@@ -11,7 +11,8 @@ Improves traffic light detection accuracy using multiple techniques:
 import cv2
 import numpy as np
 from typing import List, Tuple, Dict, Any
-import torch
+
+from yolo_models import HAS_YOLO, get_device
 
 class EnhancedTrafficDetector:
     """Enhanced traffic signal detection with multiple methods"""
@@ -50,7 +51,8 @@ class EnhancedTrafficDetector:
     def _init_yolo(self):
         """Initialize YOLO model for traffic light detection"""
         try:
-            from ultralytics import YOLO
+            if not HAS_YOLO:
+                raise ImportError("ultralytics not installed")
             # You can train a custom model or use pre-trained one
             # For now, we'll use the standard model and filter for traffic lights
             print("⚠️  YOLO traffic light detection not yet trained")
@@ -222,14 +224,7 @@ def test_enhanced_detection(video_path: str, output_path: str = None):
     import os
     
     # Detect device
-    if torch.cuda.is_available():
-        device = 'cuda'
-    elif hasattr(torch.backends, 'mps') and torch.backends.mps.is_available():
-        device = 'mps'
-    else:
-        device = 'cpu'
-    
-    print(f"Using device: {device}")
+    device = get_device()
     
     detector = EnhancedTrafficDetector(use_yolo=False, device=device)
     
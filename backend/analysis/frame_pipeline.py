@@ -0,0 +1,501 @@
+#!/usr/bin/env python3
+"""
+Shared Frame Pipeline
+Single-pass video decoding for DriveGuard AI
+
+Every analyzer used to open the video with its own cv2.VideoCapture and
+decode it start to finish. This module decodes the video once and fans each
+frame out to push-style analyzers:
+
+- init(meta)          called once with the video metadata
+- on_frame(idx, fr)   called for every sampled frame (a FramePyramid), in order
+- finalize()          returns the analyzer's result dict
+- timeseries()        (optional) its per-sample signals, after finalize()
+
+Each analyzer declares its sampling as `step` / `phase` (every step-th
+0-based frame index starting at phase). Frames no analyzer samples are only
+grab()bed, never converted to BGR, and long gaps are skipped with a seek.
+An analyzer can set `done = True` to stop receiving frames early.
+
+Sampled frames are wrapped in a FramePyramid so resizes and gray conversions
+are shared between analyzers instead of being redone by each one. Decoding
+itself is delegated to a VideoSource backend (see video_source.py).
+
+Long videos can also be split into time segments analyzed by a process
+pool (run_segmented_pipeline); splittable analyzers export per-sample
+measurements and the parent replays them in order.
+
+Decoding runs on a background thread that stays a few frames ahead of the
+analyzers, reusing a small ring of frame buffers. The full-resolution
+frame.bgr() array is one of those buffers, so an analyzer that needs it
+after on_frame() returns must copy it.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional, Iterator, Tuple, Callable
+
+from video_source import FramePyramid, VideoMeta, VideoOpenError, VideoSource, open_video_source
+
+
+# Gaps between sampled frames at least this long are skipped with a seek
+# (which lands on the previous keyframe) instead of grab()bing every frame
+SEEK_MIN_GAP_SEC = 2.0
+
+# Frames decoded ahead of the analyzers on a background thread (0 = inline)
+PREFETCH_DEPTH = int(os.getenv("FRAME_PREFETCH", "4"))
+
+# Shortest time segment worth its own process in run_segmented_pipeline
+SEGMENT_MIN_SEC = 30.0
+
+# YOLO trackers in a segment see this much video before the segment starts
+TRACK_WARMUP_SEC = 2.0
+
+
+class FrameAnalyzer:
+    """Base class for push-style analyzers fed by run_frame_pipeline"""
+
+    name = "analyzer"
+    step = 1   # sample every step-th frame...
+    phase = 0  # ...starting at this 0-based frame index
+    max_width: Optional[int] = None  # widest frame the analyzer reads; None = native
+
+    # Segment support (see run_segmented_pipeline). A splittable analyzer can
+    # export what it measured on one segment and replay exported segments,
+    # in order, through its state machine. lead_in is how many samples before
+    # the segment it needs to see first (e.g. the previous frame for flow).
+    splittable = False
+    lead_in = 1
+
+    # Set by the pipeline when the caller collects timeseries(); per-sample
+    # buffers that grow with the video are only kept then
+    keep_samples = False
+
+    # Bump to invalidate this analyzer's cached results by hand; source and
+    # constant changes are picked up automatically (see result_cache.py)
+    version = 1
+
+    def __init__(self):
+        self.meta: Optional[VideoMeta] = None
+        self.done = False
+        self.window = (0, None)  # [first, end) frame indices fed to this analyzer
+        self.segment_start = 0   # frames before this only warm the analyzer up
+
+    def init(self, meta: VideoMeta):
+        self.meta = meta
+
+    def set_segment(self, start: int, end: Optional[int]):
+        """Restrict to frames [start, end), plus `lead_in` earlier samples"""
+        first = self.next_wanted(start)
+        self.window = (max(self.phase, first - self.lead_in * self.step), end)
+        self.segment_start = start
+
+    def wants(self, idx: int) -> bool:
+        lo, hi = self.window
+        if idx < lo or (hi is not None and idx >= hi):
+            return False
+        return idx >= self.phase and (idx - self.phase) % self.step == 0
+
+    def next_wanted(self, idx: int) -> int:
+        """First sampled frame index >= idx"""
+        idx = max(idx, self.window[0])
+        if idx <= self.phase:
+            return self.phase
+        return idx + (-(idx - self.phase)) % self.step
+
+    def exhausted(self, idx: int) -> bool:
+        """True once no frame at or after idx falls inside the window"""
+        hi = self.window[1]
+        return hi is not None and self.next_wanted(idx) >= hi
+
+    def on_frame(self, idx: int, frame):
+        pass
+
+    def finalize(self) -> Dict[str, Any]:
+        return {}
+
+    def export_segment(self) -> Any:
+        """Picklable measurements taken on this analyzer's segment"""
+        return None
+
+    def absorb_segment(self, part: Any):
+        """Replay one exported segment; segments arrive in time order"""
+        pass
+
+    def cache_params(self) -> Dict[str, Any]:
+        """Constructor settings that change the result on the same video"""
+        return {}
+
+    def timeseries(self) -> Dict[str, Any]:
+        """
+        Per-sample signals behind the result, e.g. {"t": times, "speed_kmph":
+        speeds}: equal-length sequences keyed by signal name, "t" in seconds.
+        Called after finalize(); see timeseries.py.
+        """
+        return {}
+
+
+class MetadataAnalyzer(FrameAnalyzer):
+    """Reports the video metadata block of the analysis result; needs no frames"""
+
+    name = "video_metadata"
+    splittable = True
+
+    def init(self, meta: VideoMeta):
+        super().init(meta)
+        self.done = True
+
+    def finalize(self) -> Dict[str, Any]:
+        meta = self.meta
+        return {
+            "duration_seconds": float(round(meta.duration_seconds, 2)),
+            "fps": float(round(meta.fps, 2)),
+            "frame_count": meta.frame_count,
+            "resolution": {
+                "width": meta.width,
+                "height": meta.height
+            }
+        }
+
+
+def required_width(analyzers: List[FrameAnalyzer]) -> Optional[int]:
+    """Largest width any analyzer that still wants frames reads; None = native"""
+    active = [a for a in analyzers if not a.done]
+    if not active or any(a.max_width is None for a in active):
+        return None
+    return max(a.max_width for a in active)
+
+
+class PipelineStats:
+    """
+    Counters filled in by run_frame_pipeline.
+
+    With prefetching, decode_stall_sec is time the decoder thread waited for
+    a free frame buffer (analysis is the bottleneck) and analysis_stall_sec
+    is time the analyzers waited for a decoded frame (decoding is the
+    bottleneck). Queue depth is sampled each time a frame is taken.
+    """
+
+    def __init__(self):
+        self.frames_read = 0
+        self.frames_grabbed = 0
+        self.seeks = 0
+        self.prefetch_depth = 0
+        self.queue_depth_max = 0
+        self._queue_depth_sum = 0
+        self.decode_stall_sec = 0.0
+        self.analysis_stall_sec = 0.0
+
+    def observe_queue(self, depth: int):
+        self.queue_depth_max = max(self.queue_depth_max, depth)
+        self._queue_depth_sum += depth
+
+    def merge(self, other: "PipelineStats"):
+        """Fold in the counters of another run (e.g. one video segment)"""
+        self.frames_read += other.frames_read
+        self.frames_grabbed += other.frames_grabbed
+        self.seeks += other.seeks
+        self.prefetch_depth = max(self.prefetch_depth, other.prefetch_depth)
+        self.queue_depth_max = max(self.queue_depth_max, other.queue_depth_max)
+        self._queue_depth_sum += other._queue_depth_sum
+        self.decode_stall_sec += other.decode_stall_sec
+        self.analysis_stall_sec += other.analysis_stall_sec
+
+    def as_dict(self) -> Dict[str, Any]:
+        taken = max(1, self.frames_read)
+        return {
+            "frames_read": self.frames_read,
+            "frames_grabbed": self.frames_grabbed,
+            "seeks": self.seeks,
+            "prefetch_depth": self.prefetch_depth,
+            "queue_depth_max": self.queue_depth_max,
+            "queue_depth_avg": round(self._queue_depth_sum / taken, 2),
+            "decode_stall_sec": round(self.decode_stall_sec, 3),
+            "analysis_stall_sec": round(self.analysis_stall_sec, 3),
+        }
+
+
+class _Stopped(Exception):
+    """The consumer went away while the decoder was waiting for a buffer"""
+
+
+def _scheduled_frames(source: VideoSource, analyzers: List[FrameAnalyzer], seek_min_gap: int,
+                      stats: PipelineStats, next_buffer: Optional[Callable[[], Any]] = None
+                      ) -> Iterator[Tuple[int, FramePyramid, Any]]:
+    """
+    Yield (idx, frame, buffer) for every frame some active analyzer samples,
+    grab()bing or seeking past the rest. `next_buffer` supplies the array
+    each frame is decoded into.
+    """
+    idx = 0
+    while True:
+        active = [a for a in analyzers if not a.done and not a.exhausted(idx)]
+        if not active:
+            return
+
+        # Skip ahead to the next frame any analyzer samples
+        target = min(a.next_wanted(idx) for a in active)
+        if target - idx >= seek_min_gap:
+            landed = source.seek(target)
+            if landed is not None:
+                idx = landed
+                stats.seeks += 1
+        while idx < target:
+            if not source.grab():
+                return
+            stats.frames_grabbed += 1
+            idx += 1
+
+        buf = next_buffer() if next_buffer is not None else None
+        frame = source.read(buf)
+        if frame is None:
+            return
+        stats.frames_read += 1
+        yield idx, frame, buf
+        idx += 1
+
+
+def _prefetched_frames(source: VideoSource, analyzers: List[FrameAnalyzer], seek_min_gap: int,
+                       stats: PipelineStats, depth: int) -> Iterator[Tuple[int, FramePyramid, Any]]:
+    """
+    Run _scheduled_frames on a decoder thread, up to `depth` frames ahead.
+
+    The thread decodes into a fixed ring of depth + 1 buffers (one is held
+    by the analyzers); it blocks when every buffer is in use. A buffer is
+    recycled as soon as the on_frame() calls for its frame return, so an
+    analyzer that keeps pixels of a frame (or of a pyramid level that may
+    be a view of it) past on_frame() must copy them.
+    """
+    free = queue.Queue()
+    for _ in range(depth + 1):
+        free.put(source.frame_buffer())
+    ready = queue.Queue()
+    stop = threading.Event()
+    errors = []
+
+    def next_buffer():
+        t0 = time.perf_counter()
+        while not stop.is_set():
+            try:
+                buf = free.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            stats.decode_stall_sec += time.perf_counter() - t0
+            return buf
+        raise _Stopped()
+
+    def decode():
+        try:
+            for item in _scheduled_frames(source, analyzers, seek_min_gap, stats, next_buffer):
+                ready.put(item)
+        except _Stopped:
+            pass
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            ready.put(None)
+
+    worker = threading.Thread(target=decode, name="frame-prefetch", daemon=True)
+    worker.start()
+    try:
+        while True:
+            stats.observe_queue(ready.qsize())
+            t0 = time.perf_counter()
+            item = ready.get()
+            stats.analysis_stall_sec += time.perf_counter() - t0
+            if item is None:
+                break
+            yield item
+            free.put(item[2])
+        if errors:
+            raise errors[0]
+    finally:
+        stop.set()
+        worker.join()
+
+
+def _feed(video_path: str, analyzers: List[FrameAnalyzer], seek_min_gap_sec: float,
+          backend: Optional[str], scale_decode: bool, prefetch: int, stats: PipelineStats,
+          segment: Optional[Tuple[int, Optional[int]]] = None):
+    """Decode `video_path` once and push every sampled frame to the analyzers"""
+    source = open_video_source(video_path, backend)
+    meta = source.meta
+    stats.prefetch_depth = max(0, prefetch)
+
+    for a in analyzers:
+        a.init(meta)
+        if segment is not None and not a.done:
+            a.set_segment(*segment)
+    if scale_decode:
+        source.set_output_width(required_width(analyzers))
+
+    seek_min_gap = max(2, int(round(seek_min_gap_sec * meta.fps)))
+    if prefetch > 0:
+        frames = _prefetched_frames(source, analyzers, seek_min_gap, stats, prefetch)
+    else:
+        frames = _scheduled_frames(source, analyzers, seek_min_gap, stats)
+    try:
+        for idx, frame, _ in frames:
+            active = [a for a in analyzers if not a.done]
+            if not active:
+                break
+            for a in active:
+                if a.wants(idx):
+                    a.on_frame(idx, frame)
+    finally:
+        # Stops the decoder thread before the source is closed under it
+        frames.close()
+        source.release()
+
+
+def run_frame_pipeline(video_path: str, analyzers: List[FrameAnalyzer],
+                       seek_min_gap_sec: float = SEEK_MIN_GAP_SEC,
+                       backend: Optional[str] = None,
+                       scale_decode: bool = True,
+                       prefetch: int = PREFETCH_DEPTH,
+                       stats: Optional[PipelineStats] = None,
+                       series: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Decode `video_path` once and feed every analyzer.
+
+    With scale_decode, frames are decoded at the largest width any analyzer
+    needs rather than at native resolution. With prefetch > 0, decoding runs
+    on a background thread up to `prefetch` frames ahead of the analyzers;
+    0 decodes inline. Pass a PipelineStats to collect decode counters and
+    queue / stall metrics, and a dict as `series` to collect each analyzer's
+    timeseries() from the same pass.
+
+    Returns:
+        {analyzer.name: analyzer.finalize(), ...}
+    """
+    for a in analyzers:
+        a.keep_samples = series is not None
+    _feed(video_path, analyzers, seek_min_gap_sec, backend, scale_decode, prefetch,
+          stats if stats is not None else PipelineStats())
+    return _finalize(analyzers, series)
+
+
+def _finalize(analyzers: List[FrameAnalyzer],
+              series: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Dict[str, Any]]:
+    results = {a.name: a.finalize() for a in analyzers}
+    if series is not None:
+        for a in analyzers:
+            signals = a.timeseries()
+            if signals:
+                series[a.name] = signals
+    return results
+
+
+def plan_segments(meta: VideoMeta, workers: int,
+                  min_segment_sec: float = SEGMENT_MIN_SEC) -> List[Tuple[int, Optional[int]]]:
+    """
+    Split a video into at most `workers` contiguous [start, end) frame ranges
+    of at least `min_segment_sec` each. The last range is open-ended so it
+    runs to the real end of stream even if frame_count is off.
+    """
+    n = max(1, min(workers, int(meta.duration_seconds // max(min_segment_sec, 1e-6))))
+    bounds = [int(round(i * meta.frame_count / n)) for i in range(n)]
+    return [(bounds[i], bounds[i + 1] if i + 1 < n else None) for i in range(n)]
+
+
+def _run_segment(video_path: str, build: Callable[..., List[FrameAnalyzer]], build_args: tuple,
+                 picks: List[int], segment: Optional[Tuple[int, Optional[int]]], seek_min_gap_sec: float,
+                 backend: Optional[str], scale_decode: bool, prefetch: int,
+                 keep_samples: bool) -> Tuple[Dict[str, Any], PipelineStats, Dict[str, Dict[str, Any]]]:
+    """
+    Process-pool task: run the analyzers at `picks` on one segment and export
+    their measurements, or (segment=None) on the whole video and finalize
+    (plus their timeseries)
+    """
+    built = build(*build_args)
+    analyzers = [built[i] for i in picks]
+    for a in analyzers:
+        a.keep_samples = keep_samples
+    stats = PipelineStats()
+    series = {} if keep_samples else None
+    _feed(video_path, analyzers, seek_min_gap_sec, backend, scale_decode, prefetch, stats, segment)
+    if segment is None:
+        return _finalize(analyzers, series), stats, series or {}
+    return {a.name: a.export_segment() for a in analyzers}, stats, series or {}
+
+
+def run_segmented_pipeline(video_path: str, build: Callable[..., List[FrameAnalyzer]],
+                           build_args: tuple = (),
+                           workers: Optional[int] = None,
+                           min_segment_sec: float = SEGMENT_MIN_SEC,
+                           seek_min_gap_sec: float = SEEK_MIN_GAP_SEC,
+                           backend: Optional[str] = None,
+                           scale_decode: bool = True,
+                           prefetch: int = PREFETCH_DEPTH,
+                           stats: Optional[PipelineStats] = None,
+                           series: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Analyze time segments of one video in parallel processes and stitch them.
+
+    `build(*build_args)` must be a picklable (module-level) factory returning
+    the analyzers; every worker builds its own set, so models load once per
+    segment. Each worker seeks to its segment, feeds `lead_in` earlier
+    samples to seed frame-to-frame state, and exports per-sample
+    measurements. The parent then replays the segments in order through a
+    fresh set of analyzers, so state machines (hysteresis, EMAs, debounce
+    buffers, event merging) run over the whole timeline exactly as in a
+    serial run.
+
+    Analyzers that are not splittable (their measurements depend on the
+    whole history, e.g. long-lived feature tracks) run over the full video
+    as one more task in the same pool.
+
+    Tolerance versus run_frame_pipeline: results are identical as long as
+    seeking is frame-accurate, except for YOLO trackers. Those start each
+    segment from a TRACK_WARMUP_SEC warm-up window instead of the full
+    history, so detections and track IDs can differ for a moment after each
+    boundary; close-encounter events there may shift by about one sample,
+    and tracks are re-linked across boundaries by box overlap.
+
+    Falls back to a serial run when the video is too short to split.
+    """
+    analyzers = build(*build_args)
+    workers = workers or os.cpu_count() or 1
+    if stats is None:
+        stats = PipelineStats()
+
+    source = open_video_source(video_path, backend)
+    meta = source.meta
+    source.release()
+    segments = plan_segments(meta, workers, min_segment_sec)
+    split = [i for i, a in enumerate(analyzers) if a.splittable]
+    whole = [i for i, a in enumerate(analyzers) if not a.splittable]
+    if len(segments) < 2 or not split:
+        return run_frame_pipeline(video_path, analyzers, seek_min_gap_sec, backend,
+                                  scale_decode, prefetch, stats, series)
+
+    tasks = [(split, seg) for seg in segments]
+    if whole:
+        tasks.insert(0, (whole, None))
+    processes = min(workers, len(tasks))
+    print(f"🧩 Analyzing {len(segments)} segments on {processes} processes...")
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(_run_segment, video_path, build, build_args, picks, seg,
+                               seek_min_gap_sec, backend, scale_decode, prefetch, series is not None)
+                   for picks, seg in tasks]
+        parts = [f.result() for f in futures]
+
+    results = {}
+    for i in split:
+        analyzers[i].keep_samples = series is not None
+        analyzers[i].init(meta)
+    for (picks, seg), (exported, seg_stats, seg_series) in zip(tasks, parts):
+        stats.merge(seg_stats)
+        if seg is None:
+            results.update(exported)
+            if series is not None:
+                series.update(seg_series)
+            continue
+        for i in picks:
+            if not analyzers[i].done:
+                analyzers[i].absorb_segment(exported[analyzers[i].name])
+    results.update(_finalize([analyzers[i] for i in split], series))
+    return {a.name: results[a.name] for a in analyzers}
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Lean Detection
+Direct YOLOv8 forward pass with numpy pre/post-processing for DriveGuard AI
+
+ultralytics' generic predictor letterboxes every frame into a fresh array,
+converts it to a tensor, runs NMS over all 80 COCO classes and builds a
+Results object per frame. The close-encounter stages only look at four
+vehicle classes. LeanDetector runs the same network with less around it:
+
+- frames are letterboxed into a preallocated canvas and written straight
+  into a preallocated (batch, 3, imgsz, imgsz) float32 input buffer
+- only the vehicle class columns of the raw head output are scored, so
+  the confidence threshold drops everything else before NMS
+- NMS (cv2.dnn.NMSBoxesBatched, per class) runs on the few remaining
+  candidates
+- each frame comes back as one DETECTION_DTYPE structured array
+  (detection_store.py) in the pixels of the frame passed in
+
+It runs .pt weights (the fused PyTorch module of the registry model),
+.onnx exports on ONNX Runtime and *_openvino_model/ exports on OpenVINO
+(see utils/model_manager.py export). Track IDs come from IoUTracker
+(batched_detection.py). Selected with "inference": {"engine": "lean"} in
+config/analysis_config.json.
+"""
+
+import os
+import ast
+import cv2
+import numpy as np
+from typing import List, Optional, Sequence
+
+from detection_store import DETECTION_DTYPE
+from yolo_models import YOLO_IMGSZ, get_yolo
+
+# COCO car, motorcycle, bus, truck
+VEHICLE_CLASSES = (2, 3, 5, 7)
+MAX_DETECTIONS = 300
+PAD_VALUE = 114
+
+_BACKENDS = {}  # (weights, device, imgsz) -> (forward, names), one per process
+
+
+def _load_backend(weights: str, device: Optional[str], imgsz: int):
+    """(forward(batch) -> (B, 4 + classes, anchors) array, {class: name})"""
+    key = (weights, device, imgsz)
+    if key in _BACKENDS:
+        return _BACKENDS[key]
+    if weights.endswith(".onnx"):
+        import onnxruntime
+        session = onnxruntime.InferenceSession(weights, providers=["CPUExecutionProvider"])
+        input_name = session.get_inputs()[0].name
+        names = ast.literal_eval(session.get_modelmeta().custom_metadata_map["names"])
+
+        def forward(batch):
+            return session.run(None, {input_name: batch})[0]
+    elif os.path.isdir(weights):
+        import yaml
+        import openvino as ov
+        xml = next(f for f in sorted(os.listdir(weights)) if f.endswith(".xml"))
+        compiled = ov.Core().compile_model(os.path.join(weights, xml), "CPU")
+        with open(os.path.join(weights, "metadata.yaml")) as f:
+            names = yaml.safe_load(f)["names"]
+
+        def forward(batch):
+            return compiled(batch)[0]
+    else:
+        import torch
+        model = get_yolo(weights, device, imgsz=imgsz)  # warmed up, so its layers are fused
+        net = model.model.eval()
+        # fp16 registry models are halved during warm-up
+        param = next(net.parameters())
+        names = model.names
+
+        def forward(batch):
+            with torch.inference_mode():
+                out = net(torch.from_numpy(batch).to(param.device, param.dtype))
+            return (out[0] if isinstance(out, (tuple, list)) else out).float().cpu().numpy()
+    _BACKENDS[key] = forward, {int(k): v for k, v in names.items()}
+    return _BACKENDS[key]
+
+
+class LeanDetector:
+    """Vehicle detector on preallocated buffers; detect() takes a list of BGR frames"""
+
+    def __init__(self, weights: str, conf: float, iou: float, max_batch: int = 1,
+                 imgsz: int = YOLO_IMGSZ, device: Optional[str] = None,
+                 classes: Sequence[int] = VEHICLE_CLASSES):
+        self.conf = conf
+        self.iou = iou
+        self.imgsz = imgsz
+        self.classes = np.asarray(classes, np.int64)
+        self._forward, self.names = _load_backend(weights, device, imgsz)
+        self._canvas = np.full((imgsz, imgsz, 3), PAD_VALUE, np.uint8)
+        self._input = np.empty((max(1, max_batch), 3, imgsz, imgsz), np.float32)
+
+    def _letterbox(self, image: np.ndarray, k: int):
+        """Write image k of the batch into the input buffer; returns (ratio, left, top)"""
+        h, w = image.shape[:2]
+        size = self.imgsz
+        r = min(size / h, size / w)
+        nw, nh = int(round(w * r)), int(round(h * r))
+        # Same placement as ultralytics' LetterBox
+        left, top = int(round((size - nw) / 2 - 0.1)), int(round((size - nh) / 2 - 0.1))
+        canvas = self._canvas
+        canvas.fill(PAD_VALUE)
+        canvas[top:top + nh, left:left + nw] = (cv2.resize(image, (nw, nh), interpolation=cv2.INTER_LINEAR)
+                                                if (nw, nh) != (w, h) else image)
+        # BGR HWC uint8 -> RGB CHW float32 in [0, 1], in place
+        np.multiply(canvas[:, :, ::-1].transpose(2, 0, 1), 1.0 / 255.0, out=self._input[k], casting="unsafe")
+        return r, left, top
+
+    def detect(self, images: List[np.ndarray]) -> List[np.ndarray]:
+        """One DETECTION_DTYPE array per image (track_id -1), boxes in image pixels"""
+        if len(images) > len(self._input):
+            self._input = np.empty((len(images),) + self._input.shape[1:], np.float32)
+        geometry = [self._letterbox(image, k) for k, image in enumerate(images)]
+        raw = self._forward(self._input[:len(images)])
+        return [self._decode(raw[k], *geometry[k], images[k].shape[:2]) for k in range(len(images))]
+
+    def _decode(self, pred: np.ndarray, r: float, left: int, top: int, shape) -> np.ndarray:
+        # pred: (4 + classes, anchors) = cx, cy, w, h, class scores
+        scores = pred[4 + self.classes]
+        best = scores.argmax(axis=0)
+        conf = scores[best, np.arange(scores.shape[1])]
+        keep = np.nonzero(conf >= self.conf)[0]
+        if len(keep) == 0:
+            return np.empty(0, DETECTION_DTYPE)
+        cx, cy, w, h = pred[:4, keep]
+        conf, cls = conf[keep], self.classes[best[keep]]
+        rects = np.stack([cx - w / 2, cy - h / 2, w, h], axis=1)
+        picked = cv2.dnn.NMSBoxesBatched(rects.tolist(), conf.tolist(), cls.tolist(), self.conf, self.iou)
+        picked = np.asarray(picked, np.int64).reshape(-1)[:MAX_DETECTIONS]
+
+        out = np.empty(len(picked), DETECTION_DTYPE)
+        xyxy = rects[picked].copy()
+        xyxy[:, 2:] += xyxy[:, :2]
+        xyxy -= (left, top, left, top)
+        xyxy /= r
+        height, width = shape
+        np.clip(xyxy[:, 0::2], 0, width, out=xyxy[:, 0::2])
+        np.clip(xyxy[:, 1::2], 0, height, out=xyxy[:, 1::2])
+        out["xyxy"] = xyxy
+        out["conf"] = conf[picked]
+        out["cls"] = cls[picked]
+        out["track_id"] = -1
+        return out
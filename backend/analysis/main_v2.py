@@ -1,20 +1,36 @@
 import os, cv2, json, numpy as np
 from collections import deque
 from math import atan2, degrees
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import glob
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from driving_score_calculator import calculate_driving_score, get_score_category
+from yolo_models import (HAS_YOLO as _HAS_YOLO, YOLO_IMGSZ, YOLO_PRECISION, get_device, get_yolo, model_metrics,
+                         predict_args, runtime_weights, set_torch_threads)
+from frame_pipeline import (FrameAnalyzer, MetadataAnalyzer, PipelineStats, VideoOpenError,
+                            run_frame_pipeline, run_segmented_pipeline, TRACK_WARMUP_SEC)
+from video_source import VIDEO_BACKEND
+from result_cache import ANALYSIS_CACHE, ResultCache, cache_key, hash_file, section_key
+from detection_store import DetectionCache, DetectionRecorder, FrameDetections
+from results_store import ResultsStore
+from timeseries import save_timeseries
+from optical_flow import create_flow_engine, flow_engine_settings
+from ego_motion import EgoMotionEstimator
+from speed_profile import SecondBins, speed_profile, speed_events
+from batched_detection import BatchedDetector, InferenceRoi, IoUTracker, inference_settings, roi_settings
+from lean_detection import LeanDetector
 
 # Import enhanced detection methods
 try:
-    from enhanced_speed_detection import estimate_speed_multimethod
+    from enhanced_speed_detection import estimate_speed_multimethod, EnhancedSpeedDetector
     HAS_ENHANCED_SPEED = True
 except ImportError:
     HAS_ENHANCED_SPEED = False
     print("⚠️  Enhanced speed detection not available")
 
 try:
-    from enhanced_proximity_detection import detect_close_encounters_enhanced
+    from enhanced_proximity_detection import (detect_close_encounters_enhanced, EnhancedProximityDetector,
+                                              load_proximity_model)
     HAS_ENHANCED_PROXIMITY = True
 except ImportError:
     HAS_ENHANCED_PROXIMITY = False
@@ -25,7 +41,9 @@ def convert_to_python_types(obj):
     """
     Recursively converts numpy types to Python native types for JSON serialization.
     """
-    if isinstance(obj, np.integer):
+    if isinstance(obj, np.bool_):
+        return bool(obj)
+    elif isinstance(obj, np.integer):
         return int(obj)
     elif isinstance(obj, np.floating):
         return float(obj)
@@ -47,7 +65,27 @@ OUTPUT_FOLDER = os.path.join(BASE_DIR, "outputs", "analysis")
 MODELS_FOLDER = os.path.join(BASE_DIR, "models")
 CONFIG_FOLDER = os.path.join(BASE_DIR, "config")
 CALIBRATION_FILE = os.path.join(CONFIG_FOLDER, "video_calibrations.json")
+ANALYSIS_CONFIG_FILE = os.path.join(CONFIG_FOLDER, "analysis_config.json")
 MERGED_OUTPUT_JSON = os.path.join(OUTPUT_FOLDER, "merged_output_analysis.json")
+CACHE_FOLDER = os.path.join(OUTPUT_FOLDER, "cache")
+DETECTIONS_FOLDER = os.path.join(CACHE_FOLDER, "detections")
+
+def load_analysis_config() -> Dict[str, Any]:
+    if os.path.exists(ANALYSIS_CONFIG_FILE):
+        with open(ANALYSIS_CONFIG_FILE, "r") as f:
+            return json.load(f)
+    return {}
+
+ANALYSIS_CONFIG = load_analysis_config()
+# Optical flow engine per analyzer name (see optical_flow.py)
+FLOW_ENGINES = flow_engine_settings(ANALYSIS_CONFIG)
+# One shared camera-motion pass for the speed, turn and lane analyzers (see ego_motion.py)
+EGO_MOTION = bool(ANALYSIS_CONFIG.get("ego_motion", {}).get("enabled", False))
+# Frames per YOLO forward pass in the close-encounter stage, and the runner
+# ("ultralytics" or "lean", see batched_detection.py / lean_detection.py)
+INFERENCE_BATCH_SIZE, INFERENCE_MAX_LATENCY_MS, INFERENCE_ENGINE = inference_settings(ANALYSIS_CONFIG)
+# min_object_px of ROI-cropped inference, None runs the detector on whole frames
+INFERENCE_ROI = roi_settings(ANALYSIS_CONFIG)
 
 # -------- utils --------
 def _duration_seconds(path: str) -> float:
@@ -59,107 +97,138 @@ def _duration_seconds(path: str) -> float:
     return float(n)/float(fps) if n>0 else 0.0
 
 # ===================== AVERAGE SPEED CALCULATION =====================
-def calculate_average_speed(video_path, meters_per_pixel, roi_top, roi_bottom):
+# Flow width. Farneback is not scale-invariant (at 896 px the bundled clips
+# read ~45% faster), so this is the width the calibrations were made at;
+# wider videos are downscaled and meters_per_pixel (per native pixel)
+# rescaled in on_frame
+TARGET_W_SPEED = 1280
+
+class AverageSpeedAnalyzer(FrameAnalyzer):
     """
     Calculates the average speed of the ego-vehicle using improved optical flow on a specific ROI.
     Uses magnitude-based flow with outlier filtering for better accuracy.
     """
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        print(f"Error: Cannot open video file at {video_path}")
-        return 0.0
+    name = "average_speed"
+    max_width = TARGET_W_SPEED
+    splittable = True
 
-    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
-    prev_gray_frame = None
-    all_frame_speeds_kmph = []
-    
-    # Sample rate for efficiency (5 times per second)
-    sample_rate = max(1, int(fps / 5))
-    frame_count = 0
-    
     # Realistic speed bounds for dashcam footage (km/h)
-    min_speed, max_speed = 0.0, 150.0
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        
-        frame_count += 1
-        
-        # Skip frames for sampling efficiency
-        if frame_count % sample_rate != 0:
-            continue
-
-        current_gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-        if prev_gray_frame is None:
-            prev_gray_frame = current_gray_frame
-            continue
-
-        h = frame.shape[0]
-        roi_start_y = int(h * roi_top)
-        roi_end_y = int(h * roi_bottom)
-        
-        prev_roi = prev_gray_frame[roi_start_y:roi_end_y, :]
+    MIN_SPEED, MAX_SPEED = 0.0, 150.0
+
+    def __init__(self, meters_per_pixel, roi_top, roi_bottom, flow_engine="farneback"):
+        super().__init__()
+        self.meters_per_pixel = meters_per_pixel
+        self.roi_top = roi_top
+        self.roi_bottom = roi_bottom
+        self.flow_engine = flow_engine
+        self.prev_gray_frame = None
+        self.all_frame_speeds_kmph = []
+        self.speed_times = []
+
+    def cache_params(self):
+        return {"meters_per_pixel": self.meters_per_pixel, "roi_top": self.roi_top, "roi_bottom": self.roi_bottom,
+                "flow_engine": self.flow_engine}
+
+    def init(self, meta):
+        super().init(meta)
+        self.fps = meta.fps
+        self.flow = create_flow_engine(self.flow_engine, pyr_scale=0.5, levels=3, winsize=15,
+                                       iterations=3, poly_n=5, poly_sigma=1.2)
+        # Sample rate for efficiency (5 times per second)
+        self.sample_rate = max(1, int(self.fps / 5))
+        self.step = self.sample_rate
+        self.phase = self.sample_rate - 1
+
+    def on_frame(self, idx, frame):
+        current_gray_frame = frame.gray(self.max_width)
+
+        if self.prev_gray_frame is None:
+            self.prev_gray_frame = current_gray_frame
+            return
+
+        h = current_gray_frame.shape[0]
+        roi_start_y = int(h * self.roi_top)
+        roi_end_y = int(h * self.roi_bottom)
+
+        prev_roi = self.prev_gray_frame[roi_start_y:roi_end_y, :]
         current_roi = current_gray_frame[roi_start_y:roi_end_y, :]
 
         if prev_roi.size == 0 or current_roi.size == 0:
-            continue
-
-        # Calculate optical flow with optimized parameters
-        flow = cv2.calcOpticalFlowFarneback(
-            prev_roi, current_roi, None,
-            pyr_scale=0.5,
-            levels=3,
-            winsize=15,
-            iterations=3,
-            poly_n=5,
-            poly_sigma=1.2,
-            flags=0
-        )
-        
+            return
+
+        # Motion vectors from the configured optical flow engine
+        flow = self.flow.vectors(prev_roi, current_roi)
+
         if flow is not None:
             # Use magnitude of flow vectors for better speed estimation
-            magnitude = np.sqrt(flow[..., 0]**2 + flow[..., 1]**2)
-            
+            magnitude = np.sqrt(flow[:, 0]**2 + flow[:, 1]**2)
+
             # Filter out noise and use 75th percentile
             valid_flows = magnitude[magnitude > 0]
             if len(valid_flows) > 0:
                 flow_magnitude = np.percentile(valid_flows, 75)
-                
-                # Convert: pixels/frame * meters/pixel * frames/sec = meters/sec
-                speed_mps = flow_magnitude * meters_per_pixel * (fps / sample_rate)
+
+                # Convert: pixels/frame * meters/pixel * frames/sec = meters/sec,
+                # in native pixels
+                native_px = self.meta.width / float(current_gray_frame.shape[1])
+                speed_mps = flow_magnitude * native_px * self.meters_per_pixel * (self.fps / self.sample_rate)
                 speed_kmph = speed_mps * 3.6
-                
+
                 # Clamp to realistic range
-                speed_kmph = np.clip(speed_kmph, min_speed, max_speed)
-                all_frame_speeds_kmph.append(speed_kmph)
-        
-        prev_gray_frame = current_gray_frame
+                speed_kmph = np.clip(speed_kmph, self.MIN_SPEED, self.MAX_SPEED)
+                self.all_frame_speeds_kmph.append(speed_kmph)
+                self.speed_times.append(idx / self.fps)
 
-    cap.release()
+        self.prev_gray_frame = current_gray_frame
 
-    if not all_frame_speeds_kmph:
-        return 0.0
+    def export_segment(self):
+        return (self.speed_times, self.all_frame_speeds_kmph)
 
-    # Remove outliers using IQR method
-    speeds_array = np.array(all_frame_speeds_kmph)
-    q1 = np.percentile(speeds_array, 25)
-    q3 = np.percentile(speeds_array, 75)
-    iqr = q3 - q1
-    lower_bound = max(min_speed, q1 - 1.5 * iqr)
-    upper_bound = min(max_speed, q3 + 1.5 * iqr)
-    
-    filtered_speeds = speeds_array[
-        (speeds_array >= lower_bound) & 
-        (speeds_array <= upper_bound)
-    ]
-    
-    if len(filtered_speeds) == 0:
-        filtered_speeds = speeds_array
-    
-    return np.mean(filtered_speeds)
+    def absorb_segment(self, part):
+        times, speeds = part
+        self.speed_times.extend(times)
+        self.all_frame_speeds_kmph.extend(speeds)
+
+    def timeseries(self):
+        return {"t": self.speed_times, "speed_kmph": self.all_frame_speeds_kmph}
+
+    def finalize(self):
+        if not self.all_frame_speeds_kmph:
+            return {"average_speed_kmph": 0.0}
+
+        # Remove outliers using IQR method
+        speeds_array = np.array(self.all_frame_speeds_kmph)
+        q1 = np.percentile(speeds_array, 25)
+        q3 = np.percentile(speeds_array, 75)
+        iqr = q3 - q1
+        lower_bound = max(self.MIN_SPEED, q1 - 1.5 * iqr)
+        upper_bound = min(self.MAX_SPEED, q3 + 1.5 * iqr)
+
+        filtered_speeds = speeds_array[
+            (speeds_array >= lower_bound) &
+            (speeds_array <= upper_bound)
+        ]
+
+        if len(filtered_speeds) == 0:
+            filtered_speeds = speeds_array
+
+        bins = SecondBins()
+        for t, kmph in zip(self.speed_times, self.all_frame_speeds_kmph):
+            bins.add(t, kmph)
+        return {"average_speed_kmph": np.mean(filtered_speeds), "per_second": bins.as_dict()}
+
+def calculate_average_speed(video_path, meters_per_pixel, roi_top, roi_bottom):
+    """
+    Calculates the average speed of the ego-vehicle using improved optical flow on a specific ROI.
+    Uses magnitude-based flow with outlier filtering for better accuracy.
+    """
+    analyzer = AverageSpeedAnalyzer(meters_per_pixel, roi_top, roi_bottom)
+    try:
+        results = run_frame_pipeline(video_path, [analyzer])
+    except VideoOpenError:
+        print(f"Error: Cannot open video file at {video_path}")
+        return 0.0
+    return results[analyzer.name]["average_speed_kmph"]
 
 # ===================== TRAFFIC SIGNAL (presentation-safe window) =====================
 TARGET_WIDTH_TS = 800
@@ -176,52 +245,28 @@ def _postprocess_smoother(dur_sec: float, out_json: Dict[str, Any]) -> Dict[str,
     
     return out_json
 
+class TrafficSignalAnalyzer(FrameAnalyzer):
+    """Presentation-safe traffic signal summary; only needs the video duration"""
+    name = "traffic_signal"
+    splittable = True
+
+    def init(self, meta):
+        super().init(meta)
+        self.done = True
+
+    def finalize(self):
+        dur_sec = self.meta.duration_seconds
+        out = {"violations": []}
+        out = _postprocess_smoother(float(round(dur_sec,3)), out)
+        return out
+
 def run_traffic_signal_summary(video_path: str) -> Dict[str, Any]:
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened(): raise RuntimeError(f"Could not open video: {video_path}")
-    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
-    step = max(1, int(round(fps/PROCESS_HZ_TS)))
-    violations: List[Dict[str, Any]] = []
-    idx = 0
-    ok, first = cap.read()
-    if not ok:
-        dur_sec = 0.0
-    else:
-        _ = cv2.resize(first, (TARGET_WIDTH_TS, int(first.shape[0]*TARGET_WIDTH_TS/first.shape[1])), interpolation=cv2.INTER_AREA)
-        while True:
-            ok, frame = cap.read()
-            if not ok: break
-            idx += 1
-            if idx % step != 0: continue
-        total_frames = cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0
-        dur_sec = float(total_frames)/float(fps) if total_frames>0 else ((cap.get(cv2.CAP_PROP_POS_MSEC) or 0.0)/1000.0)
-    cap.release()
-    out = {"violations": violations}
-    out = _postprocess_smoother(float(round(dur_sec,3)), out)
-    return out
+    analyzer = TrafficSignalAnalyzer()
+    return run_frame_pipeline(video_path, [analyzer])[analyzer.name]
 
 # ===================== CLOSE ENCOUNTERS (YOLO + flow) =====================
-try:
-    from ultralytics import YOLO
-    import torch
-    _HAS_YOLO = True
-    
-    # GPU Acceleration Setup
-    print("=== GPU Acceleration Check ===")
-    if torch.cuda.is_available():
-        DEVICE = 'cuda'
-        print(f"✅ CUDA GPU detected: {torch.cuda.get_device_name(0)}")
-    elif hasattr(torch.backends, 'mps') and torch.backends.mps.is_available():
-        DEVICE = 'mps'
-        print("✅ Apple Silicon (MPS) GPU detected")
-    else:
-        DEVICE = 'cpu'
-        print("⚠️  No GPU detected, using CPU (slower)")
-    print(f"Using device: {DEVICE}")
-    
-except Exception:
-    _HAS_YOLO = False
-    DEVICE = 'cpu'
+# torch / ultralytics are only imported (and the GPU probed) when a detector
+# model is first loaded; see yolo_models.py
 
 # YOLO Model Configuration
 # Options: yolov8n.pt (nano), yolov8s.pt (small), yolov8m.pt (medium), yolov8l.pt (large), yolov8x.pt (xlarge)
@@ -234,7 +279,14 @@ if not os.path.exists(MODEL_WEIGHTS):
     print(f"⚠️  Model {MODEL_NAME} not found, falling back to yolov8n.pt")
     MODEL_WEIGHTS = os.path.join(MODELS_FOLDER, "yolov8n.pt")
 
+# Inference runtime: "pytorch", or the ONNX / OpenVINO (optionally int8)
+# export of the weights made by utils/model_manager.py export
+MODEL_RUNTIME = os.getenv("YOLO_RUNTIME", ANALYSIS_CONFIG.get("model", {}).get("runtime", "pytorch"))
+MODEL_INT8 = bool(ANALYSIS_CONFIG.get("model", {}).get("int8", False))
+MODEL_WEIGHTS = runtime_weights(MODEL_WEIGHTS, MODEL_RUNTIME, MODEL_INT8)
+
 VEH = {2,3,5,7}
+VEH_IDS = np.array(sorted(VEH))
 TARGET_W_CE = 896
 PROC_HZ_CE  = 8.0
 CONF = 0.25
@@ -249,6 +301,8 @@ ENTER_K = 0.18
 EXIT_K  = 0.10
 DERIV_MIN = 0.04
 MIN_BOX_H = 0.14
+# ROI inference: the bands, with headroom for the tops of the boxes in them
+ROI_CE = (X_BANDS[0][0], 0.25, X_BANDS[-1][1], 1.0)
 MERGE_GAP = 2.0
 
 def _expansion_score(prev_gray, gray, box):
@@ -269,83 +323,150 @@ def _expansion_score(prev_gray, gray, box):
     rad = (v * u).sum(axis=1) / max(h,w)
     return float(np.median(rad)), len(p)
 
-def run_close_encounters(video_path: str) -> Dict[str, Any]:
-    if not _HAS_YOLO:
-        return {"close_encounters": [], "event_count": 0, "note": "ultralytics not installed"}
-    
-    # Initialize model with GPU acceleration and tracking
-    model = YOLO(MODEL_WEIGHTS)
-    model.to(DEVICE)  # Move model to GPU if available
-    print(f"Model loaded on {DEVICE}")
-    
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened(): raise RuntimeError("Could not open video")
-    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
-    step = max(1, int(round(fps/PROC_HZ_CE)))
-
-    ok, f0 = cap.read()
-    if not ok:
-        cap.release()
-        return {"close_encounters": [], "event_count": 0}
-    H0,W0 = f0.shape[:2]
-    s = TARGET_W_CE/float(W0)
-    W,H = TARGET_W_CE, int(H0*s)
-    bands_px = []
-    y0b, y1b = int(H*Y0), int(H*Y1)
-    for xb in X_BANDS:
-        bands_px.append((int(W*xb[0]), y0b, int(W*xb[1]), y1b))
-
-    prev = cv2.resize(f0, (W,H), interpolation=cv2.INTER_AREA)
-    prev_gray = cv2.cvtColor(prev, cv2.COLOR_BGR2GRAY)
-
-    vals = [[],[],[]]
-    bases = [deque(maxlen=max(3,int(BASE_SEC*PROC_HZ_CE))) for _ in range(3)]
-    ema = [0.0,0.0,0.0]
-    times = []
-    state = "idle"
-    cur_event = None
-    events = []
-    
-    # Track vehicle IDs across frames for better detection
-    tracked_vehicles = {}  # {track_id: {'boxes': [], 'times': [], 'scores': []}}
-
-    i = 0
-    while True:
-        ok, fr = cap.read()
-        if not ok: break
-        i += 1
-        if i % step != 0: continue
-        t = i / fps
-        fr = cv2.resize(fr, (W,H), interpolation=cv2.INTER_AREA)
-        gray = cv2.cvtColor(fr, cv2.COLOR_BGR2GRAY)
-        times.append(t)
-
-        # Use tracking instead of just detection for better trajectory analysis
-        res = model.track(fr, conf=CONF, iou=IOU, persist=True, tracker="botsort.yaml", verbose=False)[0]
+class CloseEncounterAnalyzer(FrameAnalyzer):
+    name = "close_encounters"
+    max_width = TARGET_W_CE
+    splittable = True
+
+    def __init__(self, model=None, detections: DetectionCache = None,
+                 batch_size: int = 1, max_latency_ms: Optional[float] = None, engine: str = "ultralytics",
+                 roi_min_object_px: Optional[int] = None):
+        super().__init__()
+        self.model = model
+        # Recorded detections replace model.track(); frames are still
+        # decoded for the band flow
+        self.detections = detections
+        # batch_size > 1, the lean engine or ROI inference: batched inference
+        # + IoUTracker instead of per-frame track()
+        self.batch_size = batch_size
+        self.max_latency_ms = max_latency_ms
+        self.engine = engine
+        self.roi_min_object_px = roi_min_object_px
+        self.batched = batch_size > 1 or engine == "lean" or roi_min_object_px is not None
+
+    def cache_params(self):
+        return {"batch_size": self.batch_size, "engine": self.engine, "roi": self.roi_min_object_px}
+
+    def _detector_settings(self):
+        tracker = IoUTracker().settings() if self.batched else "botsort.yaml"
+        settings = {"detector": type(self).__name__, "model": os.path.basename(MODEL_WEIGHTS), "conf": CONF,
+                    "iou": IOU, "tracker": tracker, "width": TARGET_W_CE, "imgsz": YOLO_IMGSZ,
+                    "precision": YOLO_PRECISION, "step": self.step}
+        if self.engine != "ultralytics":
+            settings["engine"] = self.engine
+        if self.roi is not None:
+            settings.update(self.roi.settings())
+        return settings
+
+    def init(self, meta):
+        super().init(meta)
+        self.started = False
+        self.samples = []  # (t, band scores, band box heights) per processed frame
+        self.fps = meta.fps
+        self.step = max(1, int(round(self.fps/PROC_HZ_CE)))
+        # Smallest box that can still confirm an event (see _advance)
+        self.roi = (InferenceRoi(ROI_CE, MIN_BOX_H*0.9*(Y1-Y0), self.roi_min_object_px, meta.width/meta.height)
+                    if self.roi_min_object_px is not None else None)
+        self.store = self.detections.load(self._detector_settings()) if self.detections else None
+        self.recorder = None
+        self.batch = None
+        if not _HAS_YOLO and self.store is None:
+            self.done = True
+            return
+        # In a segment, let the tracker see a couple of seconds first
+        self.lead_in = max(1, int(round(TRACK_WARMUP_SEC * PROC_HZ_CE)))
+
+        self.vals = [[],[],[]]
+        self.bases = [deque(maxlen=max(3,int(BASE_SEC*PROC_HZ_CE))) for _ in range(3)]
+        self.ema = [0.0,0.0,0.0]
+        self.times = []
+        self.state = "idle"
+        self.cur_event = None
+        self.events = []
+
+        # Track vehicle IDs across frames for better detection
+        self.tracked_vehicles = {}  # {track_id: {'boxes': [], 'times': [], 'scores': []}}
+
+    def _start(self, f0):
+        if self.store is None:
+            imgsz = self.roi.imgsz if self.roi is not None else YOLO_IMGSZ
+            if self.model is None and self.engine == "lean":
+                self.model = LeanDetector(MODEL_WEIGHTS, CONF, IOU, self.batch_size, imgsz, device=get_device())
+            elif self.model is None:
+                # Shared per process with GPU acceleration; tracker reset per video
+                self.model = get_yolo(MODEL_WEIGHTS, get_device(), imgsz=imgsz)
+            if self.batched:
+                self.batch = BatchedDetector(self.model, self.batch_size, CONF, IOU, self.max_latency_ms, self.roi)
+            # Only a whole-video run is recorded; segment trackers start warm
+            if self.detections and self.segment_start == 0 and self.window[1] is None:
+                self.recorder = DetectionRecorder(self.fps)
+        self.W, self.H = W, H = f0.size(f0.snap(TARGET_W_CE))
+        self.bands_px = []
+        y0b, y1b = int(H*Y0), int(H*Y1)
+        for xb in X_BANDS:
+            self.bands_px.append((int(W*xb[0]), y0b, int(W*xb[1]), y1b))
+
+        self.prev_gray = f0.gray(TARGET_W_CE)
+        self.started = True
+
+    def on_frame(self, i, fr):
+        if not self.started:
+            self._start(fr)
+            return
+        gray = fr.gray(TARGET_W_CE)
+
+        if self.store is not None:
+            dets = self.store.frame(i)
+        elif self.batch is not None:
+            # Frames are scored in order once their batch has run
+            for idx, dets, done_gray in self.batch.submit(i, fr.bgr(TARGET_W_CE), gray):
+                self._on_detections(idx, done_gray, dets)
+            return
+        else:
+            # Use tracking instead of just detection for better trajectory analysis
+            res = self.model.track(fr.bgr(TARGET_W_CE), conf=CONF, iou=IOU, persist=True, tracker="botsort.yaml", verbose=False,
+                                   **predict_args())[0]
+            dets = FrameDetections.from_boxes(res.boxes)
+        self._on_detections(i, gray, dets)
+
+    def _flush_batch(self):
+        if self.batch is not None:
+            for idx, dets, gray in self.batch.flush():
+                self._on_detections(idx, gray, dets)
+
+    def _on_detections(self, i, gray, dets):
+        """Band scores of processed frame i from its tracked detections"""
+        if self.recorder is not None:
+            self.recorder.add(i, dets)
+        W, H = self.W, self.H
+        t = i / self.fps
         boxes = []
-        if res.boxes is not None and len(res.boxes):
-            for b in res.boxes:
-                c = int(b.cls[0].item())
-                if c not in VEH: continue
-                x1,y1,x2,y2 = map(int, b.xyxy[0].tolist())
-                w = x2-x1; h = y2-y1
-                if w<=0 or h<=0: continue
-                cxn = (x1+x2)/(2.0*W); cyn = (y1+y2)/(2.0*H)
-                if CENTER_BAND[0] <= cxn <= CENTER_BAND[1] and cyn >= 0.45:
-                    box_data = (x1,y1,x2,y2)
-                    boxes.append(box_data)
-                    
-                    # Track vehicles for trajectory analysis
-                    if hasattr(b, 'id') and b.id is not None:
-                        track_id = int(b.id.item())
-                        if track_id not in tracked_vehicles:
-                            tracked_vehicles[track_id] = {'boxes': [], 'times': [], 'scores': []}
-                        tracked_vehicles[track_id]['boxes'].append(box_data)
-                        tracked_vehicles[track_id]['times'].append(t)
-
-        band_scores = []
+        # Vehicles in the lower center band, filtered for the whole frame at once
+        xyxy = dets.xyxy.astype(np.int64)  # truncates like int()
+        x1,y1,x2,y2 = xyxy.T
+        cxn = (x1+x2)/(2.0*W); cyn = (y1+y2)/(2.0*H)
+        keep = np.nonzero(np.isin(dets.cls, VEH_IDS) & (x2>x1) & (y2>y1)
+                          & (CENTER_BAND[0] <= cxn) & (cxn <= CENTER_BAND[1]) & (cyn >= 0.45))[0]
+        for k in keep.tolist():
+            box_data = tuple(xyxy[k].tolist())
+            boxes.append(box_data)
+
+            # Track vehicles for trajectory analysis
+            if dets.track_id[k] >= 0:
+                track_id = int(dets.track_id[k])
+                if track_id not in self.tracked_vehicles:
+                    self.tracked_vehicles[track_id] = {'boxes': [], 'times': [], 'scores': []}
+                self.tracked_vehicles[track_id]['boxes'].append(box_data)
+                self.tracked_vehicles[track_id]['times'].append(t)
+
+        if i < self.segment_start:
+            # Tracker warm-up before this segment; scored by the previous one
+            self.prev_gray = gray
+            return
+
+        scores = []
         band_box_h  = []
-        for bi,(x0,y0,x1,y1) in enumerate(bands_px):
+        for bi,(x0,y0,x1,y1) in enumerate(self.bands_px):
             h_band = y1 - y0
             hmax = 0.0
             for (xa,ya,xb,yb) in boxes:
@@ -353,13 +474,24 @@ def run_close_encounters(video_path: str) -> Dict[str, Any]:
                 ox1, oy1 = min(x1, xb), min(y1, yb)
                 if ox1>ox0 and oy1>oy0:
                     hmax = max(hmax, (yb-ya)/float(h_band))
-            exp_med,_ = _expansion_score(prev_gray, gray, (x0,y0,x1,y1))
-            score = max(hmax,0.0) + 1.0*max(exp_med,0.0)
+            exp_med,_ = _expansion_score(self.prev_gray, gray, (x0,y0,x1,y1))
+            scores.append(max(hmax,0.0) + 1.0*max(exp_med,0.0))
+            band_box_h.append(hmax)
+
+        self.prev_gray = gray
+        self.samples.append((t, scores, band_box_h))
+        self._advance(t, scores, band_box_h)
+
+    def _advance(self, t, scores, band_box_h):
+        """Band EMAs and the idle / in_event state machine for one sample"""
+        vals, bases, ema, times = self.vals, self.bases, self.ema, self.times
+        times.append(t)
+        band_scores = []
+        for bi, score in enumerate(scores):
             ema[bi] = score if not vals[bi] else (EMA_A*score + (1-EMA_A)*ema[bi])
             vals[bi].append(ema[bi]); bases[bi].append(ema[bi])
-            band_scores.append(ema[bi]); band_box_h.append(hmax)
+            band_scores.append(ema[bi])
 
-        prev_gray = gray
         medians = [float(np.median(bases[bi])) if len(bases[bi])>=3 else 0.0 for bi in range(3)]
         fused = float(max(band_scores))
         fused_prev = fused if len(times)<2 else float(max(vals[0][-2], vals[1][-2], vals[2][-2]))
@@ -369,12 +501,13 @@ def run_close_encounters(video_path: str) -> Dict[str, Any]:
         enter_thr = float(np.median(medians)) + ENTER_K
         exit_thr  = float(np.median(medians)) + EXIT_K
 
-        if state == "idle":
+        if self.state == "idle":
             if fused >= enter_thr and d1 >= DERIV_MIN and box_ok:
-                state = "in_event"
-                cur_event = {"start_time": round(t,2), "peak_time": round(t,2), "peak_score": round(fused,3),
-                             "where": ["left","center","right"][peak_band], "max_box_height_norm": round(band_box_h[peak_band],3)}
+                self.state = "in_event"
+                self.cur_event = {"start_time": round(t,2), "peak_time": round(t,2), "peak_score": round(fused,3),
+                                  "where": ["left","center","right"][peak_band], "max_box_height_norm": round(band_box_h[peak_band],3)}
         else:
+            cur_event = self.cur_event
             if fused > cur_event["peak_score"]:
                 cur_event["peak_score"] = round(fused,3)
                 cur_event["peak_time"]  = round(t,2)
@@ -382,36 +515,67 @@ def run_close_encounters(video_path: str) -> Dict[str, Any]:
                 cur_event["max_box_height_norm"] = round(band_box_h[peak_band],3)
             if fused <= exit_thr:
                 cur_event["end_time"] = round(t,2)
-                events.append(cur_event)
-                state = "idle"
-                cur_event = None
-
-    if state == "in_event" and cur_event:
-        cur_event["end_time"] = round(times[-1],2)
-        events.append(cur_event)
+                self.events.append(cur_event)
+                self.state = "idle"
+                self.cur_event = None
+
+    def export_segment(self):
+        self._flush_batch()
+        return self.samples
+
+    def absorb_segment(self, part):
+        for t, scores, band_box_h in part:
+            self.started = True
+            self._advance(t, scores, band_box_h)
+
+    def finalize(self):
+        self._flush_batch()
+        if self.recorder is not None:
+            self.detections.save(self._detector_settings(), self.recorder, (self.W, self.H), self.model.names)
+            self.recorder = None
+        if not _HAS_YOLO and self.store is None:
+            return {"close_encounters": [], "event_count": 0, "note": "ultralytics not installed"}
+        if not self.started:
+            return {"close_encounters": [], "event_count": 0}
+
+        events = self.events
+        if self.state == "in_event" and self.cur_event:
+            self.cur_event["end_time"] = round(self.times[-1],2)
+            events.append(self.cur_event)
+
+        final = []
+        for e in events:
+            if (e["end_time"] - e["start_time"]) >= 0.2:
+                final.append(e)
+
+        merged = []
+        if final:
+            merged.append(final[0])
+            for e in final[1:]:
+                if (e["start_time"] - merged[-1]["end_time"]) <= MERGE_GAP:
+                    if e["peak_score"] > merged[-1]["peak_score"]:
+                        merged[-1]["peak_score"] = e["peak_score"]
+                        merged[-1]["peak_time"]  = e["peak_time"]
+                        merged[-1]["where"]      = e["where"]
+                        merged[-1]["max_box_height_norm"] = e["max_box_height_norm"]
+                    merged[-1]["end_time"] = e["end_time"]
+                else:
+                    merged.append(e)
+
+        return {"close_encounters": merged, "event_count": len(merged)}
+
+    def timeseries(self):
+        if not self.started:
+            return {}
+        left, center, right = self.vals
+        return {"t": self.times, "ema_left": left, "ema_center": center, "ema_right": right}
 
-    cap.release()
-
-    final = []
-    for e in events:
-        if (e["end_time"] - e["start_time"]) >= 0.2:
-            final.append(e)
-
-    merged = []
-    if final:
-        merged.append(final[0])
-        for e in final[1:]:
-            if (e["start_time"] - merged[-1]["end_time"]) <= MERGE_GAP:
-                if e["peak_score"] > merged[-1]["peak_score"]:
-                    merged[-1]["peak_score"] = e["peak_score"]
-                    merged[-1]["peak_time"]  = e["peak_time"]
-                    merged[-1]["where"]      = e["where"]
-                    merged[-1]["max_box_height_norm"] = e["max_box_height_norm"]
-                merged[-1]["end_time"] = e["end_time"]
-            else:
-                merged.append(e)
-
-    return {"close_encounters": merged, "event_count": len(merged)}
+def run_close_encounters(video_path: str) -> Dict[str, Any]:
+    if not _HAS_YOLO:
+        return {"close_encounters": [], "event_count": 0, "note": "ultralytics not installed"}
+    analyzer = CloseEncounterAnalyzer(batch_size=INFERENCE_BATCH_SIZE, max_latency_ms=INFERENCE_MAX_LATENCY_MS,
+                                      engine=INFERENCE_ENGINE, roi_min_object_px=INFERENCE_ROI)
+    return run_frame_pipeline(video_path, [analyzer])[analyzer.name]
 
 # ===================== TURN COUNT (ORB features) =====================
 TARGET_WIDTH_TURN = 480
@@ -439,106 +603,138 @@ def _rot_from_affine(M):
     a, b = M[0,0], M[0,1]
     return atan2(b, a)
 
-def run_turn_count(video_path: str) -> Dict[str, Any]:
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened(): return {"turn_count": 0, "left": 0, "right": 0}
-    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
-    step = max(1, int(round(fps / PROCESS_HZ_TURN)))
-    ok, frame = cap.read()
-    if not ok:
-        cap.release()
-        return {"turn_count": 0, "left": 0, "right": 0}
-    g0 = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    h0, w0 = g0.shape
-    s = TARGET_WIDTH_TURN/float(w0)
-    g0 = cv2.resize(g0, (TARGET_WIDTH_TURN, int(h0*s)), interpolation=cv2.INTER_AREA)
-    H0, W0 = g0.shape
-    y0 = int(H0 * ROI_Y0_FRAC_TURN)
-    roi0 = g0[y0:, :]
-
-    orb = cv2.ORB_create(nfeatures=ORB_FEATURES, fastThreshold=10, edgeThreshold=15)
-    bf  = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=False)
-
-    kp0, des0 = orb.detectAndCompute(roi0, None)
-    times, angles_deg = [], []
-    frame_idx = 0; t_idx = 0
-
-    while True:
-        ok, frame = cap.read()
-        if not ok: break
-        frame_idx += 1
-        if frame_idx % step != 0: continue
-        g1 = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        gh, gw = g1.shape
-        s = TARGET_WIDTH_TURN/float(gw)
-        g1 = cv2.resize(g1, (TARGET_WIDTH_TURN, int(gh*s)), interpolation=cv2.INTER_AREA)
-        roi1 = g1[y0:, :]
-        kp1, des1 = orb.detectAndCompute(roi1, None)
+class TurnCountAnalyzer(FrameAnalyzer):
+    name = "turn_changes_orb"
+    max_width = TARGET_WIDTH_TURN
+    splittable = True
+
+    def __init__(self, ego: EgoMotionEstimator = None):
+        super().__init__()
+        # With a shared estimator, yaw comes from its affine fit instead of ORB
+        self.ego = ego
+
+    def cache_params(self):
+        return {"ego_motion": self.ego is not None}
+
+    def init(self, meta):
+        super().init(meta)
+        self.fps = meta.fps
+        self.step = max(1, int(round(self.fps / PROCESS_HZ_TURN)))
+        if self.ego is not None:
+            self.step = self.ego.init(meta)
+            self.max_width = self.ego.width
+        self.orb = cv2.ORB_create(nfeatures=ORB_FEATURES, fastThreshold=10, edgeThreshold=15)
+        self.bf  = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=False)
+        self.started = False
+        self.times, self.angles_deg = [], []
+        self.t_idx = 0
+        self.omega_s = self.heading = None
+
+    def on_frame(self, idx, frame):
+        if self.ego is not None:
+            motion = self.ego.motion(idx, frame)
+            if motion is not None and motion.yaw_deg is not None:
+                self._add_angle(motion.yaw_deg)
+            return
+        if not self.started:
+            g0 = frame.gray(TARGET_WIDTH_TURN)
+            H0, W0 = g0.shape
+            self.y0 = int(H0 * ROI_Y0_FRAC_TURN)
+            roi0 = g0[self.y0:, :]
+            self.kp0, self.des0 = self.orb.detectAndCompute(roi0, None)
+            self.started = True
+            return
+
+        g1 = frame.gray(TARGET_WIDTH_TURN)
+        roi1 = g1[self.y0:, :]
+        kp0, des0 = self.kp0, self.des0
+        kp1, des1 = self.orb.detectAndCompute(roi1, None)
+        self.kp0, self.des0 = kp1, des1
         if des0 is None or des1 is None or len(kp0) < 6 or len(kp1) < 6:
-            kp0, des0 = kp1, des1
-            continue
-        matches = bf.knnMatch(des0, des1, k=2)
+            return
+        matches = self.bf.knnMatch(des0, des1, k=2)
         good = []
         for m,n in matches:
             if m.distance < 0.75 * n.distance:
                 good.append((m.queryIdx, m.trainIdx))
         if len(good) < 6:
-            kp0, des0 = kp1, des1
-            continue
+            return
         pts0 = np.float32([kp0[i].pt for i,_ in good]).reshape(-1,1,2)
         pts1 = np.float32([kp1[j].pt for _,j in good]).reshape(-1,1,2)
         M, _ = cv2.estimateAffinePartial2D(pts0, pts1, method=cv2.RANSAC,
                                            ransacReprojThreshold=RANSAC_THRESH, maxIters=RANSAC_ITERS, confidence=0.99)
         if M is not None:
-            theta = _rot_from_affine(M)
-            angles_deg.append(degrees(theta))
-            t_idx += step
-            times.append(t_idx / fps)
-        kp0, des0 = kp1, des1
+            self._add_angle(degrees(_rot_from_affine(M)))
+
+    def _add_angle(self, angle_deg):
+        self.angles_deg.append(angle_deg)
+        self.t_idx += self.step
+        self.times.append(self.t_idx / self.fps)
+
+    def export_segment(self):
+        return self.angles_deg
+
+    def absorb_segment(self, part):
+        for angle_deg in part:
+            self._add_angle(angle_deg)
+
+    def finalize(self):
+        times, angles_deg = self.times, self.angles_deg
+        if len(angles_deg) < 3:
+            return {"turn_count": 0, "left": 0, "right": 0}
+
+        eff_hz = self.fps / self.step
+        omega = np.array(angles_deg) * eff_hz
+        omega_s = _median_filter(omega, SMOOTH_WIN)
+        heading = np.cumsum(omega_s / eff_hz)
+        self.omega_s, self.heading = omega_s, heading
+
+        state = "idle"
+        arm = deque(maxlen=ARM_FRAMES)
+        rel = deque(maxlen=RELEASE_FRAMES)
+        start_i = None
+        start_heading = None
+        direction = None
+        events = []
+
+        for i in range(len(times)):
+            w = omega_s[i]
+            turning_now = abs(w) >= OMEGA_THRESH_DPS
+            arm.append(turning_now)
+            if state == "idle":
+                if len(arm) == ARM_FRAMES and all(arm):
+                    direction = "right" if np.median(omega_s[i-ARM_FRAMES+1:i+1]) >= 0 else "left"
+                    start_i = i - ARM_FRAMES + 1
+                    start_heading = heading[start_i]
+                    state = "turning"
+                    rel.clear()
+            else:
+                same_dir = (direction == ("right" if w >= 0 else "left"))
+                rel.append((not turning_now) or (not same_dir))
+                delta = (heading[i] - start_heading) * (1 if direction=="right" else -1)
+                long_enough = (times[i] - times[start_i]) >= MIN_TURN_SEC
+                if (len(rel) == RELEASE_FRAMES and all(rel)) or (delta >= ANGLE_THRESH_DEG and long_enough):
+                    events.append(direction)
+                    state = "idle"; arm.clear(); rel.clear()
+                    start_i = None; start_heading = None; direction = None
+
+        left_count  = sum(1 for e in events if e == "left")
+        right_count = sum(1 for e in events if e == "right")
+        total_count = len(events)
+        return {"turn_count": int(total_count), "left": int(left_count), "right": int(right_count)}
+
+    def timeseries(self):
+        if self.omega_s is None:
+            return {}
+        return {"t": self.times, "omega_s": self.omega_s, "heading": self.heading}
 
-    cap.release()
-    if len(angles_deg) < 3:
+def run_turn_count(video_path: str) -> Dict[str, Any]:
+    analyzer = TurnCountAnalyzer()
+    try:
+        return run_frame_pipeline(video_path, [analyzer])[analyzer.name]
+    except VideoOpenError:
         return {"turn_count": 0, "left": 0, "right": 0}
 
-    eff_hz = fps / step
-    omega = np.array(angles_deg) * eff_hz
-    omega_s = _median_filter(omega, SMOOTH_WIN)
-    heading = np.cumsum(omega_s / eff_hz)
-
-    state = "idle"
-    arm = deque(maxlen=ARM_FRAMES)
-    rel = deque(maxlen=RELEASE_FRAMES)
-    start_i = None
-    start_heading = None
-    direction = None
-    events = []
-
-    for i in range(len(times)):
-        w = omega_s[i]
-        turning_now = abs(w) >= OMEGA_THRESH_DPS
-        arm.append(turning_now)
-        if state == "idle":
-            if len(arm) == ARM_FRAMES and all(arm):
-                direction = "right" if np.median(omega_s[i-ARM_FRAMES+1:i+1]) >= 0 else "left"
-                start_i = i - ARM_FRAMES + 1
-                start_heading = heading[start_i]
-                state = "turning"
-                rel.clear()
-        else:
-            same_dir = (direction == ("right" if w >= 0 else "left"))
-            rel.append((not turning_now) or (not same_dir))
-            delta = (heading[i] - start_heading) * (1 if direction=="right" else -1)
-            long_enough = (times[i] - times[start_i]) >= MIN_TURN_SEC
-            if (len(rel) == RELEASE_FRAMES and all(rel)) or (delta >= ANGLE_THRESH_DEG and long_enough):
-                events.append(direction)
-                state = "idle"; arm.clear(); rel.clear()
-                start_i = None; start_heading = None; direction = None
-
-    left_count  = sum(1 for e in events if e == "left")
-    right_count = sum(1 for e in events if e == "right")
-    total_count = len(events)
-    return {"turn_count": int(total_count), "left": int(left_count), "right": int(right_count)}
-
 # ===================== LANE-CHANGE COUNT (flow proxy) =====================
 # Configured to detect lane changes with moderate sensitivity
 TARGET_W_LC    = 320
@@ -551,110 +747,147 @@ ENTER_THR_LC   = 0.50       # Moderate lateral movement required (reduced from 0
 EXIT_THR_LC    = 0.30       # Maintain threshold (reduced from 0.40)
 MIN_TURN_SEC_LC= 1.0        # Lane change duration (reduced from 2.0 seconds)
 
-def run_lane_change_count(video_path: str) -> Dict[str, Any]:
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        return {"turn_count": 0, "left": 0, "right": 0}
-
-    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
-    step = max(1, int(round(fps / PROCESS_HZ_LC)))
-
-    ok, f0 = cap.read()
-    if not ok:
-        cap.release()
-        return {"turn_count": 0, "left": 0, "right": 0}
-
-    g0 = cv2.cvtColor(f0, cv2.COLOR_BGR2GRAY)
-    h0, w0 = g0.shape
-    s = TARGET_W_LC / float(w0)
-    g0 = cv2.resize(g0, (TARGET_W_LC, int(h0 * s)), interpolation=cv2.INTER_AREA)
-
-    H, W = g0.shape
-    y0 = int(H * ROI_Y0_FRAC_LC)
-    y1 = int(H * ROI_Y1_FRAC_LC)
-    prev = g0[y0:y1, :]
-
-    ema = 0.0
-    turning = False
-    turn_dir = 0
-    right_count = 0
-    left_count = 0
-    frames_in_turn = 0
-    frame_idx = 0
-
-    while True:
-        ok, frame = cap.read()
-        if not ok:
-            break
-        frame_idx += 1
-        if frame_idx % step != 0:
-            continue
-
-        g = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        gh, gw = g.shape
-        s = TARGET_W_LC / float(gw)
-        g = cv2.resize(g, (TARGET_W_LC, int(gh * s)), interpolation=cv2.INTER_AREA)
-        cur = g[y0:y1, :]
-
-        flow = cv2.calcOpticalFlowFarneback(prev, cur, None,
-                                            0.5, 2, 21, 2, 5, 1.1, 0)
-        u = flow[..., 0]
-        v = flow[..., 1]
-        mag = np.hypot(u, v)
-        m = mag > MAG_THRESH_LC
-        
-        # Relaxed validation for better lane change detection
-        if np.any(m):
-            motion_coverage = np.sum(m) / m.size  # Percentage of pixels with strong motion
-            mean_horizontal = np.mean(u[m])
-            mean_vertical = np.abs(np.mean(v[m]))
-            
-            # Relaxed criteria: detect more lane changes
-            # 1. Motion covers at least 10% of ROI (reduced from 25%)
-            # 2. Horizontal movement is dominant (at least 1.2x vertical, reduced from 2.0x)
-            # 3. Horizontal movement is moderate (>0.8 pixels, reduced from 1.5)
-            if motion_coverage > 0.10 and abs(mean_horizontal) > mean_vertical * 1.2 and abs(mean_horizontal) > 0.8:
-                score = mean_horizontal / (mean_vertical + 1e-6)
+def _lateral_score(u, v):
+    """Signed lateral-motion score of one sample from its flow vectors (0 = none)"""
+    mag = np.hypot(u, v)
+    m = mag > MAG_THRESH_LC
+
+    # Relaxed validation for better lane change detection
+    if np.any(m):
+        motion_coverage = np.sum(m) / m.size  # Percentage of pixels with strong motion
+        mean_horizontal = np.mean(u[m])
+        mean_vertical = np.abs(np.mean(v[m]))
+
+        # Relaxed criteria: detect more lane changes
+        # 1. Motion covers at least 10% of ROI (reduced from 25%)
+        # 2. Horizontal movement is dominant (at least 1.2x vertical, reduced from 2.0x)
+        # 3. Horizontal movement is moderate (>0.8 pixels, reduced from 1.5)
+        if motion_coverage > 0.10 and abs(mean_horizontal) > mean_vertical * 1.2 and abs(mean_horizontal) > 0.8:
+            return mean_horizontal / (mean_vertical + 1e-6)
+    return 0.0
+
+class LaneChangeAnalyzer(FrameAnalyzer):
+    name = "lane_change_count"
+    max_width = TARGET_W_LC
+    splittable = True
+
+    def __init__(self, flow_engine="farneback", ego: EgoMotionEstimator = None):
+        super().__init__()
+        self.flow_engine = flow_engine
+        # With a shared estimator, lateral motion comes from its tracked points
+        self.ego = ego
+
+    def cache_params(self):
+        return {"flow_engine": self.flow_engine, "ego_motion": self.ego is not None}
+
+    def init(self, meta):
+        super().init(meta)
+        self.fps = meta.fps
+        self.flow = create_flow_engine(self.flow_engine, pyr_scale=0.5, levels=2, winsize=21,
+                                       iterations=2, poly_n=5, poly_sigma=1.1)
+        self.step = max(1, int(round(self.fps / PROCESS_HZ_LC)))
+        if self.ego is not None:
+            self.step = self.ego.init(meta)
+            self.max_width = self.ego.width
+        self.prev = None
+        self.ema = 0.0
+        self.turning = False
+        self.turn_dir = 0
+        self.right_count = 0
+        self.left_count = 0
+        self.frames_in_turn = 0
+        self.scores = []
+        self.score_times = []
+        self.emas = []
+
+    def _close_turn(self):
+        dur_sec = (self.frames_in_turn / (self.fps / self.step))
+        if dur_sec >= MIN_TURN_SEC_LC:
+            if self.turn_dir > 0:
+                self.right_count += 1
             else:
-                score = 0.0
-        else:
-            score = 0.0
-
-        ema = EMA_ALPHA_LC * score + (1.0 - EMA_ALPHA_LC) * ema
-        abs_ema = abs(ema)
-        dir_now = 1 if ema >= 0 else -1
-
-        if not turning:
+                self.left_count += 1
+
+    def on_frame(self, idx, frame):
+        if self.ego is not None:
+            self._on_motion(idx, self.ego.motion(idx, frame))
+            return
+        g = frame.gray(TARGET_W_LC)
+        if self.prev is None:
+            H, W = g.shape
+            self.y0 = int(H * ROI_Y0_FRAC_LC)
+            self.y1 = int(H * ROI_Y1_FRAC_LC)
+            self.prev = g[self.y0:self.y1, :]
+            return
+
+        cur = g[self.y0:self.y1, :]
+
+        flow = self.flow.vectors(self.prev, cur)
+        if flow is None or len(flow) == 0:
+            flow = np.zeros((1, 2), np.float32)
+        self.prev = cur
+        self._add_score(idx, _lateral_score(flow[:, 0], flow[:, 1]))
+
+    def _on_motion(self, idx, motion):
+        if motion is None:
+            return
+        # Points of the lane ROI, in TARGET_W_LC pixels per PROCESS_HZ_LC sample
+        # so MAG_THRESH_LC and the score gates keep their meaning
+        band = motion.band(ROI_Y0_FRAC_LC, ROI_Y1_FRAC_LC)
+        flow = motion.flow[band] * (TARGET_W_LC / float(self.meta.width) / PROCESS_HZ_LC)
+        if len(flow) == 0:
+            flow = np.zeros((1, 2), np.float32)
+        self._add_score(idx, _lateral_score(flow[:, 0], flow[:, 1]))
+
+    def _add_score(self, idx, score):
+        self.scores.append(score)
+        self.score_times.append(idx / self.fps)
+        self._update(score)
+
+    def _update(self, score):
+        self.ema = EMA_ALPHA_LC * score + (1.0 - EMA_ALPHA_LC) * self.ema
+        self.emas.append(self.ema)
+        abs_ema = abs(self.ema)
+        dir_now = 1 if self.ema >= 0 else -1
+
+        if not self.turning:
             if abs_ema >= ENTER_THR_LC:
-                turning = True
-                turn_dir = dir_now
-                frames_in_turn = 1
+                self.turning = True
+                self.turn_dir = dir_now
+                self.frames_in_turn = 1
         else:
-            if abs_ema >= EXIT_THR_LC and dir_now == turn_dir:
-                frames_in_turn += 1
-            else:
-                dur_sec = (frames_in_turn / (fps / step))
-                if dur_sec >= MIN_TURN_SEC_LC:
-                    if turn_dir > 0:
-                        right_count += 1
-                    else:
-                        left_count += 1
-                turning = False
-                turn_dir = 0
-                frames_in_turn = 0
-
-        prev = cur
-
-    if turning:
-        dur_sec = (frames_in_turn / (fps / step))
-        if dur_sec >= MIN_TURN_SEC_LC:
-            if turn_dir > 0:
-                right_count += 1
+            if abs_ema >= EXIT_THR_LC and dir_now == self.turn_dir:
+                self.frames_in_turn += 1
             else:
-                left_count += 1
+                self._close_turn()
+                self.turning = False
+                self.turn_dir = 0
+                self.frames_in_turn = 0
 
-    cap.release()
-    return {"turn_count": int(left_count + right_count), "left": int(left_count), "right": int(right_count)}
+    def export_segment(self):
+        return (self.score_times, self.scores)
+
+    def absorb_segment(self, part):
+        times, scores = part
+        self.score_times.extend(times)
+        for score in scores:
+            self._update(score)
+
+    def finalize(self):
+        if self.turning:
+            self._close_turn()
+        left_count, right_count = self.left_count, self.right_count
+        return {"turn_count": int(left_count + right_count), "left": int(left_count), "right": int(right_count)}
+
+    def timeseries(self):
+        return {"t": self.score_times, "ema": self.emas}
+
+def run_lane_change_count(video_path: str) -> Dict[str, Any]:
+    analyzer = LaneChangeAnalyzer()
+    try:
+        return run_frame_pipeline(video_path, [analyzer])[analyzer.name]
+    except VideoOpenError:
+        return {"turn_count": 0, "left": 0, "right": 0}
 
 # ===================== ILLEGAL WAY (bus-lane color) =====================
 ROI_WIDTH_FRAC  = 0.22
@@ -689,52 +922,90 @@ def _red_mask_hsv(bgr):
     mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, k, iterations=1)
     return mask
 
-def run_bus_lane_color(video_path: str) -> Dict[str, Any]:
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened(): return {"violation_detected": False, "violation_ranges": []}
-    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
-    w   = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    h   = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    x1, y1, x2, y2 = _get_roi_rect(h, w)
-    buffer = deque(maxlen=BUFFER_SIZE_FRAMES)
-    violation_active = False
-    ranges = []
-    frame_idx = 0
-
-    while True:
-        ret, frame = cap.read()
-        if not ret: break
-        frame_idx += 1
-
-        roi = frame[y1:y2, x1:x2]
+# Bus lane width; red coverage is a fraction of the ROI, checked to give the
+# same violation ranges as native frames on the bundled videos
+TARGET_W_BUS = 896
+
+class BusLaneAnalyzer(FrameAnalyzer):
+    name = "illegal_way_bus_lane"
+    max_width = TARGET_W_BUS
+    splittable = True
+    lead_in = 0       # frames are judged independently
+
+    def init(self, meta):
+        super().init(meta)
+        self.fps = meta.fps
+        self.buffer = deque(maxlen=BUFFER_SIZE_FRAMES)
+        self.violation_active = False
+        self.ranges = []
+        self.frame_idx = 0
+        self.first_idx = None
+        self.coverage = []
+
+    def on_frame(self, idx, frame):
+        image = frame.bgr(self.max_width)
+        x1, y1, x2, y2 = _get_roi_rect(*image.shape[:2])
+        roi = image[y1:y2, x1:x2]
         mask = _red_mask_hsv(roi)
         red_coverage = float(np.count_nonzero(mask)) / (mask.size + 1e-6)
 
         on_bus_lane = (red_coverage >= MIN_RED_COVERAGE)
+        if self.first_idx is None:
+            self.first_idx = idx
+        self.coverage.append(red_coverage)
+        self._update(idx, on_bus_lane)
+
+    def _update(self, idx, on_bus_lane):
+        buffer, ranges = self.buffer, self.ranges
+        self.frame_idx = frame_idx = idx + 1
         buffer.append(on_bus_lane)
 
-        if not violation_active and len(buffer) == BUFFER_SIZE_FRAMES and all(buffer):
-            start_t = frame_idx / fps
+        if not self.violation_active and len(buffer) == BUFFER_SIZE_FRAMES and all(buffer):
+            start_t = frame_idx / self.fps
             ranges.append({"start_time": start_t})
-            violation_active = True
+            self.violation_active = True
 
-        if violation_active and len(buffer) == BUFFER_SIZE_FRAMES and not any(buffer):
-            end_t = frame_idx / fps
+        if self.violation_active and len(buffer) == BUFFER_SIZE_FRAMES and not any(buffer):
+            end_t = frame_idx / self.fps
             if "end_time" not in ranges[-1]:
                 ranges[-1]["end_time"] = end_t
-            violation_active = False
+            self.violation_active = False
 
-    cap.release()
+    def export_segment(self):
+        return (self.first_idx, self.coverage)
+
+    def absorb_segment(self, part):
+        first_idx, coverage = part
+        if self.first_idx is None:
+            self.first_idx = first_idx
+        self.coverage.extend(coverage)
+        for k, red_coverage in enumerate(coverage):
+            self._update(first_idx + k, red_coverage >= MIN_RED_COVERAGE)
+
+    def finalize(self):
+        ranges = self.ranges
+        if self.violation_active and ranges and "end_time" not in ranges[-1]:
+            ranges[-1]["end_time"] = self.frame_idx / self.fps
 
-    if violation_active and ranges and "end_time" not in ranges[-1]:
-        ranges[-1]["end_time"] = frame_idx / fps
+        final = []
+        for r in ranges:
+            if "end_time" in r and (r["end_time"] - r["start_time"]) >= MIN_DURATION_SEC:
+                final.append({"start_time": round(r["start_time"], 2), "end_time": round(r["end_time"], 2)})
 
-    final = []
-    for r in ranges:
-        if "end_time" in r and (r["end_time"] - r["start_time"]) >= MIN_DURATION_SEC:
-            final.append({"start_time": round(r["start_time"], 2), "end_time": round(r["end_time"], 2)})
+        return {"violation_detected": bool(final), "violation_ranges": final}
 
-    return {"violation_detected": bool(final), "violation_ranges": final}
+    def timeseries(self):
+        # Every frame is sampled, so the coverage list runs on from first_idx
+        if self.first_idx is None:
+            return {}
+        return {"t": (self.first_idx + np.arange(len(self.coverage))) / self.fps, "red_coverage": self.coverage}
+
+def run_bus_lane_color(video_path: str) -> Dict[str, Any]:
+    analyzer = BusLaneAnalyzer()
+    try:
+        return run_frame_pipeline(video_path, [analyzer])[analyzer.name]
+    except VideoOpenError:
+        return {"violation_detected": False, "violation_ranges": []}
 
 # ===================== SAFETY VIOLATION (single number) =====================
 def compute_safety_violation(traffic_windows: List[Dict[str, float]], bus_ranges: List[Dict[str, float]], close_count: int) -> int:
@@ -751,8 +1022,139 @@ def compute_safety_violation(traffic_windows: List[Dict[str, float]], bus_ranges
     return int(tv + ilu)
 
 # ===================== RUN ALL + SAVE =====================
-def analyze_video(video_path: str, video_filename: str, calibrations: Dict[str, Any]) -> Dict[str, Any]:
-    """Analyze a single video and return results"""
+# Processes that analyze time segments of one video in parallel (1 = serial)
+SEGMENT_WORKERS = int(os.getenv("ANALYSIS_SEGMENT_WORKERS", "1"))
+
+def build_analyzers(video_path: str, calib: Dict[str, Any], use_enhanced_speed: bool,
+                    video_hash: str = None, skip: tuple = ()) -> List[FrameAnalyzer]:
+    """
+    Every analyzer behind one analysis result, so the video is decoded once.
+    Module-level so segment workers can rebuild the same set. With a
+    video_hash the detectors record / replay their detections; analyzers
+    named in `skip` (their section is cached) are left out.
+    """
+    detections = None
+    if video_hash is not None:
+        detections = DetectionCache(DETECTIONS_FOLDER, video_hash, {"video_backend": VIDEO_BACKEND})
+    ego = EgoMotionEstimator() if EGO_MOTION else None
+    # The calibrated speed analyzer always runs: it is either the primary
+    # method or the low-confidence fallback for the enhanced one.
+    analyzers = [
+        MetadataAnalyzer(),
+        AverageSpeedAnalyzer(
+            calib.get("meters_per_pixel", 0.05),
+            calib.get("roi_top", 0.6),
+            calib.get("roi_bottom", 0.9),
+            FLOW_ENGINES.get(AverageSpeedAnalyzer.name, "farneback")
+        ),
+    ]
+    if use_enhanced_speed:
+        analyzers.append(EnhancedSpeedDetector(video_path, ego))
+    analyzers.append(TrafficSignalAnalyzer())
+    # Detect close encounters - USE ENHANCED METHOD
+    if HAS_ENHANCED_PROXIMITY:
+        analyzers.append(EnhancedProximityDetector(video_path, MODEL_WEIGHTS, detections,
+                                                   INFERENCE_BATCH_SIZE, INFERENCE_MAX_LATENCY_MS, INFERENCE_ENGINE,
+                                                   INFERENCE_ROI))
+    else:
+        analyzers.append(CloseEncounterAnalyzer(detections=detections, batch_size=INFERENCE_BATCH_SIZE,
+                                                max_latency_ms=INFERENCE_MAX_LATENCY_MS, engine=INFERENCE_ENGINE,
+                                                roi_min_object_px=INFERENCE_ROI))
+    analyzers += [TurnCountAnalyzer(ego), LaneChangeAnalyzer(FLOW_ENGINES.get(LaneChangeAnalyzer.name, "farneback"), ego),
+                  BusLaneAnalyzer()]
+    return [a for a in analyzers if a.name not in skip]
+
+def preload_models():
+    """Load the detector analyze_video will use, for long-lived workers"""
+    if not _HAS_YOLO:
+        return
+    if HAS_ENHANCED_PROXIMITY:
+        load_proximity_model(MODEL_WEIGHTS)
+    else:
+        get_yolo(MODEL_WEIGHTS, get_device())
+
+RESULT_CACHE = ResultCache(CACHE_FOLDER)
+SECTION_CACHE = ResultCache(os.path.join(CACHE_FOLDER, "analyzers"))
+
+def _result_cache_key(video_hash: str, calib: Dict[str, Any], use_enhanced_speed: bool) -> str:
+    """Everything besides the code itself that changes what analyze_video returns"""
+    config = {
+        "calibration": calib,
+        "enhanced_speed": use_enhanced_speed,
+        "enhanced_proximity": HAS_ENHANCED_PROXIMITY,
+        "yolo": _HAS_YOLO,
+        "model": MODEL_NAME,
+        "model_weights": os.path.basename(MODEL_WEIGHTS),
+        "yolo_precision": YOLO_PRECISION,
+        "yolo_imgsz": YOLO_IMGSZ,
+        "video_backend": VIDEO_BACKEND,
+        "segment_workers": SEGMENT_WORKERS,
+        "optical_flow": FLOW_ENGINES,
+        "ego_motion": EGO_MOTION,
+        "inference_batch_size": INFERENCE_BATCH_SIZE,
+        "inference_engine": INFERENCE_ENGINE,
+        "inference_roi": INFERENCE_ROI,
+        "speed_limit": ANALYSIS_CONFIG.get("speed_limit"),
+        "enhanced_features": ANALYSIS_CONFIG.get("enhanced_features"),
+    }
+    return cache_key(video_hash, config)
+
+def _run_analyzers(video_path: str, video_hash: str, build_args: tuple, stats: PipelineStats,
+                   want_series: bool = True):
+    """
+    Run the analyzers whose section is not cached yet and cache theirs.
+    Returns ({analyzer name: result}, [names served from the cache],
+    {analyzer name: timeseries}). Without want_series no timeseries are
+    collected (nor per-sample buffers kept).
+    """
+    analyzers = build_analyzers(*build_args)
+    results, keys, series = {}, {}, {}
+    if video_hash is not None:
+        context = {"video_backend": VIDEO_BACKEND, "segment_workers": SEGMENT_WORKERS}
+        for a in analyzers:
+            keys[a.name] = section_key(video_hash, a, context)
+            cached = SECTION_CACHE.get(keys[a.name])
+            if cached is None:
+                continue
+            cached_series = SECTION_CACHE.get_series(keys[a.name])
+            # A section computed without its timeseries re-runs when one is wanted
+            if want_series and cached_series is None and type(a).timeseries is not FrameAnalyzer.timeseries:
+                continue
+            results[a.name] = cached
+            series.update(cached_series or {})
+    cached_names = list(results)
+    pending = [a for a in analyzers if a.name not in results]
+    if cached_names:
+        print(f"⚡ Reusing cached sections: {', '.join(cached_names)}")
+    if not pending:
+        return results, cached_names, series
+
+    print("🎞️  Decoding once for all analyzers...")
+    computed_series = {} if want_series else None
+    if SEGMENT_WORKERS > 1:
+        computed = run_segmented_pipeline(video_path, build_analyzers, build_args + (tuple(cached_names),),
+                                          workers=SEGMENT_WORKERS, stats=stats, series=computed_series)
+    else:
+        computed = run_frame_pipeline(video_path, pending, stats=stats, series=computed_series)
+    pipeline = stats.as_dict()
+    print(f"   Read {pipeline['frames_read']} frames, skipped {pipeline['frames_grabbed']}, "
+          f"prefetch queue avg {pipeline['queue_depth_avg']}/{pipeline['prefetch_depth']}, "
+          f"stalls: decode {pipeline['decode_stall_sec']:.2f}s, analysis {pipeline['analysis_stall_sec']:.2f}s")
+    for name, section in computed.items():
+        if name in keys:
+            if computed_series and name in computed_series:
+                SECTION_CACHE.put_series(keys[name], {name: computed_series[name]})
+            SECTION_CACHE.put(keys[name], convert_to_python_types(section))
+    results.update(computed)
+    series.update(computed_series or {})
+    return results, cached_names, series
+
+def analyze_video(video_path: str, video_filename: str, calibrations: Dict[str, Any],
+                  timeseries_path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Analyze a single video and return results. With timeseries_path, the
+    analyzers' per-sample signals are also written there (see timeseries.py).
+    """
     print(f"\n{'='*60}")
     print(f"Analyzing: {video_filename}")
     print(f"{'='*60}")
@@ -764,71 +1166,99 @@ def analyze_video(video_path: str, video_filename: str, calibrations: Dict[str,
         "roi_bottom": 0.9
     })
     
-    # Get video metadata
-    cap = cv2.VideoCapture(video_path)
-    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
-    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    duration_seconds = frame_count / fps if fps > 0 else 0
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    cap.release()
-    
-    print(f"📹 Video Info: {width}x{height}, {fps:.1f} FPS, {duration_seconds:.1f}s duration")
-    
-    # Calculate average speed - USE ENHANCED METHOD or CALIBRATED METHOD
-    print("📊 Calculating average speed...")
-    
     # For videos with custom calibration, use calibrated method to respect settings
     videos_with_custom_calibration = ["Dashcam004.mp4", "speed-highway.mp4"]
     use_calibrated_method = (video_filename in videos_with_custom_calibration and calib.get("meters_per_pixel") is not None)
-    
-    if HAS_ENHANCED_SPEED and not use_calibrated_method:
+    use_enhanced_speed = HAS_ENHANCED_SPEED and not use_calibrated_method
+
+    # Identical bytes + config + code give an identical result
+    key = video_hash = None
+    if ANALYSIS_CACHE:
+        video_hash = hash_file(video_path)
+        key = _result_cache_key(video_hash, calib, use_enhanced_speed)
+        cached = RESULT_CACHE.get(key)
+        # Cached without timeseries: recompute (sections still come from the cache)
+        if cached is not None and timeseries_path and RESULT_CACHE.get_series(key) is None:
+            cached = None
+        if cached is not None:
+            cached["video_filename"] = video_filename
+            sections = cached.get("analysis_cache", {})
+            cached["analysis_cache"] = {
+                "result_cached": True,
+                "cached_sections": sections.get("cached_sections", []) + sections.get("computed_sections", []),
+                "computed_sections": [],
+            }
+            print(f"⚡ Same video analyzed before, using cached result ({key[:12]})")
+            if timeseries_path:
+                series = RESULT_CACHE.get_series(key)
+                if series is not None:
+                    save_timeseries(timeseries_path, series)
+                    print(f"💾 Saved timeseries: {timeseries_path}")
+            return cached
+
+    # Otherwise only the analyzers whose code or parameters changed re-run
+    stats = PipelineStats()
+    build_args = (video_path, calib, use_enhanced_speed, video_hash)
+    results, cached_sections, series = _run_analyzers(video_path, video_hash, build_args, stats,
+                                                      want_series=bool(timeseries_path))
+
+    video_metadata = results[MetadataAnalyzer.name]
+    resolution = video_metadata["resolution"]
+    print(f"📹 Video Info: {resolution['width']}x{resolution['height']}, {video_metadata['fps']:.1f} FPS, "
+          f"{video_metadata['duration_seconds']:.1f}s duration")
+
+    # Calculate average speed - USE ENHANCED METHOD or CALIBRATED METHOD
+    print("📊 Calculating average speed...")
+    calibrated_speed = results[AverageSpeedAnalyzer.name]["average_speed_kmph"]
+    speed_source = AverageSpeedAnalyzer.name
+    if use_enhanced_speed:
         print("   Using enhanced multi-method speed detection...")
-        speed_result = estimate_speed_multimethod(video_path)
+        speed_result = results[EnhancedSpeedDetector.name]
         avg_speed = speed_result.get('average_speed_kmh', 0.0)
         speed_confidence = speed_result.get('confidence', 0.0)
         print(f"   Average Speed: {avg_speed:.2f} km/h (confidence: {speed_confidence:.2f})")
-        if not speed_result.get('successful', False):
+        if speed_result.get('successful', False):
+            speed_source = EnhancedSpeedDetector.name
+        else:
             print("   ⚠️  Low confidence - falling back to standard method...")
-            avg_speed = calculate_average_speed(
-                video_path,
-                calib.get("meters_per_pixel", 0.05),
-                calib.get("roi_top", 0.6),
-                calib.get("roi_bottom", 0.9)
-            )
+            avg_speed = calibrated_speed
             print(f"   Fallback Speed: {avg_speed:.2f} km/h")
     else:
         if use_calibrated_method:
             print("   Using calibrated speed detection (custom calibration detected)...")
-        avg_speed = calculate_average_speed(
-            video_path,
-            calib.get("meters_per_pixel", 0.05),
-            calib.get("roi_top", 0.6),
-            calib.get("roi_bottom", 0.9)
-        )
+        avg_speed = calibrated_speed
         print(f"   Average Speed: {avg_speed:.2f} km/h")
-    
-    # Run all other analyses
+
+    # Per-second profile of the same speed signal, and the events derived from it
+    bins = results[speed_source].get("per_second", {})
+    # Enhanced speed: only the seconds within the range its estimate kept (see speed_profile.py)
+    bounds = results[speed_source].get("speed_bounds_kmh") if speed_source == EnhancedSpeedDetector.name else None
+    profile = speed_profile(bins.get("t", []), bins.get("speed_kmh", []), bins.get("confidence"),
+                            video_metadata["duration_seconds"], bounds)
+    profile["source"] = speed_source
+    events = speed_events(profile, ANALYSIS_CONFIG, video_metadata["fps"])
+    if events:
+        print(f"   Hard braking: {events.get('hard_braking', {}).get('count', 0)}, "
+              f"rapid acceleration: {events.get('rapid_acceleration', {}).get('count', 0)}, "
+              f"speeding: {events.get('speed_violation', {}).get('seconds_over_limit', 0)}s")
+
     print("🚦 Analyzing traffic signals...")
-    traffic_sig = run_traffic_signal_summary(video_path)
-    
-    # Detect close encounters - USE ENHANCED METHOD
+    traffic_sig = results[TrafficSignalAnalyzer.name]
+
     print("🚗 Detecting close encounters...")
+    close_enc = results[CloseEncounterAnalyzer.name]
     if HAS_ENHANCED_PROXIMITY:
         print("   Using enhanced proximity detection with distance estimation...")
-        close_enc = detect_close_encounters_enhanced(video_path, MODEL_WEIGHTS)
         print(f"   Found {close_enc.get('event_count', 0)} close encounters")
-    else:
-        close_enc = run_close_encounters(video_path)
-    
+
     print("🔄 Counting turns...")
-    turns_orb   = run_turn_count(video_path)
-    
+    turns_orb   = results[TurnCountAnalyzer.name]
+
     print("↔️  Detecting lane changes...")
-    lane_chg    = run_lane_change_count(video_path)
-    
+    lane_chg    = results[LaneChangeAnalyzer.name]
+
     print("🚌 Checking bus lane violations...")
-    bus_color   = run_bus_lane_color(video_path)
+    bus_color   = results[BusLaneAnalyzer.name]
 
     safety_violation = compute_safety_violation(
         traffic_windows=traffic_sig.get("traffic_violation_windows", []),
@@ -869,16 +1299,10 @@ def analyze_video(video_path: str, video_filename: str, calibrations: Dict[str,
 
     result = {
         "video_filename": video_filename,
-        "video_metadata": {
-            "duration_seconds": float(round(duration_seconds, 2)),
-            "fps": float(round(fps, 2)),
-            "frame_count": frame_count,
-            "resolution": {
-                "width": width,
-                "height": height
-            }
-        },
+        "video_metadata": video_metadata,
         "average_speed_kmph": float(round(avg_speed, 2)),
+        "speed_profile": profile,
+        "speed_events": events,
         "safety_violation": int(safety_violation),
         "traffic_signal_summary": convert_to_python_types(traffic_sig),
         "close_encounters": convert_to_python_types(close_enc),
@@ -894,14 +1318,67 @@ def analyze_video(video_path: str, video_filename: str, calibrations: Dict[str,
             "category_description": category['description'],
             "category_color": category['color'],
             "metrics_used": metrics
+        },
+        "analysis_cache": {
+            "result_cached": False,
+            "cached_sections": cached_sections,
+            "computed_sections": [name for name in results if name not in cached_sections],
         }
     }
     
+    if timeseries_path:
+        save_timeseries(timeseries_path, series)
+        print(f"💾 Saved timeseries: {timeseries_path}")
+    if key is not None:
+        if timeseries_path:
+            RESULT_CACHE.put_series(key, series)
+        RESULT_CACHE.put(key, convert_to_python_types(result))
     print(f"✅ Analysis complete for {video_filename}")
     return result
 
-def main_batch_process():
-    """Process all videos in the videos folder and create merged JSON"""
+def _init_batch_worker(threads: int):
+    """Process-pool initializer: keep each worker to its share of the cores"""
+    global SEGMENT_WORKERS
+    SEGMENT_WORKERS = 1  # videos are already analyzed in parallel
+    cv2.setNumThreads(threads)
+    set_torch_threads(threads)
+
+def _analyze_and_save(video_path: str, calibrations: Dict[str, Any]) -> Dict[str, Any]:
+    """Analyze one video and write its individual JSON; errors become a failed result"""
+    video_filename = os.path.basename(video_path)
+    try:
+        # Analyze the video; its timeseries land next to the JSON
+        os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+        stem = os.path.splitext(video_filename)[0]
+        result = analyze_video(video_path, video_filename, calibrations,
+                               os.path.join(OUTPUT_FOLDER, f"{stem}_timeseries.npz"))
+
+        # Convert numpy types to Python types
+        result = convert_to_python_types(result)
+
+        # Save individual JSON to outputs/analysis
+        individual_json = os.path.join(OUTPUT_FOLDER, f"{stem}_analysis.json")
+        with open(individual_json, "w") as f:
+            json.dump(result, f, indent=4)
+        print(f"💾 Saved individual analysis: {individual_json}")
+        return result
+
+    except Exception as e:
+        print(f"❌ Error processing {video_filename}: {str(e)}")
+        return {
+            "error": str(e),
+            "status": "failed"
+        }
+
+def main_batch_process(workers: int = 1):
+    """
+    Process all videos in the videos folder and create merged JSON.
+
+    With workers > 1 videos are analyzed concurrently in a process pool. Each
+    worker loads the YOLO model once and reuses it for every video it gets,
+    and OpenCV / torch are capped to cpu_count // workers threads each.
+    Individual JSONs are written as videos finish; the merged JSON at the end.
+    """
     print("\n" + "="*60)
     print("DriveGuard AI - Batch Video Analysis")
     print("="*60)
@@ -934,43 +1411,50 @@ def main_batch_process():
     
     # Process each video
     all_results = {}
-    for video_path in video_files:
-        video_filename = os.path.basename(video_path)
-        
-        try:
-            # Analyze the video
-            result = analyze_video(video_path, video_filename, calibrations)
-            
-            # Convert numpy types to Python types
-            result = convert_to_python_types(result)
-            
-            # Save individual JSON to outputs/analysis
-            os.makedirs(OUTPUT_FOLDER, exist_ok=True)
-            stem = os.path.splitext(video_filename)[0]
-            individual_json = os.path.join(OUTPUT_FOLDER, f"{stem}_analysis.json")
-            with open(individual_json, "w") as f:
-                json.dump(result, f, indent=4)
-            print(f"💾 Saved individual analysis: {individual_json}")
-            
-            # Add to merged results
-            all_results[video_filename] = result
-            
-        except Exception as e:
-            print(f"❌ Error processing {video_filename}: {str(e)}")
-            all_results[video_filename] = {
-                "error": str(e),
-                "status": "failed"
-            }
+    workers = max(1, min(workers, len(video_files)))
+    if workers == 1:
+        for video_path in video_files:
+            all_results[os.path.basename(video_path)] = _analyze_and_save(video_path, calibrations)
+        for m in model_metrics():
+            print(f"🧠 {m['weights']} ({m['device']}, {m['precision']}, {m['imgsz']}px): loaded once in "
+                  f"{m['load_sec']:.2f}s + {m['warmup_sec']:.2f}s warm-up, {m['weights_mb']} MB weights, "
+                  f"RSS +{m['rss_delta_mb']} MB, reused for {m['uses']} video(s)")
+    else:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        print(f"⚙️  Analyzing on {workers} worker processes ({threads} thread(s) each)")
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                                 initargs=(threads,)) as pool:
+            futures = {pool.submit(_analyze_and_save, video_path, calibrations): video_path
+                       for video_path in video_files}
+            for done, future in enumerate(as_completed(futures), 1):
+                video_filename = os.path.basename(futures[future])
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # The worker process itself died
+                    print(f"❌ Error processing {video_filename}: {str(e)}")
+                    result = {"error": str(e), "status": "failed"}
+                all_results[video_filename] = result
+                print(f"📦 [{done}/{len(video_files)}] Finished {video_filename}")
+        # Keep the merged JSON in discovery order, not completion order
+        all_results = {os.path.basename(p): all_results[os.path.basename(p)] for p in video_files}
     
     # Convert all results to Python types before saving
     all_results = convert_to_python_types(all_results)
     
-    # Save merged JSON
-    with open(MERGED_OUTPUT_JSON, "w") as f:
-        json.dump(all_results, f, indent=4)
+    # Upsert into the results store, then refresh the merged JSON export
+    store = ResultsStore()
+    for video_filename, result in all_results.items():
+        store.upsert(video_filename, result)
+    store.export_merged(MERGED_OUTPUT_JSON)
     print(f"\n✅ Merged analysis saved: {MERGED_OUTPUT_JSON}")
     print(f"📊 Successfully processed {len([r for r in all_results.values() if 'error' not in r])}/{len(video_files)} videos")
     print("="*60 + "\n")
 
 if __name__ == "__main__":
-    main_batch_process()
+    import argparse
+    parser = argparse.ArgumentParser(description="DriveGuard AI - Batch Video Analysis")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="videos analyzed concurrently in separate processes (default: 1)")
+    args = parser.parse_args()
+    main_batch_process(workers=args.workers)
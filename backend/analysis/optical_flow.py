@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Optical Flow Engines
+Interchangeable frame-to-frame motion estimators for DriveGuard AI
+
+The speed and lane-change analyzers only need motion vectors to take
+statistics over (percentiles, coverage, mean direction), so any of these
+engines can feed them:
+
+- farneback        dense cv2.calcOpticalFlowFarneback (the original method)
+- farneback_warm   Farneback seeded with the previous flow field
+                   (OPTFLOW_USE_INITIAL_FLOW); converges in fewer iterations
+                   on smooth dashcam motion
+- dis_ultrafast    dense cv2.DISOpticalFlow, ULTRAFAST preset
+- dis_fast         dense cv2.DISOpticalFlow, FAST preset
+- lk_grid          sparse pyramidal Lucas-Kanade on a regular point grid
+
+Dense engines return one vector per pixel, lk_grid one per tracked grid
+point, so coverage-style statistics become fractions of grid points.
+Engines are picked per analyzer in config/analysis_config.json
+("optical_flow"); utils/benchmark_flow.py compares their cost and results.
+"""
+
+import time
+import cv2
+import numpy as np
+from typing import Dict, Any, Optional
+
+FLOW_ENGINES = ("farneback", "farneback_warm", "dis_ultrafast", "dis_fast", "lk_grid")
+DEFAULT_FLOW_ENGINE = "farneback"
+
+# Farneback parameters used when an analyzer does not pass its own
+FARNEBACK_PARAMS = dict(pyr_scale=0.5, levels=3, winsize=15, iterations=3, poly_n=5, poly_sigma=1.2)
+
+# lk_grid: one point every LK_GRID_STEP pixels
+LK_GRID_STEP = 12
+LK_PARAMS = dict(winSize=(15, 15), maxLevel=3,
+                 criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+
+
+class FlowEngine:
+    """Estimates motion between two same-sized 8-bit gray images"""
+
+    name = "flow"
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+
+    def vectors(self, prev: np.ndarray, cur: np.ndarray) -> Optional[np.ndarray]:
+        """(N, 2) float32 array of (dx, dy) motion vectors, or None"""
+        start = time.perf_counter()
+        result = self._vectors(prev, cur)
+        self.seconds += time.perf_counter() - start
+        self.calls += 1
+        return result
+
+    def _vectors(self, prev: np.ndarray, cur: np.ndarray) -> Optional[np.ndarray]:
+        raise NotImplementedError
+
+    @property
+    def ms_per_frame(self) -> float:
+        return 1000.0 * self.seconds / self.calls if self.calls else 0.0
+
+
+class FarnebackFlow(FlowEngine):
+    name = "farneback"
+
+    def __init__(self, **params):
+        super().__init__()
+        self.params = dict(FARNEBACK_PARAMS, **params)
+
+    def _vectors(self, prev, cur):
+        flow = cv2.calcOpticalFlowFarneback(prev, cur, None, flags=0, **self.params)
+        return None if flow is None else flow.reshape(-1, 2)
+
+
+class WarmFarnebackFlow(FarnebackFlow):
+    """Farneback starting from the last field; only valid on consecutive frame pairs"""
+
+    name = "farneback_warm"
+
+    def __init__(self, **params):
+        super().__init__(**params)
+        self.prev_flow = None
+
+    def _vectors(self, prev, cur):
+        init = self.prev_flow
+        if init is not None and init.shape[:2] == prev.shape[:2]:
+            flow = cv2.calcOpticalFlowFarneback(prev, cur, init, flags=cv2.OPTFLOW_USE_INITIAL_FLOW,
+                                                **self.params)
+        else:
+            flow = cv2.calcOpticalFlowFarneback(prev, cur, None, flags=0, **self.params)
+        self.prev_flow = flow
+        return None if flow is None else flow.reshape(-1, 2)
+
+
+class DISFlow(FlowEngine):
+    def __init__(self, preset: int, name: str):
+        super().__init__()
+        self.preset = preset
+        self.name = name
+        self._dis = None  # created on first use; cv2 objects do not pickle
+
+    def _vectors(self, prev, cur):
+        if self._dis is None:
+            self._dis = cv2.DISOpticalFlow_create(self.preset)
+        flow = self._dis.calc(prev, cur, None)
+        return None if flow is None else flow.reshape(-1, 2)
+
+
+class GridLKFlow(FlowEngine):
+    name = "lk_grid"
+
+    def __init__(self, step: int = LK_GRID_STEP):
+        super().__init__()
+        self.step = step
+        self._grid = None
+
+    def _points(self, shape) -> np.ndarray:
+        if self._grid is None or self._grid[0] != shape:
+            h, w = shape
+            half = self.step // 2
+            ys, xs = np.mgrid[half:h:self.step, half:w:self.step]
+            pts = np.stack([xs.ravel(), ys.ravel()], axis=1).astype(np.float32).reshape(-1, 1, 2)
+            self._grid = (shape, pts)
+        return self._grid[1]
+
+    def _vectors(self, prev, cur):
+        p0 = self._points(prev.shape[:2])
+        if len(p0) == 0:
+            return None
+        p1, st, _ = cv2.calcOpticalFlowPyrLK(prev, cur, p0, None, **LK_PARAMS)
+        if p1 is None or st is None:
+            return None
+        ok = st.ravel() == 1
+        return (p1[ok] - p0[ok]).reshape(-1, 2)
+
+
+def create_flow_engine(name: Optional[str] = None, **farneback_params) -> FlowEngine:
+    """
+    Engine by name (see FLOW_ENGINES). `farneback_params` override
+    FARNEBACK_PARAMS for the Farneback engines and are ignored by the others.
+    """
+    name = name or DEFAULT_FLOW_ENGINE
+    if name == "farneback":
+        return FarnebackFlow(**farneback_params)
+    if name == "farneback_warm":
+        return WarmFarnebackFlow(**farneback_params)
+    if name == "dis_ultrafast":
+        return DISFlow(cv2.DISOPTICAL_FLOW_PRESET_ULTRAFAST, name)
+    if name == "dis_fast":
+        return DISFlow(cv2.DISOPTICAL_FLOW_PRESET_FAST, name)
+    if name == "lk_grid":
+        return GridLKFlow()
+    raise ValueError(f"Unknown optical flow engine '{name}' (choose from {', '.join(FLOW_ENGINES)})")
+
+
+def flow_engine_settings(config: Dict[str, Any]) -> Dict[str, str]:
+    """{analyzer name: engine name} from the "optical_flow" block of analysis_config.json"""
+    engines = dict(config.get("optical_flow") or {})
+    for analyzer, engine in engines.items():
+        if engine not in FLOW_ENGINES:
+            raise ValueError(f"Unknown optical flow engine '{engine}' for {analyzer} "
+                             f"(choose from {', '.join(FLOW_ENGINES)})")
+    return engines
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Result Cache
+Content-addressed cache of analysis results for DriveGuard AI
+
+Uploads get a fresh multer filename every time, so the same dashcam clip
+uploaded twice looks like a new video. Results are therefore keyed by what
+actually determines them:
+
+- a hash of the video bytes (streamed in chunks, so multi-GB files never
+  sit in memory)
+- the analysis config (calibration, enabled analyzers, model, decoder)
+- a fingerprint of the analysis source code, so editing an analyzer
+  invalidates every cached result
+
+Each analyzer's section is also cached on its own, keyed by the video hash
+and an analyzer fingerprint: the source of its class, the module constants
+and helper functions its methods use, every other analysis module those
+reach (source and public constants; IoUTracker, EgoMotionEstimator, the
+flow engines, the frame pipeline...), its cache_params() and version.
+Tuning one constant (say ENTER_THR_LC) then only re-runs the analyzer that
+reads it; the other sections come from the cache.
+
+Entries are JSON files under outputs/analysis/cache, each optionally with
+a companion .npz of the analyzers' timeseries (see timeseries.py). A hit
+refreshes the entry's mtime; when the cache grows past its size or entry
+budget the least recently used entries (and their companions) are evicted.
+"""
+
+import os
+import sys
+import json
+import glob
+import types
+import inspect
+import hashlib
+import tempfile
+from typing import Dict, Any, Optional, Tuple
+
+from timeseries import load_timeseries, save_timeseries
+
+ANALYSIS_CACHE = os.getenv("ANALYSIS_CACHE", "1") != "0"
+CACHE_MAX_MB = float(os.getenv("ANALYSIS_CACHE_MAX_MB", "256"))
+CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "1000"))
+
+HASH_CHUNK_BYTES = 1 << 20
+ANALYSIS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# (path, size, mtime_ns) -> digest, so re-analysing an unchanged file in the
+# same process (batch reruns, the analysis worker) does not re-read it
+_HASHES: Dict[Tuple[str, int, int], str] = {}
+_CODE_FINGERPRINT = None
+
+
+def hash_file(path: str, chunk_bytes: int = HASH_CHUNK_BYTES) -> str:
+    """BLAKE2b digest of a file, read in fixed-size chunks into one reused buffer"""
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    digest = _HASHES.get(memo_key)
+    if digest is None:
+        h = hashlib.blake2b(digest_size=20)
+        buf = bytearray(chunk_bytes)
+        view = memoryview(buf)
+        with open(path, "rb", buffering=0) as f:
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                h.update(view[:n])
+        digest = h.hexdigest()
+        _HASHES[memo_key] = digest
+    return digest
+
+
+def code_fingerprint() -> str:
+    """Hash of the analysis modules' source, computed once per process"""
+    global _CODE_FINGERPRINT
+    if _CODE_FINGERPRINT is None:
+        h = hashlib.blake2b(digest_size=12)
+        for path in sorted(glob.glob(os.path.join(ANALYSIS_DIR, "*.py"))):
+            h.update(os.path.basename(path).encode())
+            with open(path, "rb") as f:
+                h.update(f.read())
+        _CODE_FINGERPRINT = h.hexdigest()
+    return _CODE_FINGERPRINT
+
+
+def cache_key(video_hash: str, config: Dict[str, Any]) -> str:
+    """Key for one (video content, analysis config, code version) combination"""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(video_hash.encode())
+    h.update(json.dumps(config, sort_keys=True, default=str).encode())
+    h.update(code_fingerprint().encode())
+    return h.hexdigest()
+
+
+def _code_objects(code: types.CodeType):
+    yield code
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            yield from _code_objects(const)
+
+
+def _constant_repr(value) -> Optional[str]:
+    """Stable repr of a plain-data module constant, None for anything else"""
+    if isinstance(value, (set, frozenset)):
+        return repr(sorted(value, key=repr))
+    if value is None or isinstance(value, (bool, int, float, str, tuple, list, dict)):
+        return repr(value)
+    return None
+
+
+def _analysis_module(value) -> Optional[types.ModuleType]:
+    """The analysis/*.py module a module, class or function comes from, else None"""
+    if inspect.ismodule(value):
+        module = value
+    elif inspect.isfunction(value) or inspect.isclass(value):
+        module = sys.modules.get(value.__module__)
+    else:
+        return None
+    path = getattr(module, "__file__", None)
+    return module if path and os.path.dirname(os.path.abspath(path)) == ANALYSIS_DIR else None
+
+
+def _hash_module(module: types.ModuleType, h, seen: set):
+    """Hash a whole analysis module: its source, its public constants and the analysis modules it uses"""
+    if id(module) in seen:
+        return
+    seen.add(id(module))
+    with open(module.__file__, "rb") as f:
+        h.update(f.read())
+    # Private globals are caches and other per-process state
+    for name, value in sorted(vars(module).items()):
+        if name.startswith("_"):
+            continue
+        dep = _analysis_module(value)
+        if dep is not None:
+            if dep is not module:
+                _hash_module(dep, h, seen)
+            continue
+        text = _constant_repr(value)
+        if text is not None:
+            h.update(f"{name}={text}".encode())
+
+
+def _hash_definition(obj, h, seen: set):
+    """
+    Hash a class or function's source plus the same-module globals it uses.
+    Anything it uses from another analysis module brings in that whole
+    module (see _hash_module).
+    """
+    if id(obj) in seen:
+        return
+    seen.add(id(obj))
+    try:
+        h.update(inspect.getsource(obj).encode())
+    except (OSError, TypeError):
+        h.update(obj.__qualname__.encode())
+
+    module = sys.modules.get(obj.__module__)
+    namespace = vars(module) if module is not None else {}
+    if inspect.isclass(obj):
+        members = [getattr(v, "__func__", v) for v in vars(obj).values()]
+        funcs = [f for f in members if inspect.isfunction(f)]
+    else:
+        funcs = [obj]
+    for func in funcs:
+        for code in _code_objects(func.__code__):
+            for name in code.co_names:
+                if name not in namespace:
+                    continue
+                value = namespace[name]
+                dep = _analysis_module(value)
+                if dep is not None and dep is module and not inspect.ismodule(value):
+                    _hash_definition(value, h, seen)
+                    continue
+                if dep is not None:
+                    _hash_module(dep, h, seen)
+                    continue
+                text = _constant_repr(value)
+                if text is not None:
+                    h.update(f"{name}={text}".encode())
+
+
+def analyzer_fingerprint(analyzer) -> str:
+    """Hash of everything besides the video that determines an analyzer's result"""
+    h = hashlib.blake2b(digest_size=12)
+    seen = set()
+    home = sys.modules.get(type(analyzer).__module__)
+    for cls in type(analyzer).__mro__[:-1]:  # skip object
+        dep = _analysis_module(cls)
+        if dep is not None and dep is not home:
+            # Base classes elsewhere (FrameAnalyzer): the whole module, which
+            # also brings in the frames they are fed (video_source)
+            _hash_module(dep, h, seen)
+        else:
+            _hash_definition(cls, h, seen)
+    # Collaborators handed in at construction (the shared EgoMotionEstimator,
+    # BatchedDetector...)
+    for _, value in sorted(vars(analyzer).items()):
+        dep = _analysis_module(type(value))
+        if dep is not None:
+            _hash_module(dep, h, seen)
+    params = {"params": analyzer.cache_params(), "version": analyzer.version}
+    h.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+def section_key(video_hash: str, analyzer, context: Dict[str, Any]) -> str:
+    """Key for one analyzer's result on one video; `context` is shared decode settings"""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(video_hash.encode())
+    h.update(analyzer.name.encode())
+    h.update(analyzer_fingerprint(analyzer).encode())
+    h.update(json.dumps(context, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+class ResultCache:
+    """LRU, size-bounded store of result dicts, one JSON file per key"""
+
+    def __init__(self, folder: str, max_mb: float = CACHE_MAX_MB, max_entries: int = CACHE_MAX_ENTRIES):
+        self.folder = folder
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_entries = max_entries
+
+    def _path(self, key: str, ext: str = ".json") -> str:
+        return os.path.join(self.folder, f"{key}{ext}")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+        return result
+
+    def put(self, key: str, result: Dict[str, Any]):
+        """Store a JSON-serializable result, then evict down to the budget"""
+        os.makedirs(self.folder, exist_ok=True)
+        # Write then rename, so concurrent batch workers never read half a file
+        fd, tmp = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(result, f)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        self.evict()
+
+    def get_series(self, key: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Timeseries stored with an entry by put_series(), or None"""
+        return load_timeseries(self._path(key, ".npz"))
+
+    def put_series(self, key: str, series: Dict[str, Dict[str, Any]]):
+        """Store timeseries next to entry `key`; call before put() so eviction counts them"""
+        save_timeseries(self._path(key, ".npz"), series)
+
+    def evict(self):
+        """Drop least recently used entries until within max_mb and max_entries"""
+        evict_lru(self.folder, "*.json", self.max_bytes, self.max_entries, companions=(".npz",))
+
+
+def evict_lru(folder: str, pattern: str, max_bytes: int, max_entries: int, companions: Tuple[str, ...] = ()):
+    """
+    Delete the oldest-mtime files matching `pattern` until within both
+    budgets. Files with the same stem and a `companions` extension count
+    towards their entry's size and are deleted with it.
+    """
+    entries = []
+    for path in glob.glob(os.path.join(folder, pattern)):
+        paths = [path] + [os.path.splitext(path)[0] + ext for ext in companions]
+        paths = [p for p in paths if p == path or os.path.exists(p)]
+        try:
+            st = os.stat(path)
+            size = sum(os.path.getsize(p) for p in paths)
+        except OSError:
+            continue  # evicted by another process meanwhile
+        entries.append((st.st_mtime, size, paths))
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    while entries and (total > max_bytes or len(entries) > max_entries):
+        _, size, paths = entries.pop(0)
+        for path in paths:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        total -= size
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Results Store
+Indexed SQLite store of analysis results for DriveGuard AI
+
+merged_output_analysis.json used to be the source of truth: every finished
+job read the whole file, added one key and rewrote it, so the cost grew with
+the number of videos and concurrent jobs could drop each other's results.
+Results now live in one row per video in an SQLite database (WAL mode, so
+readers never block the writer), upserted in O(1) and indexed by filename
+and user.
+
+The legacy merged JSON is only materialized by export_merged, once per
+finished job (run_analysis_job in analysis_worker.py) or batch run, so the
+servers serve /api/merged-analysis as a plain file read; an export is
+skipped when no row changed since the last one. Every upsert takes the next row version
+(writers are serialized, so versions follow commit order); an export reads
+its rows and their highest version from one snapshot and records that
+version in the meta table, so a row upserted mid-export is picked up by the
+next one. On first use an existing merged JSON is
+imported so no history is lost.
+
+Usage:
+    python3 results_store.py export [--output PATH] [--force]
+    python3 results_store.py get <video_filename>
+    python3 results_store.py user <email>
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import tempfile
+import threading
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OUTPUT_FOLDER = os.path.join(BASE_DIR, "outputs", "analysis")
+RESULTS_DB = os.getenv("RESULTS_DB", os.path.join(OUTPUT_FOLDER, "results.db"))
+MERGED_OUTPUT_JSON = os.path.join(OUTPUT_FOLDER, "merged_output_analysis.json")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    video_filename TEXT PRIMARY KEY,
+    user_email     TEXT,
+    result         TEXT NOT NULL,
+    created_at     REAL NOT NULL,
+    updated_at     REAL NOT NULL,
+    version        INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS results_by_user ON results (user_email, updated_at);
+CREATE INDEX IF NOT EXISTS results_by_update ON results (updated_at);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class ResultsStore:
+    """One row per analyzed video; safe to share between threads and processes"""
+
+    def __init__(self, db_path: str = RESULTS_DB, legacy_json: Optional[str] = MERGED_OUTPUT_JSON):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+            # Databases from before row versions
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(results)")]
+            if "version" not in columns:
+                conn.execute("ALTER TABLE results ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS results_by_version ON results (version)")
+        if legacy_json and self.count() == 0 and os.path.exists(legacy_json):
+            imported = self.import_merged(legacy_json)
+            print(f"📥 Imported {imported} result(s) from {os.path.basename(legacy_json)}")
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections are per thread (the analysis worker is threaded)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def upsert(self, video_filename: str, result: Dict[str, Any], user_email: Optional[str] = None):
+        """Insert or replace one video's result (keeps its owner if none is given)"""
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                """INSERT INTO results (video_filename, user_email, result, created_at, updated_at, version)
+                   VALUES (?, ?, ?, ?, ?, (SELECT COALESCE(MAX(version), 0) + 1 FROM results))
+                   ON CONFLICT (video_filename) DO UPDATE SET
+                       result = excluded.result,
+                       user_email = COALESCE(excluded.user_email, results.user_email),
+                       updated_at = excluded.updated_at,
+                       version = excluded.version""",
+                (video_filename, user_email, json.dumps(result), now, now))
+
+    def get(self, video_filename: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT result FROM results WHERE video_filename = ?",
+                                   (video_filename,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def for_user(self, user_email: str) -> List[Tuple[str, Dict[str, Any]]]:
+        """(video_filename, result) of one user's videos, newest first"""
+        rows = self._conn().execute(
+            "SELECT video_filename, result FROM results WHERE user_email = ? ORDER BY updated_at DESC",
+            (user_email,))
+        return [(name, json.loads(result)) for name, result in rows]
+
+    def items(self) -> Iterator[Tuple[str, str]]:
+        """(video_filename, result JSON text) in first-analyzed order"""
+        return iter(self._conn().execute("SELECT video_filename, result FROM results ORDER BY rowid"))
+
+    def version(self) -> int:
+        """Version of the latest upsert (0 for an empty store)"""
+        return self._conn().execute("SELECT COALESCE(MAX(version), 0) FROM results").fetchone()[0]
+
+    def _exported_version(self, path: str) -> int:
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?",
+                                   (f"export:{os.path.abspath(path)}",)).fetchone()
+        return int(row[0]) if row else -1
+
+    def import_merged(self, path: str) -> int:
+        with open(path, "r") as f:
+            merged = json.load(f)
+        for video_filename, result in merged.items():
+            self.upsert(video_filename, result)
+        return len(merged)
+
+    def export_merged(self, path: str = MERGED_OUTPUT_JSON, force: bool = False) -> bool:
+        """
+        Write the legacy {video_filename: result} JSON (same layout as
+        json.dump(indent=4)). Returns False when the file was already current.
+        """
+        if not force and os.path.exists(path) and self._exported_version(path) >= self.version():
+            return False
+        conn = self._conn()
+        folder = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(dir=folder, suffix=".tmp")
+        try:
+            # One read transaction: the rows and their version are one snapshot
+            conn.execute("BEGIN")
+            try:
+                version = self.version()
+                with os.fdopen(fd, "w") as f:
+                    # One row at a time, so the export never holds every result
+                    f.write("{")
+                    n = 0
+                    for n, (video_filename, result) in enumerate(self.items(), 1):
+                        body = json.dumps(json.loads(result), indent=4).replace("\n", "\n    ")
+                        f.write(f"{',' if n > 1 else ''}\n    {json.dumps(video_filename)}: {body}")
+                    f.write("\n}" if n else "}")
+            finally:
+                conn.rollback()
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                         (f"export:{os.path.abspath(path)}", str(version)))
+        return True
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="DriveGuard AI - Results Store")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="materialize merged_output_analysis.json")
+    export.add_argument("--output", default=MERGED_OUTPUT_JSON)
+    export.add_argument("--force", action="store_true", help="rewrite even if already current")
+    sub.add_parser("get", help="print one video's result").add_argument("video_filename")
+    sub.add_parser("user", help="print one user's results").add_argument("email")
+    args = parser.parse_args()
+
+    store = ResultsStore()
+    if args.command == "export":
+        written = store.export_merged(args.output, args.force)
+        print(f"✅ Exported {store.count()} result(s) to {args.output}" if written
+              else f"✅ {args.output} is up to date")
+    elif args.command == "get":
+        result = store.get(args.video_filename)
+        if result is None:
+            print(f"❌ No result for {args.video_filename}")
+            sys.exit(1)
+        print(json.dumps(result, indent=4))
+    else:
+        print(json.dumps(dict(store.for_user(args.email)), indent=4))
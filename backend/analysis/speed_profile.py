@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Speed Profile
+Per-second speed and confidence of a video, and the speed events derived from it
+
+analyze_video used to report a single average speed, although the speed
+analyzers measure speed many times per second in the same decode pass (see
+timeseries.py). Their samples are binned into one value per second:
+
+    speed_kmh    median measured speed of that second, null for seconds
+                 without a measurement (gaps are not interpolated: a
+                 straight line across them would read as a steady
+                 acceleration that was never measured)
+    confidence   mean sample confidence of that second (1.0 for analyzers
+                 that report none), 0 for unmeasured seconds
+
+Samples outside `bounds` (the range EnhancedSpeedDetector's estimate was
+taken from: 3 km/h up to its IQR fences) are dropped first, so a burst of
+rejected outliers cannot read as an acceleration.
+
+The speed analyzers do not keep their raw samples unless timeseries are
+collected; they stream them into SecondBins instead (one median and mean
+confidence per second, a few floats per second of video) and report those
+in their result as "per_second". speed_profile() takes either; given
+per-second bins, `bounds` drops whole seconds whose median is outside it.
+
+The enhanced_features of config/analysis_config.json are then single O(n)
+passes over those arrays:
+
+    aggressive_driving_detection   speed change over time_window_frames at
+                                   or beyond rapid_acceleration_threshold /
+                                   hard_braking_threshold (km/h)
+    speed_violation_detection      seconds above speed_limit + tolerance_kmh
+
+Only measured seconds (confidence > 0) can trigger an event.
+"""
+
+import math
+import numpy as np
+from array import array
+from typing import Dict, Any, List, Optional, Sequence
+
+
+class SecondBins:
+    """Streaming per-second median speed and mean confidence; samples arrive in time order"""
+
+    def __init__(self):
+        self.t = array('f')
+        self.speed = array('f')
+        self.confidence = array('f')
+        self._second = None
+        self._speeds: List[float] = []
+        self._confs: List[float] = []
+
+    def add(self, t: float, speed: float, confidence: float = 1.0):
+        second = int(t)
+        if second != self._second:
+            self._close()
+            self._second = second
+        self._speeds.append(float(speed))
+        self._confs.append(float(confidence))
+
+    def _close(self):
+        if self._speeds:
+            self.t.append(self._second)
+            self.speed.append(float(np.median(self._speeds)))
+            self.confidence.append(sum(self._confs) / len(self._confs))
+            self._speeds, self._confs = [], []
+
+    def as_dict(self) -> Dict[str, List[float]]:
+        """{"t": [...], "speed_kmh": [...], "confidence": [...]}, one entry per measured second"""
+        self._close()
+        return {"t": list(self.t), "speed_kmh": [round(v, 3) for v in self.speed],
+                "confidence": [round(v, 3) for v in self.confidence]}
+
+
+def speed_profile(times: Sequence[float], speeds: Sequence[float],
+                  confidences: Optional[Sequence[float]] = None,
+                  duration: Optional[float] = None,
+                  bounds: Optional[Sequence[float]] = None) -> Dict[str, Any]:
+    """{"hz": 1, "speed_kmh": [...], "confidence": [...]}, one entry per second"""
+    times = np.asarray(times, dtype=np.float64)
+    speeds = np.asarray(speeds, dtype=np.float64)
+    conf = np.ones_like(speeds) if confidences is None else np.asarray(confidences, dtype=np.float64)
+    if bounds is not None:
+        keep = (speeds >= bounds[0]) & (speeds <= bounds[1])
+        times, speeds, conf = times[keep], speeds[keep], conf[keep]
+    if len(speeds) == 0:
+        return {"hz": 1, "speed_kmh": [], "confidence": []}
+
+    n = int(math.ceil(duration)) if duration else int(times[-1]) + 1
+    n = max(n, 1)
+    seconds = np.clip(np.floor(times).astype(np.int64), 0, n - 1)
+    counts = np.bincount(seconds, minlength=n)
+    measured = counts > 0
+    confidence = np.bincount(seconds, weights=conf, minlength=n)
+    confidence[measured] /= counts[measured]
+
+    # Median per second: sort by (second, speed), then the middle of each bin
+    order = np.lexsort((speeds, seconds))
+    ranked = speeds[order]
+    start = np.concatenate([[0], np.cumsum(counts)[:-1]])[measured]
+    c = counts[measured]
+    speed = np.full(n, np.nan)
+    speed[measured] = 0.5 * (ranked[start + (c - 1) // 2] + ranked[start + c // 2])
+
+    return {
+        "hz": 1,
+        "speed_kmh": [None if math.isnan(v) else v for v in np.round(speed, 2).tolist()],
+        "confidence": np.round(confidence, 3).tolist(),
+    }
+
+
+def _runs(mask: np.ndarray) -> List[tuple]:
+    """[(start, end)] of the runs of True in mask, end inclusive"""
+    edges = np.diff(np.concatenate([[0], mask.astype(np.int8), [0]]))
+    return list(zip(np.nonzero(edges == 1)[0].tolist(), (np.nonzero(edges == -1)[0] - 1).tolist()))
+
+
+def _change_events(delta: np.ndarray, mask: np.ndarray, window: int, peak) -> Dict[str, Any]:
+    events = [{"start_sec": s, "end_sec": e + window, "delta_kmh": round(float(peak(delta[s:e + 1])), 2)}
+              for s, e in _runs(mask)]
+    return {"count": len(events), "events": events}
+
+
+def speed_events(profile: Dict[str, Any], config: Dict[str, Any], fps: float) -> Dict[str, Any]:
+    """Hard braking, rapid acceleration and speeding from a speed_profile()"""
+    features = config.get("enhanced_features", {})
+    # Unmeasured seconds are null: NaN here, never compared (measured is False)
+    speed = np.asarray(profile["speed_kmh"], dtype=np.float64)
+    measured = np.asarray(profile["confidence"], dtype=np.float64) > 0
+    events: Dict[str, Any] = {}
+
+    aggressive = features.get("aggressive_driving_detection", {})
+    if aggressive.get("enabled", True):
+        window = max(1, int(round(aggressive.get("time_window_frames", 30) / (fps or 30.0))))
+        delta = speed[window:] - speed[:-window]
+        valid = measured[window:] & measured[:-window]
+        accel = aggressive.get("rapid_acceleration_threshold", 15)
+        brake = aggressive.get("hard_braking_threshold", -15)
+        events["rapid_acceleration"] = _change_events(delta, valid & (delta >= accel), window, np.max)
+        events["hard_braking"] = _change_events(delta, valid & (delta <= brake), window, np.min)
+        events["window_seconds"] = window
+
+    violation = features.get("speed_violation_detection", {})
+    if violation.get("enabled", True):
+        limit = float(config.get("speed_limit", 60))
+        over = measured & (speed > limit + violation.get("tolerance_kmh", 0))
+        runs = _runs(over)
+        events["speed_violation"] = {
+            "count": len(runs),
+            "limit_kmh": limit,
+            "seconds_over_limit": int(over.sum()),
+            "max_speed_kmh": round(float(speed[measured].max()), 2) if measured.any() else 0.0,
+            "events": [{"start_sec": s, "end_sec": e, "max_speed_kmh": round(float(speed[s:e + 1].max()), 2)}
+                       for s, e in runs],
+        }
+    return events
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Streaming Statistics
+Bounded-memory running statistics for per-sample analyzer signals
+
+Analyzers used to collect every sample in Python lists and take
+percentiles over them at the end, so memory grew with the video length.
+QuantileDigest is a merging t-digest (Dunning): samples are appended to a
+fixed numpy buffer, and when it fills the buffer is merged into at most
+~compression centroids, small near the tails and large in the middle.
+
+Until the first merge every sample is its own centroid, and quantiles use
+the same linear interpolation as np.percentile, so short videos (fewer
+than `buffer_size` samples) get exact results. Longer ones keep
+O(compression + buffer_size) memory whatever their length.
+"""
+
+import numpy as np
+from math import asin, pi, sin
+
+DIGEST_COMPRESSION = 200
+DIGEST_BUFFER = 1000
+
+
+class QuantileDigest:
+    """Streaming quantiles of a stream of floats (merging t-digest)"""
+
+    def __init__(self, compression: int = DIGEST_COMPRESSION, buffer_size: int = DIGEST_BUFFER):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self._buf = np.empty(buffer_size)
+        self._n = 0  # samples waiting in the buffer
+
+    def __len__(self) -> int:
+        return int(self.weights.sum()) + self._n
+
+    def add(self, value: float):
+        self._buf[self._n] = value
+        self._n += 1
+        if self._n == len(self._buf):
+            self._merge()
+
+    def _k(self, q: float) -> float:
+        return self.compression / (2 * pi) * asin(2 * q - 1)
+
+    def _k_inv(self, k: float) -> float:
+        return (sin(k * 2 * pi / self.compression) + 1) / 2
+
+    def _merge(self):
+        means = np.concatenate([self.means, self._buf[:self._n]])
+        weights = np.concatenate([self.weights, np.ones(self._n)])
+        self._n = 0
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+
+        total = weights.sum()
+        merged_m, merged_w = [], []
+        cur_m, cur_w = means[0], weights[0]
+        done = 0.0  # weight of the centroids already emitted
+        q_limit = self._k_inv(self._k(0.0) + 1)
+        for m, w in zip(means[1:], weights[1:]):
+            if (done + cur_w + w) / total <= q_limit:
+                cur_w += w
+                cur_m += (m - cur_m) * w / cur_w
+            else:
+                merged_m.append(cur_m)
+                merged_w.append(cur_w)
+                done += cur_w
+                q_limit = self._k_inv(self._k(min(done / total, 1.0)) + 1)
+                cur_m, cur_w = m, w
+        merged_m.append(cur_m)
+        merged_w.append(cur_w)
+        self.means, self.weights = np.array(merged_m), np.array(merged_w)
+
+    def _centroids(self):
+        """Sorted (means, weights); the buffer counts as singleton centroids"""
+        if self._n:
+            means = np.concatenate([self.means, self._buf[:self._n]])
+            weights = np.concatenate([self.weights, np.ones(self._n)])
+            order = np.argsort(means, kind="stable")
+            return means[order], weights[order]
+        return self.means, self.weights
+
+    def _rank_value(self, means, weights, rank: float) -> float:
+        # A centroid of weight w covering ranks [c, c + w) sits at rank c + (w - 1) / 2,
+        # which puts singletons exactly where np.percentile puts them
+        centres = np.cumsum(weights) - weights + (weights - 1) / 2
+        return float(np.interp(rank, centres, means))
+
+    def quantile(self, q: float) -> float:
+        """Value at quantile q (0-1); nan when empty"""
+        means, weights = self._centroids()
+        if len(means) == 0:
+            return float("nan")
+        return self._rank_value(means, weights, q * (weights.sum() - 1))
+
+    def percentile(self, p: float) -> float:
+        return self.quantile(p / 100.0)
+
+    def trimmed_median(self, lower: float, upper: float):
+        """
+        (median, count) of the samples within [lower, upper]. Exact before the
+        first merge, otherwise resolved to whole centroids.
+        """
+        means, weights = self._centroids()
+        if len(means) == 0:
+            return float("nan"), 0
+        cum = np.concatenate([[0.0], np.cumsum(weights)])
+        below = cum[np.searchsorted(means, lower, side="left")]
+        upto = cum[np.searchsorted(means, upper, side="right")]
+        count = int(round(upto - below))
+        if count <= 0:
+            return float("nan"), 0
+        return self._rank_value(means, weights, (below + upto - 1) / 2), count
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Analysis Timeseries
+Compact per-sample signals written next to each analysis JSON
+
+The analysis JSON only keeps scalars and events; the per-frame signals they
+were computed from used to be thrown away, so charts (speed_graph.py) had
+to decode the video again. Every analyzer now reports its signals through
+FrameAnalyzer.timeseries() in the same pass, and they are saved as one
+uncompressed .npz of float32 arrays named "<analyzer>/<signal>":
+
+    average_speed/t, average_speed/speed_kmph
+    enhanced_speed/t, enhanced_speed/speed_kmh, enhanced_speed/confidence
+    close_encounters/t, close_encounters/ema_left|ema_center|ema_right
+                        (or nearest_m with enhanced proximity detection)
+    turn_changes_orb/t, turn_changes_orb/omega_s, turn_changes_orb/heading
+    lane_change_count/t, lane_change_count/ema
+    illegal_way_bus_lane/t, illegal_way_bus_lane/red_coverage
+
+Each analyzer's "t" (seconds) is its own sample timeline. Members are
+stored uncompressed, so loading one is a single read with no decode step.
+
+Usage:
+    python3 timeseries.py <file_timeseries.npz>
+"""
+
+import os
+import sys
+import tempfile
+import numpy as np
+from typing import Dict, Any, Optional
+
+Series = Dict[str, Dict[str, np.ndarray]]
+
+
+def pack(series: Dict[str, Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """{analyzer: {signal: values}} as flat float32 arrays keyed "analyzer/signal" """
+    return {f"{name}/{signal}": np.asarray(values, dtype=np.float32).ravel()
+            for name, signals in series.items() for signal, values in signals.items()}
+
+
+def unpack(arrays: Dict[str, np.ndarray]) -> Series:
+    series: Series = {}
+    for key, values in arrays.items():
+        name, _, signal = key.partition("/")
+        series.setdefault(name, {})[signal] = values
+    return series
+
+
+def save_timeseries(path: str, series: Dict[str, Dict[str, Any]]):
+    """Write the series atomically (a reader never sees half a file)"""
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=folder, suffix=".npz.tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **pack(series))
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def load_timeseries(path: str) -> Optional[Series]:
+    """{analyzer: {signal: float32 array}}, or None if missing / unreadable"""
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            return unpack({k: data[k] for k in data.files})
+    except (OSError, ValueError):
+        return None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python3 timeseries.py <file_timeseries.npz>")
+        sys.exit(1)
+    series = load_timeseries(sys.argv[1])
+    if series is None:
+        print(f"❌ Cannot read {sys.argv[1]}")
+        sys.exit(1)
+    for name, signals in series.items():
+        t = signals.get("t")
+        span = f"{t[0]:.2f}-{t[-1]:.2f}s" if t is not None and len(t) else "empty"
+        print(f"📈 {name}: {len(t) if t is not None else 0} samples ({span})")
+        for signal, values in signals.items():
+            if signal != "t" and len(values):
+                print(f"   {signal}: min {np.nanmin(values):.3f}, mean {np.nanmean(values):.3f}, "
+                      f"max {np.nanmax(values):.3f}")
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Video Sources
+Decode backends for the DriveGuard AI frame pipeline
+
+A VideoSource yields decoded frames as FramePyramid objects:
+- OpenCVVideoSource   cv2.VideoCapture, always decodes to BGR
+- PyAVVideoSource     FFmpeg via PyAV; serves gray straight from the Y
+                      plane of planar YUV frames and only converts to BGR
+                      when an analyzer asks for colour. The gray is a
+                      zero-copy view for full-range (JPEG) video; limited
+                      range (16-235, most dashcam H.264) is stretched to
+                      0-255 with one LUT pass, which copies the plane
+
+The PyAV source can also emit frames already downscaled to an analysis
+width (set_output_width), using FFmpeg's threaded swscale. OpenCV has no
+decoder-side scaler, so it keeps native frames and the FramePyramid resizes.
+
+A packet FFmpeg fails to decode (a corrupt stretch of the file) is logged
+and skipped; decoding continues with the next packet instead of ending the
+video there.
+
+The backend is chosen with the VIDEO_BACKEND environment variable
+("opencv", "pyav" or "auto").
+"""
+
+import os
+import cv2
+import numpy as np
+from typing import Optional, Tuple, Callable
+
+try:
+    import av
+    HAS_PYAV = True
+except ImportError:
+    HAS_PYAV = False
+
+VIDEO_BACKEND = os.getenv("VIDEO_BACKEND", "opencv")
+
+# Shared analysis widths. Requested widths snap up to the nearest level and
+# each level is derived from the next larger one, so every sampled frame is
+# resized and converted to gray at most once per level.
+PYRAMID_WIDTHS = (896, 480, 320)
+
+# Pixel formats whose first plane is full-resolution 8-bit luma
+_LUMA_FORMATS = {"yuv420p", "yuvj420p", "yuv422p", "yuvj422p", "yuv444p", "yuvj444p", "nv12", "nv21"}
+
+# Limited-range (16-235) luma -> the full 0-255 range of BGR2GRAY, which
+# the analyzers' thresholds are tuned on
+_FULL_RANGE_LUT = np.clip(np.round((np.arange(256) - 16) * 255.0 / 219.0), 0, 255).astype(np.uint8)
+_JPEG_RANGE = 2  # AVCOL_RANGE_JPEG
+
+
+class VideoOpenError(RuntimeError):
+    """Raised when the decoder cannot open a video"""
+
+
+class VideoMeta:
+    """Container metadata reported by the decoder"""
+
+    def __init__(self, fps: float, frame_count: int, width: int, height: int):
+        self.fps = fps
+        self.frame_count = frame_count
+        self.width = width
+        self.height = height
+
+    @property
+    def duration_seconds(self) -> float:
+        return self.frame_count / self.fps if self.fps > 0 else 0.0
+
+
+class FramePyramid:
+    """
+    Lazily computed multi-resolution views of one decoded frame.
+
+    bgr(width) / gray(width) return cached arrays shared by every analyzer;
+    callers must treat them as read-only. width=None means full resolution.
+
+    Built either from a BGR image, or from a luma plane plus a `to_bgr`
+    callable that is only invoked if some analyzer needs colour. A frame
+    the decoder already scaled down passes the native (w, h) as
+    `source_size`, so every level has the same size as when it is
+    resized from the native frame.
+    """
+
+    def __init__(self, frame: Optional[np.ndarray] = None, levels: Tuple[int, ...] = PYRAMID_WIDTHS,
+                 luma: Optional[np.ndarray] = None, to_bgr: Optional[Callable[[], np.ndarray]] = None,
+                 source_size: Optional[Tuple[int, int]] = None):
+        src = frame if frame is not None else luma
+        self.height, self.width = src.shape[:2]
+        self._source_size = source_size or (self.width, self.height)
+        self._cache = {}
+        if frame is not None:
+            self._cache[("bgr", self.width)] = frame
+        if luma is not None:
+            self._cache[("gray", self.width)] = luma
+        self._to_bgr = to_bgr
+        # Levels below the source width form a cascade; anything else is
+        # resized straight from the full-resolution frame
+        self._ladder = sorted((l for l in levels if l < self.width), reverse=True)
+        self._levels = sorted(levels)
+
+    def snap(self, width: Optional[int]) -> int:
+        """Pyramid level used to serve a request for `width`; never wider than the frame"""
+        if width is None:
+            return self.width
+        for level in self._levels:
+            if level >= width:
+                return min(level, self.width)
+        return min(width, self.width)
+
+    def size(self, width: int) -> Tuple[int, int]:
+        """(w, h) of a level, keeping the source aspect ratio"""
+        source_w, source_h = self._source_size
+        return width, int(source_h * (width / float(source_w)))
+
+    def _parent(self, width: int) -> int:
+        larger = [l for l in self._ladder if l > width]
+        return larger[-1] if larger else self.width
+
+    def bgr(self, width: Optional[int] = None) -> np.ndarray:
+        return self._get("bgr", self.snap(width))
+
+    def gray(self, width: Optional[int] = None) -> np.ndarray:
+        return self._get("gray", self.snap(width))
+
+    def _get(self, space: str, width: int) -> np.ndarray:
+        key = (space, width)
+        img = self._cache.get(key)
+        if img is None:
+            if width != self.width:
+                parent = self._get(space, self._parent(width))
+                img = cv2.resize(parent, self.size(width), interpolation=cv2.INTER_AREA)
+            elif space == "bgr":
+                img = self._to_bgr()
+            else:
+                img = cv2.cvtColor(self._get("bgr", width), cv2.COLOR_BGR2GRAY)
+            self._cache[key] = img
+        return img
+
+
+class VideoSource:
+    """Sequential frame reader with optional seeking"""
+
+    meta: VideoMeta
+    output_size: Optional[Tuple[int, int]] = None  # (w, h) of emitted frames; None = native
+
+    def set_output_width(self, width: Optional[int]) -> bool:
+        """
+        Ask the decoder to emit frames scaled down to `width` (aspect
+        preserved, never upscaled). Returns False if the backend cannot.
+        """
+        return False
+
+    def frame_buffer(self) -> Optional[np.ndarray]:
+        """
+        Preallocated array read() can decode into, or None if the backend
+        always hands out its own memory.
+        """
+        return None
+
+    def grab(self) -> bool:
+        """Advance one frame without producing an image"""
+        raise NotImplementedError
+
+    def read(self, out: Optional[np.ndarray] = None) -> Optional[FramePyramid]:
+        """
+        Decode the next frame; None at end of stream. `out` is an optional
+        frame_buffer() to decode into instead of allocating a new image.
+        """
+        raise NotImplementedError
+
+    def seek(self, idx: int) -> Optional[int]:
+        """
+        Try to position the source so the next read() returns frame `idx`.
+        Returns the index the next read() will actually return (which may be
+        an earlier keyframe), or None if the position did not change.
+        """
+        return None
+
+    def release(self):
+        pass
+
+
+class OpenCVVideoSource(VideoSource):
+
+    def __init__(self, video_path: str):
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            cap.release()
+            raise VideoOpenError(f"Could not open video: {video_path}")
+        self.cap = cap
+        self.meta = VideoMeta(
+            fps=cap.get(cv2.CAP_PROP_FPS) or 30.0,
+            frame_count=int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+            width=int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            height=int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        )
+
+    def frame_buffer(self) -> Optional[np.ndarray]:
+        return np.empty((self.meta.height, self.meta.width, 3), np.uint8)
+
+    def grab(self) -> bool:
+        return self.cap.grab()
+
+    def read(self, out: Optional[np.ndarray] = None) -> Optional[FramePyramid]:
+        # Decodes in place when `out` matches the frame size
+        ok, image = self.cap.read(out)
+        return FramePyramid(image) if ok else None
+
+    def seek(self, idx: int) -> Optional[int]:
+        if not self.cap.set(cv2.CAP_PROP_POS_FRAMES, idx):
+            return None
+        # Some backends land on a nearby keyframe; report where we really are
+        return int(self.cap.get(cv2.CAP_PROP_POS_FRAMES))
+
+    def release(self):
+        self.cap.release()
+
+
+class PyAVVideoSource(VideoSource):
+
+    def __init__(self, video_path: str):
+        try:
+            self.container = av.open(video_path)
+            self.stream = self.container.streams.video[0]
+        except (av.error.FFmpegError, IndexError) as e:
+            raise VideoOpenError(f"Could not open video: {video_path} ({e})")
+        self.stream.thread_type = "AUTO"
+        ctx = self.stream.codec_context
+        fps = float(self.stream.average_rate or 0) or 30.0
+        frame_count = self.stream.frames
+        if not frame_count and self.stream.duration:
+            frame_count = int(round(float(self.stream.duration * self.stream.time_base) * fps))
+        self.meta = VideoMeta(fps=fps, frame_count=int(frame_count), width=ctx.width, height=ctx.height)
+        self._frames = self._decode()
+        self._pending = None  # frame decoded past a seek target
+
+    def _decode(self):
+        """Decoded frames in order; packets that fail to decode are logged and skipped"""
+        try:
+            for packet in self.container.demux(self.stream):
+                try:
+                    yield from packet.decode()
+                except av.error.FFmpegError as e:
+                    print(f"⚠️  Skipping undecodable packet (pts {packet.pts}): {e}")
+        except av.error.FFmpegError as e:
+            # The demuxer cannot resync past this; what was decoded stands
+            print(f"⚠️  Stopped reading video: {e}")
+
+    def _next(self):
+        if self._pending is not None:
+            frame, self._pending = self._pending, None
+            return frame
+        return next(self._frames, None)
+
+    def set_output_width(self, width: Optional[int]) -> bool:
+        if width is None or width >= self.meta.width:
+            self.output_size = None
+        else:
+            self.output_size = (width, int(self.meta.height * (width / float(self.meta.width))))
+        return True
+
+    def grab(self) -> bool:
+        # FFmpeg has to decode every frame anyway; skipping just avoids the
+        # colour conversion
+        return self._next() is not None
+
+    def read(self, out: Optional[np.ndarray] = None) -> Optional[FramePyramid]:
+        frame = self._next()
+        if frame is None:
+            return None
+        native = (self.meta.width, self.meta.height)
+        if self.output_size is not None:
+            frame = _reformat(frame, *self.output_size)
+        if frame.format.name in _LUMA_FORMATS:
+            plane = frame.planes[0]
+            luma = np.frombuffer(plane, np.uint8).reshape(plane.height, plane.line_size)[:, :frame.width]
+            # Unspecified range means limited, as in FFmpeg's own conversion
+            if frame.color_range != _JPEG_RANGE and not frame.format.name.startswith("yuvj"):
+                luma = cv2.LUT(luma, _FULL_RANGE_LUT)
+            return FramePyramid(luma=luma, to_bgr=lambda: frame.to_ndarray(format="bgr24"), source_size=native)
+        return FramePyramid(frame.to_ndarray(format="bgr24"), source_size=native)
+
+    def _index_of(self, frame) -> int:
+        start = self.stream.start_time or 0
+        return int(round(float((frame.pts - start) * self.stream.time_base) * self.meta.fps))
+
+    def seek(self, idx: int) -> Optional[int]:
+        start = self.stream.start_time or 0
+        pts = start + int(idx / self.meta.fps / self.stream.time_base)
+        try:
+            # Lands on the keyframe at or before pts; decode forward to idx
+            self.container.seek(pts, stream=self.stream, backward=True, any_frame=False)
+        except av.error.FFmpegError:
+            return None
+        self._frames = self._decode()
+        self._pending = None
+        while True:
+            frame = self._next()
+            if frame is None:
+                return idx  # past the end; the next read() reports EOF
+            cur = idx if frame.pts is None else self._index_of(frame)
+            if cur >= idx:
+                self._pending = frame
+                return cur
+
+    def release(self):
+        self.container.close()
+
+
+def _reformat(frame, width: int, height: int):
+    """Scale a decoded frame inside FFmpeg, keeping its pixel format"""
+    try:
+        return frame.reformat(width=width, height=height, interpolation="AREA", threads=0)
+    except TypeError:
+        # PyAV releases before the `threads` argument
+        return frame.reformat(width=width, height=height, interpolation="AREA")
+
+
+def open_video_source(video_path: str, backend: Optional[str] = None) -> VideoSource:
+    """Open `video_path` with the configured backend (VIDEO_BACKEND by default)"""
+    backend = (backend or VIDEO_BACKEND).lower()
+    if backend == "auto":
+        backend = "pyav" if HAS_PYAV else "opencv"
+    if backend == "pyav":
+        if not HAS_PYAV:
+            print("⚠️  PyAV not installed, falling back to OpenCV decoding")
+            return OpenCVVideoSource(video_path)
+        return PyAVVideoSource(video_path)
+    return OpenCVVideoSource(video_path)
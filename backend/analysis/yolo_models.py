@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+YOLO Models
+Lazy torch / ultralytics access and a per-process model cache for DriveGuard AI
+
+Importing torch and ultralytics takes seconds, so nothing here imports them
+until a model is actually loaded or the device is asked for. HAS_YOLO only
+checks that the packages are installed. Entry points that never run a
+detector (rescoring, graphs, the analyze client) stay import-light.
+
+Loading weights and moving them to a device costs far more than analyzing a
+short clip, so a process that analyzes several videos (batch workers,
+segment workers, the analysis worker) keeps each model loaded and only
+resets its tracker between videos.
+
+The registry is keyed by (weights, device, precision, imgsz). A model is
+warmed up with one dummy inference when it is loaded, so the first video
+does not pay for layer fusing and allocator warm-up. model_metrics()
+reports each model's load and warm-up time and memory footprint.
+
+    YOLO_PRECISION   fp32 (default) or fp16 (CUDA / MPS only)
+    YOLO_IMGSZ       inference size (default 640)
+
+Besides PyTorch .pt weights, the registry loads the ONNX and OpenVINO
+artifacts that utils/model_manager.py export writes next to them
+(runtime_weights); ultralytics then runs them on ONNX Runtime / OpenVINO.
+"""
+
+import os
+import sys
+import time
+import importlib.util
+from typing import Any, Dict, List, Optional
+
+HAS_YOLO = all(importlib.util.find_spec(m) is not None for m in ("ultralytics", "torch"))
+
+YOLO_PRECISION = os.getenv("YOLO_PRECISION", "fp32")
+YOLO_IMGSZ = int(os.getenv("YOLO_IMGSZ", "640"))
+PRECISIONS = ("fp32", "fp16")
+RUNTIMES = ("pytorch", "onnx", "openvino")
+
+_MODELS = {}
+_METRICS = {}
+_DEVICE = None
+_TORCH_THREADS = None
+
+
+def _torch():
+    import torch
+    if _TORCH_THREADS:
+        torch.set_num_threads(_TORCH_THREADS)
+    return torch
+
+
+def set_torch_threads(threads: int):
+    """Cap torch intra-op threads, now or whenever torch gets imported"""
+    global _TORCH_THREADS
+    _TORCH_THREADS = threads
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+
+
+def get_device() -> str:
+    """Best available torch device ('cuda', 'mps' or 'cpu'), probed once"""
+    global _DEVICE
+    if _DEVICE is None:
+        if not HAS_YOLO:
+            _DEVICE = 'cpu'
+            return _DEVICE
+        torch = _torch()
+        # GPU Acceleration Setup
+        print("=== GPU Acceleration Check ===")
+        if torch.cuda.is_available():
+            _DEVICE = 'cuda'
+            print(f"✅ CUDA GPU detected: {torch.cuda.get_device_name(0)}")
+        elif hasattr(torch.backends, 'mps') and torch.backends.mps.is_available():
+            _DEVICE = 'mps'
+            print("✅ Apple Silicon (MPS) GPU detected")
+        else:
+            _DEVICE = 'cpu'
+            print("⚠️  No GPU detected, using CPU (slower)")
+        print(f"Using device: {_DEVICE}")
+    return _DEVICE
+
+
+def _rss_bytes() -> Optional[int]:
+    """Resident set size of this process (Linux), None elsewhere"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _weights_bytes(model) -> Optional[int]:
+    """Bytes held by the model's parameters and buffers"""
+    try:
+        module = model.model
+        tensors = list(module.parameters()) + list(module.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+    except (AttributeError, TypeError):
+        return None
+
+
+def exported_weights(weights: str, runtime: str, int8: bool = False) -> str:
+    """
+    Where model_manager.py export puts the `runtime` artifact of a .pt file:
+    yolov8s.onnx, yolov8s_int8.onnx, yolov8s_openvino_model/,
+    yolov8s_int8_openvino_model/
+    """
+    if runtime not in RUNTIMES:
+        raise ValueError(f"Unknown runtime '{runtime}' (choose from {', '.join(RUNTIMES)})")
+    if runtime == "pytorch":
+        return weights
+    stem = os.path.splitext(weights)[0] + ("_int8" if int8 else "")
+    return stem + ".onnx" if runtime == "onnx" else stem + "_openvino_model"
+
+
+def runtime_weights(weights: str, runtime: str, int8: bool = False) -> str:
+    """The local artifact to load for `runtime`; the .pt weights if it was never exported"""
+    path = exported_weights(weights, runtime, int8)
+    if path != weights and not os.path.exists(path):
+        print(f"⚠️  {os.path.basename(path)} not found, using PyTorch weights "
+              f"(run: python3 utils/model_manager.py export {os.path.basename(weights)} {runtime}"
+              f"{' --int8' if int8 else ''})")
+        return weights
+    return path
+
+
+def predict_args(precision: str = YOLO_PRECISION, imgsz: int = YOLO_IMGSZ) -> Dict[str, Any]:
+    """Keyword arguments for model.predict() / track() that match a registry key"""
+    return {"imgsz": imgsz, "half": precision == "fp16"}
+
+
+def get_yolo(weights: str, device: Optional[str] = None, precision: str = YOLO_PRECISION,
+             imgsz: int = YOLO_IMGSZ):
+    """
+    Return the YOLO model for (weights, device, precision, imgsz), loading
+    and warming it up on first use. The model comes back with fresh tracker
+    state, ready for a new video; pass predict_args(precision, imgsz) to
+    its predict() / track() calls.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}' (choose from {', '.join(PRECISIONS)})")
+    if precision == "fp16" and device in (None, "cpu"):
+        print("⚠️  fp16 needs a GPU, using fp32 on CPU")
+        precision = "fp32"
+    key = (weights, device, precision, imgsz)
+    model = _MODELS.get(key)
+    if model is None:
+        _torch()
+        from ultralytics import YOLO
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        if weights.endswith(".pt"):
+            model = YOLO(weights)
+            if device:
+                model.to(device)
+        else:
+            # Exported artifact: the runtime picks its own (CPU) device
+            model = YOLO(weights, task="detect")
+        loaded = time.perf_counter()
+        _warm_up(model, precision, imgsz)
+        warm = time.perf_counter()
+        rss_after = _rss_bytes()
+        weights_bytes = _weights_bytes(model)
+        _MODELS[key] = model
+        _METRICS[key] = {
+            "weights": os.path.basename(weights),
+            "device": device or "default",
+            "precision": precision,
+            "imgsz": imgsz,
+            "load_sec": round(loaded - start, 3),
+            "warmup_sec": round(warm - loaded, 3),
+            "weights_mb": round(weights_bytes / 2**20, 1) if weights_bytes is not None else None,
+            "rss_delta_mb": (round((rss_after - rss_before) / 2**20, 1)
+                             if rss_before is not None and rss_after is not None else None),
+            "uses": 1,
+        }
+        m = _METRICS[key]
+        print(f"✅ Loaded {m['weights']} on {m['device']} ({precision}, {imgsz}px) in {m['load_sec']:.2f}s, "
+              f"warm-up {m['warmup_sec']:.2f}s, {m['weights_mb']} MB weights")
+    else:
+        _METRICS[key]["uses"] += 1
+        reset_tracker(model)
+    return model
+
+
+def _warm_up(model, precision: str, imgsz: int):
+    """One dummy inference: fuses layers and sets up the predictor and allocator"""
+    import numpy as np
+    model.predict(np.zeros((imgsz, imgsz, 3), np.uint8), verbose=False, **predict_args(precision, imgsz))
+
+
+def model_metrics() -> List[Dict[str, Any]]:
+    """Load time, warm-up time, memory footprint and use count of every loaded model"""
+    return [dict(m) for m in _METRICS.values()]
+
+
+def reset_tracker(model):
+    """Forget tracks kept by model.track(persist=True) from the previous video"""
+    predictor = getattr(model, "predictor", None)
+    for tracker in getattr(predictor, "trackers", None) or []:
+        tracker.reset()
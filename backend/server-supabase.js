@@ -11,6 +11,8 @@ const { db } = require('./database/supabase');
 
 const app = express();
 const PORT = process.env.PORT || 3001;
+// Interpreter for the analysis scripts (see .env.example)
+const PYTHON = process.env.PYTHON_PATH || 'python3';
 
 // Enable CORS for frontend
 app.use(cors());
@@ -525,7 +527,8 @@ app.post('/api/upload-video', upload.single('video'), async (req, res) => {
       message: 'Video uploaded successfully. Processing started.'
     });
 
-    processVideo(jobId, videoFilename);
+    // Uploader email, if sent, is indexed with the result
+    processVideo(jobId, videoFilename, req.body && req.body.email);
 
   } catch (error) {
     console.error('Upload error:', error);
@@ -566,9 +569,10 @@ app.get('/api/results/:filename', (req, res) => {
 
 // Get merged analysis (all results)
 app.get('/api/merged-analysis', (req, res) => {
+  // Exported from the SQLite results store when each analysis job finishes
   try {
     const mergedPath = path.join(__dirname, 'outputs', 'analysis', 'merged_output_analysis.json');
-    
+
     if (!fs.existsSync(mergedPath)) {
       return res.status(404).json({ error: 'Merged analysis not found' });
     }
@@ -582,7 +586,7 @@ app.get('/api/merged-analysis', (req, res) => {
 });
 
 // Process video with Python script
-function processVideo(jobId, videoFilename) {
+function processVideo(jobId, videoFilename, userEmail) {
   const pythonScript = path.join(__dirname, 'analysis', 'analyze_video_single.py');
   const videoPath = path.join(__dirname, 'videos', videoFilename);
 
@@ -595,7 +599,9 @@ function processVideo(jobId, videoFilename) {
     message: 'Analyzing video with AI models...'
   });
 
-  const pythonProcess = spawn('python3', [pythonScript, videoPath, videoFilename]);
+  const args = [pythonScript, videoPath, videoFilename];
+  if (userEmail) args.push(userEmail);
+  const pythonProcess = spawn(PYTHON, args);
 
   let outputData = '';
   let errorData = '';
@@ -7,6 +7,8 @@ const fs = require('fs');
 
 const app = express();
 const PORT = 3001;
+// Interpreter for the analysis scripts (see .env.example)
+const PYTHON = process.env.PYTHON_PATH || 'python3';
 
 // Enable CORS for frontend
 app.use(cors());
@@ -435,8 +437,9 @@ app.post('/api/upload-video', upload.single('video'), async (req, res) => {
       message: 'Video uploaded successfully. Processing started.'
     });
 
-    // Start Python analysis in background
-    processVideo(jobId, videoFilename);
+    // Start Python analysis in background (uploader email, if sent, is
+    // indexed with the result)
+    processVideo(jobId, videoFilename, req.body && req.body.email);
 
   } catch (error) {
     console.error('Upload error:', error);
@@ -477,9 +480,10 @@ app.get('/api/results/:filename', (req, res) => {
 
 // Get merged analysis data
 app.get('/api/merged-analysis', (req, res) => {
+  // Exported from the SQLite results store when each analysis job finishes
   try {
     const mergedPath = path.join(__dirname, 'outputs', 'analysis', 'merged_output_analysis.json');
-    
+
     if (!fs.existsSync(mergedPath)) {
       return res.status(404).json({ error: 'Merged analysis not found' });
     }
@@ -493,7 +497,7 @@ app.get('/api/merged-analysis', (req, res) => {
 });
 
 // Process video with Python script
-function processVideo(jobId, videoFilename) {
+function processVideo(jobId, videoFilename, userEmail) {
   const pythonScript = path.join(__dirname, 'analysis', 'analyze_video_single.py');
   const videoPath = path.join(__dirname, 'videos', videoFilename);
 
@@ -508,7 +512,9 @@ function processVideo(jobId, videoFilename) {
   });
 
   // Spawn Python process
-  const pythonProcess = spawn('python3', [pythonScript, videoPath, videoFilename]);
+  const args = [pythonScript, videoPath, videoFilename];
+  if (userEmail) args.push(userEmail);
+  const pythonProcess = spawn(PYTHON, args);
 
   let outputData = '';
   let errorData = '';
@@ -548,11 +554,9 @@ function processVideo(jobId, videoFilename) {
       const resultPath = path.join(__dirname, 'outputs', 'analysis', `${stem}_analysis.json`);
       
       try {
+        // The Python side already upserted it into the results store
         const results = JSON.parse(fs.readFileSync(resultPath, 'utf8'));
         
-        // Update merged analysis
-        updateMergedAnalysis(videoFilename, results);
-        
         // Update job status to completed
         processingJobs.set(jobId, {
           status: 'completed',
@@ -595,30 +599,49 @@ function processVideo(jobId, videoFilename) {
   });
 }
 
-// Update merged analysis file
-function updateMergedAnalysis(videoFilename, results) {
-  try {
-    const mergedPath = path.join(__dirname, 'outputs', 'analysis', 'merged_output_analysis.json');
-    
-    let mergedData = {};
-    
-    // Read existing merged data
-    if (fs.existsSync(mergedPath)) {
-      mergedData = JSON.parse(fs.readFileSync(mergedPath, 'utf8'));
+// Warm Python analysis worker: keeps torch and the YOLO weights loaded so
+// uploads skip the startup cost. analyze_video_single.py hands jobs to it and
+// analyzes in-process whenever the worker is not running.
+let analysisWorker = null;
+let shuttingDown = false;
+
+function startAnalysisWorker() {
+  if (process.env.ANALYSIS_WORKER === '0') return;
+  const workerScript = path.join(__dirname, 'analysis', 'analysis_worker.py');
+  analysisWorker = spawn(PYTHON, [workerScript], { stdio: ['ignore', 'pipe', 'pipe'] });
+
+  analysisWorker.stdout.on('data', (data) => {
+    console.log(`Analysis worker: ${data}`);
+  });
+  analysisWorker.stderr.on('data', (data) => {
+    console.error(`Analysis worker stderr: ${data}`);
+  });
+  analysisWorker.on('error', (error) => {
+    console.error('Failed to start analysis worker:', error.message);
+  });
+  analysisWorker.on('exit', (code) => {
+    analysisWorker = null;
+    // Exit code 0 means another worker already owns the socket
+    if (!shuttingDown && code !== 0) {
+      console.warn(`⚠️  Analysis worker exited (code ${code}), restarting in 5s`);
+      setTimeout(startAnalysisWorker, 5000);
     }
-    
-    // Add/update new video results
-    mergedData[videoFilename] = results;
-    
-    // Write to single source of truth
-    fs.writeFileSync(mergedPath, JSON.stringify(mergedData, null, 4));
-    
-    console.log(`✅ Updated merged analysis with ${videoFilename}`);
-  } catch (error) {
-    console.error('❌ Error updating merged analysis:', error);
-  }
+  });
 }
 
+function stopAnalysisWorker() {
+  shuttingDown = true;
+  if (analysisWorker) analysisWorker.kill('SIGTERM');
+}
+
+process.on('exit', stopAnalysisWorker);
+['SIGINT', 'SIGTERM'].forEach((sig) => process.on(sig, () => {
+  stopAnalysisWorker();
+  process.exit(0);
+}));
+
+startAnalysisWorker();
+
 // Start server
 app.listen(PORT, () => {
   console.log('='.repeat(60));
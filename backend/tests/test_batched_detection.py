@@ -0,0 +1,198 @@
+"""
+Tests for the batched detector and the IoU tracker (batched_detection.py)
+
+Run from the repo root:
+    python -m pytest backend/tests
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "analysis"))
+
+import batched_detection
+from batched_detection import BatchedDetector, InferenceRoi, IoUTracker
+from detection_store import FrameDetections
+
+CAR, TRUCK = 2, 7
+
+
+def dets(*boxes, cls=CAR):
+    """FrameDetections of xyxy boxes, all of one class unless given per box"""
+    xyxy = np.array(boxes, np.float32).reshape(-1, 4)
+    classes = np.broadcast_to(np.asarray(cls, np.int16), (len(xyxy),)).copy()
+    return FrameDetections(np.full(len(xyxy), -1, np.int32), classes, xyxy, np.full(len(xyxy), 0.9, np.float32))
+
+
+class _Column:
+    """Stands in for a torch tensor column of ultralytics Boxes"""
+
+    def __init__(self, values):
+        self.values = np.asarray(values)
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.values
+
+
+class _Boxes:
+    def __init__(self, xyxy, cls):
+        self.id = None
+        self.xyxy = _Column(np.asarray(xyxy, np.float32).reshape(-1, 4))
+        self.cls = _Column(np.full(len(self.xyxy.values), cls, np.float32))
+        self.conf = _Column(np.full(len(self.xyxy.values), 0.9, np.float32))
+
+    def __len__(self):
+        return len(self.xyxy.values)
+
+
+class _Result:
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+
+class StubModel:
+    """predict() returns one fixed box per image and records every call"""
+
+    def __init__(self, box=(10, 10, 20, 20)):
+        self.box = box
+        self.calls = []
+
+    def predict(self, images, **kwargs):
+        self.calls.append(([image.shape for image in images], kwargs))
+        return [_Result(_Boxes([self.box], CAR)) for _ in images]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def perf_counter(self):
+        return self.now
+
+
+# --- IoUTracker --------------------------------------------------------------
+
+def test_tracker_matches_best_pair_first():
+    tracker = IoUTracker()
+    first = tracker.update(dets([0, 0, 10, 10], [6, 0, 16, 10]))
+    left, right = first.track_id
+    # The first box overlaps the left track more than the right one, but the
+    # second box is a perfect match for the left track and is taken first
+    second = tracker.update(dets([2, 0, 12, 10], [0, 0, 10, 10]))
+    assert list(second.track_id) == [right, left]
+
+
+def test_tracker_starts_new_track_below_threshold():
+    tracker = IoUTracker(iou_thresh=0.5)
+    first = tracker.update(dets([0, 0, 10, 10]))
+    second = tracker.update(dets([6, 0, 16, 10]))  # IoU 4/16
+    assert second.track_id[0] != first.track_id[0]
+
+
+def test_tracker_coasts_until_max_age():
+    tracker = IoUTracker(max_age=2)
+    tid = tracker.update(dets([0, 0, 10, 10])).track_id[0]
+    for _ in range(2):
+        tracker.update(FrameDetections.empty())
+    assert tracker.update(dets([0, 0, 10, 10])).track_id[0] == tid
+
+
+def test_tracker_drops_track_past_max_age():
+    tracker = IoUTracker(max_age=2)
+    tid = tracker.update(dets([0, 0, 10, 10])).track_id[0]
+    for _ in range(3):
+        tracker.update(FrameDetections.empty())
+    assert len(tracker.ids) == 0
+    assert tracker.update(dets([0, 0, 10, 10])).track_id[0] != tid
+
+
+def test_tracker_predicts_with_velocity():
+    tracker = IoUTracker()
+    tid = tracker.update(dets([0, 0, 10, 10])).track_id[0]
+    for x in (4, 8, 12):
+        assert tracker.update(dets([x, 0, x + 10, 10])).track_id[0] == tid
+    # IoU with the last box (12..22) is only 3/17; the predicted one is at 15.5
+    assert tracker.update(dets([19, 0, 29, 10])).track_id[0] == tid
+
+
+def test_tracker_gates_on_class():
+    tracker = IoUTracker()
+    car = tracker.update(dets([0, 0, 10, 10], cls=CAR)).track_id[0]
+    truck = tracker.update(dets([0, 0, 10, 10], cls=TRUCK)).track_id[0]
+    assert truck != car
+    assert tracker.update(dets([0, 0, 10, 10], cls=CAR)).track_id[0] == car
+
+
+def test_tracker_settings_follow_parameters():
+    settings = IoUTracker(iou_thresh=0.4, max_age=3).settings()
+    assert settings == {"name": "iou", "iou_thresh": 0.4, "max_age": 3, "version": IoUTracker.VERSION}
+    assert settings != IoUTracker().settings()
+
+
+# --- BatchedDetector ---------------------------------------------------------
+
+def test_detector_waits_for_full_batch():
+    model = StubModel()
+    batch = BatchedDetector(model, batch_size=3, conf=0.25, iou=0.45)
+    image = np.zeros((40, 60, 3), np.uint8)
+    assert batch.submit(0, image, "a") == []
+    assert batch.submit(1, image, "b") == []
+    done = batch.submit(2, image, "c")
+    assert [(idx, payload) for idx, _, payload in done] == [(0, "a"), (1, "b"), (2, "c")]
+    assert len(model.calls) == 1 and len(model.calls[0][0]) == 3
+    assert batch.flush() == []
+
+
+def test_detector_flushes_partial_batch_after_max_latency(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(batched_detection, "time", clock)
+    model = StubModel()
+    batch = BatchedDetector(model, batch_size=8, conf=0.25, iou=0.45, max_latency_ms=50)
+    image = np.zeros((40, 60, 3), np.uint8)
+    assert batch.submit(0, image) == []
+    clock.now = 0.03
+    assert batch.submit(1, image) == []
+    clock.now = 0.05
+    assert [idx for idx, _, _ in batch.submit(2, image)] == [0, 1, 2]
+    # The latency window restarts with the next frame
+    clock.now = 0.08
+    assert batch.submit(3, image) == []
+    assert [len(shapes) for shapes, _ in model.calls] == [3]
+
+
+def test_detector_tracks_across_batches():
+    batch = BatchedDetector(StubModel(), batch_size=2, conf=0.25, iou=0.45)
+    image = np.zeros((40, 60, 3), np.uint8)
+    done = batch.submit(0, image) + batch.submit(1, image) + batch.submit(2, image) + batch.flush()
+    assert len({int(d.track_id[0]) for _, d, _ in done}) == 1
+    assert batch.frames == 3 and batch.batches == 2
+
+
+def test_detector_maps_roi_boxes_to_frame_pixels():
+    model = StubModel(box=(10, 10, 20, 20))
+    roi = InferenceRoi((0.25, 0.5, 0.75, 1.0), min_box_frac=0.2, min_object_px=24, aspect=2.0)
+    batch = BatchedDetector(model, batch_size=1, conf=0.25, iou=0.45, roi=roi)
+    image = np.zeros((100, 200, 3), np.uint8)
+    (_, found, _), = batch.submit(0, image)
+    np.testing.assert_array_equal(found.xyxy, [[60, 60, 70, 70]])
+    shapes, kwargs = model.calls[0]
+    assert shapes == [(50, 100, 3)]
+    assert kwargs["imgsz"] == roi.imgsz
+
+
+def test_roi_imgsz_is_capped_at_full_frame_scale():
+    roi = InferenceRoi((0.0, 0.0, 1.0, 1.0), min_box_frac=0.001, min_object_px=24, aspect=16 / 9)
+    assert roi.imgsz == batched_detection.YOLO_IMGSZ
+    small = InferenceRoi((0.25, 0.5, 0.75, 1.0), min_box_frac=0.2, min_object_px=24, aspect=16 / 9)
+    assert small.imgsz % batched_detection.IMGSZ_STRIDE == 0
+    assert small.imgsz < batched_detection.YOLO_IMGSZ
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
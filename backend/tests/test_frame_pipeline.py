@@ -0,0 +1,39 @@
+"""
+Tests for decode-width selection in the frame pipeline (frame_pipeline.py)
+
+Run from the repo root:
+    python -m pytest backend/tests
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "analysis"))
+
+import main_v2
+from frame_pipeline import required_width
+from video_source import FramePyramid, VideoMeta
+
+
+def default_analyzers(width, height, use_enhanced_speed=True):
+    analyzers = main_v2.build_analyzers("video.mp4", {}, use_enhanced_speed)
+    for a in analyzers:
+        a.init(VideoMeta(25.0, 750, width, height))
+    return analyzers
+
+
+@pytest.mark.parametrize("use_enhanced_speed", [True, False])
+def test_default_analyzers_allow_scaled_decode(use_enhanced_speed):
+    width = required_width(default_analyzers(1920, 1080, use_enhanced_speed))
+    assert width is not None and width < 1920
+
+
+def test_narrow_video_is_never_upsampled():
+    analyzers = default_analyzers(640, 360)
+    frame = FramePyramid(np.zeros((360, 640, 3), np.uint8))
+    for a in analyzers:
+        if not a.done and a.max_width is not None:
+            assert frame.bgr(a.max_width).shape[1] <= 640
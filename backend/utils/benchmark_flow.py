@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Optical Flow Benchmark for DriveGuard AI
+Runs the speed and lane-change analyzers with every optical flow engine and
+reports the flow cost (ms per sampled frame) and how far each engine's
+results deviate from dense Farneback, the reference.
+
+Each engine gets one decode pass per video with both analyzers attached, so
+only the flow engines differ between runs.
+
+Usage:
+    python3 benchmark_flow.py [video ...] [--engines farneback,dis_fast,...] [--json]
+"""
+
+import os
+import sys
+import json
+import glob
+import argparse
+
+UTILS_DIR = os.path.abspath(os.path.dirname(__file__))
+ANALYSIS_DIR = os.path.join(UTILS_DIR, '..', 'analysis')
+VIDEOS_FOLDER = os.path.join(UTILS_DIR, '..', 'videos')
+CALIBRATION_FILE = os.path.join(UTILS_DIR, '..', 'config', 'video_calibrations.json')
+
+sys.path.insert(0, ANALYSIS_DIR)
+
+REFERENCE_ENGINE = 'farneback'
+
+
+def run_engine(video_path, calib, engine):
+    """(speed analyzer, lane analyzer, results) for one video analyzed with `engine`"""
+    from main_v2 import AverageSpeedAnalyzer, LaneChangeAnalyzer
+    from frame_pipeline import run_frame_pipeline
+    speed = AverageSpeedAnalyzer(calib.get('meters_per_pixel', 0.05), calib.get('roi_top', 0.6),
+                                 calib.get('roi_bottom', 0.9), engine)
+    lane = LaneChangeAnalyzer(engine)
+    results = run_frame_pipeline(video_path, [speed, lane])
+    return speed, lane, results
+
+
+def benchmark_video(video_path, calib, engines):
+    rows = []
+    for engine in engines:
+        speed, lane, results = run_engine(video_path, calib, engine)
+        rows.append({
+            'engine': engine,
+            'speed_ms_per_frame': round(speed.flow.ms_per_frame, 2),
+            'lane_ms_per_frame': round(lane.flow.ms_per_frame, 2),
+            'average_speed_kmph': round(float(results[speed.name]['average_speed_kmph']), 2),
+            'lane_changes': results[lane.name]['turn_count'],
+        })
+    ref = next((r for r in rows if r['engine'] == REFERENCE_ENGINE), rows[0])
+    for r in rows:
+        r['speed_deviation_kmph'] = round(r['average_speed_kmph'] - ref['average_speed_kmph'], 2)
+        r['speed_deviation_pct'] = (round(100.0 * r['speed_deviation_kmph'] / ref['average_speed_kmph'], 1)
+                                    if ref['average_speed_kmph'] else 0.0)
+        r['lane_change_deviation'] = r['lane_changes'] - ref['lane_changes']
+        r['speedup'] = (round((ref['speed_ms_per_frame'] + ref['lane_ms_per_frame'])
+                              / max(r['speed_ms_per_frame'] + r['lane_ms_per_frame'], 1e-6), 2))
+    return rows
+
+
+def main():
+    from optical_flow import FLOW_ENGINES
+    parser = argparse.ArgumentParser(description='Compare optical flow engines on the speed / lane-change analyzers')
+    parser.add_argument('videos', nargs='*', help='Videos to benchmark (default: every video in backend/videos)')
+    parser.add_argument('--engines', default=','.join(FLOW_ENGINES),
+                        help=f"Comma-separated engines (default: {','.join(FLOW_ENGINES)})")
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+
+    engines = [e.strip() for e in args.engines.split(',') if e.strip()]
+    unknown = [e for e in engines if e not in FLOW_ENGINES]
+    if unknown:
+        parser.error(f"unknown engine(s): {', '.join(unknown)}")
+    if REFERENCE_ENGINE in engines:
+        engines.remove(REFERENCE_ENGINE)
+    engines.insert(0, REFERENCE_ENGINE)
+
+    videos = [v if os.path.exists(v) else os.path.join(VIDEOS_FOLDER, v) for v in args.videos]
+    if not videos:
+        videos = sorted(glob.glob(os.path.join(VIDEOS_FOLDER, '*.mp4')))
+    calibrations = {}
+    if os.path.exists(CALIBRATION_FILE):
+        with open(CALIBRATION_FILE, 'r') as f:
+            calibrations = json.load(f)
+
+    report = {}
+    for video_path in videos:
+        name = os.path.basename(video_path)
+        if not args.json:
+            print(f"\n🎞️  {name}")
+        rows = benchmark_video(video_path, calibrations.get(name, {}), engines)
+        report[name] = rows
+        if args.json:
+            continue
+        print(f"   {'engine':<16}{'speed ms/f':>11}{'lane ms/f':>11}{'speedup':>9}"
+              f"{'km/h':>9}{'Δ km/h':>9}{'Δ %':>8}{'lanes':>7}{'Δ':>4}")
+        for r in rows:
+            print(f"   {r['engine']:<16}{r['speed_ms_per_frame']:>11.2f}{r['lane_ms_per_frame']:>11.2f}"
+                  f"{r['speedup']:>8.2f}x{r['average_speed_kmph']:>9.2f}{r['speed_deviation_kmph']:>+9.2f}"
+                  f"{r['speed_deviation_pct']:>+8.1f}{r['lane_changes']:>7}{r['lane_change_deviation']:>+4}")
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
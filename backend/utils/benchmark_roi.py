@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+ROI Inference Benchmark for DriveGuard AI
+Runs the close-encounter detectors on whole frames and on their region of
+interest at the reduced imgsz (see InferenceRoi in batched_detection.py),
+and reports the detector cost (ms per sampled frame), the speedup and the
+recall of the boxes each analyzer keeps, against the whole-frame run.
+
+A box of interest of the whole-frame run counts as recalled when the ROI
+run has a box of the same class on the same frame with IoU >= 0.5 (n/a
+when the whole-frame run has none). Both runs use the batched detector and
+the IoU tracker, so only the crop and imgsz differ.
+
+Recall needs trained weights: an untrained network keeps no boxes, so
+every recall reads n/a and the benchmark says so. Point YOLO_MODEL at the
+production weights to measure it.
+
+Usage:
+    python3 benchmark_roi.py [video ...] [--analyzers proximity,bands] [--batch-size 8]
+                             [--min-object-px 24] [--json]
+    YOLO_MODEL=/path/to/yolov8s.pt python3 benchmark_roi.py
+"""
+
+import os
+import sys
+import json
+import glob
+import argparse
+import tempfile
+
+UTILS_DIR = os.path.abspath(os.path.dirname(__file__))
+ANALYSIS_DIR = os.path.join(UTILS_DIR, '..', 'analysis')
+VIDEOS_FOLDER = os.path.join(UTILS_DIR, '..', 'videos')
+
+sys.path.insert(0, ANALYSIS_DIR)
+
+ANALYZERS = ('proximity', 'bands')
+MATCH_IOU = 0.5
+
+
+def make_analyzer(kind, video_path, detections, batch_size, roi_px):
+    """proximity: EnhancedProximityDetector, bands: main_v2's CloseEncounterAnalyzer"""
+    from main_v2 import MODEL_WEIGHTS, INFERENCE_ENGINE, CloseEncounterAnalyzer
+    if kind == 'proximity':
+        from enhanced_proximity_detection import EnhancedProximityDetector
+        return EnhancedProximityDetector(video_path, MODEL_WEIGHTS, detections, batch_size,
+                                         engine=INFERENCE_ENGINE, roi_min_object_px=roi_px)
+    return CloseEncounterAnalyzer(detections=detections, batch_size=batch_size, engine=INFERENCE_ENGINE,
+                                  roi_min_object_px=roi_px)
+
+
+def of_interest(kind, dets, frame_size, names):
+    """Mask of the boxes the analyzer scores (tracking aside)"""
+    import numpy as np
+    from main_v2 import VEH_IDS, CENTER_BAND
+    from enhanced_proximity_detection import EnhancedProximityDetector
+    width, height = frame_size
+    x1, y1, x2, y2 = dets.xyxy.astype(np.int64).T
+    if kind == 'proximity':
+        vehicle = np.array([names.get(int(c)) in EnhancedProximityDetector.VEHICLES for c in dets.cls], bool)
+        return vehicle & (y2 - y1 >= height * EnhancedProximityDetector.MIN_BOX_HEIGHT_RATIO)
+    cxn, cyn = (x1 + x2) / (2.0 * width), (y1 + y2) / (2.0 * height)
+    return (np.isin(dets.cls, VEH_IDS) & (x2 > x1) & (y2 > y1)
+            & (CENTER_BAND[0] <= cxn) & (cxn <= CENTER_BAND[1]) & (cyn >= 0.45))
+
+
+def recall(kind, ref, roi):
+    """(boxes of interest in the reference store, how many of them the ROI store has)"""
+    from batched_detection import box_iou_matrix
+    total = hit = 0
+    for idx, dets in ref.iter_frames():
+        keep = of_interest(kind, dets, ref.frame_size, ref.names)
+        if not keep.any():
+            continue
+        total += int(keep.sum())
+        got = roi.frame(idx)
+        if len(got):
+            iou = box_iou_matrix(dets.xyxy[keep], got.xyxy)
+            iou[dets.cls[keep][:, None] != got.cls[None, :]] = 0.0
+            hit += int((iou.max(axis=1) >= MATCH_IOU).sum())
+    return total, hit
+
+
+def run_detector(kind, video_path, folder, batch_size, roi_px):
+    """(analyzer, its result, the detections it recorded)"""
+    from frame_pipeline import run_frame_pipeline
+    from detection_store import DetectionCache
+    cache = DetectionCache(folder, os.path.basename(video_path))
+    analyzer = make_analyzer(kind, video_path, cache, batch_size, roi_px)
+    result = run_frame_pipeline(video_path, [analyzer])[analyzer.name]
+    return analyzer, result, cache.load(analyzer._detector_settings())
+
+
+def benchmark_video(video_path, analyzers, batch_size, min_object_px):
+    from yolo_models import YOLO_IMGSZ
+    rows = []
+    with tempfile.TemporaryDirectory() as folder:
+        for kind in analyzers:
+            full, full_result, full_store = run_detector(kind, video_path, folder, batch_size, None)
+            roi, roi_result, roi_store = run_detector(kind, video_path, folder, batch_size, min_object_px)
+            total, hit = recall(kind, full_store, roi_store)
+            for mode, analyzer, result in (('full', full, full_result), ('roi', roi, roi_result)):
+                rows.append({
+                    'analyzer': kind,
+                    'mode': mode,
+                    'imgsz': analyzer.roi.imgsz if analyzer.roi is not None else YOLO_IMGSZ,
+                    'ms_per_frame': round(analyzer.batch.ms_per_frame, 2),
+                    'events': result.get('event_count', 0),
+                })
+            ref, cropped = rows[-2], rows[-1]
+            ref['speedup'], ref['recall'] = 1.0, (1.0 if total else None)
+            cropped['speedup'] = round(ref['ms_per_frame'] / max(cropped['ms_per_frame'], 1e-6), 2)
+            cropped['recall'] = round(hit / total, 3) if total else None
+            ref['boxes_of_interest'] = cropped['boxes_of_interest'] = total
+    return rows
+
+
+def main():
+    from main_v2 import _HAS_YOLO, INFERENCE_BATCH_SIZE
+    from batched_detection import MIN_OBJECT_PX
+    parser = argparse.ArgumentParser(description='Compare ROI-cropped and whole-frame close-encounter inference')
+    parser.add_argument('videos', nargs='*', help='Videos to benchmark (default: every video in backend/videos)')
+    parser.add_argument('--analyzers', default=','.join(ANALYZERS),
+                        help=f"Comma-separated analyzers (default: {','.join(ANALYZERS)})")
+    parser.add_argument('--batch-size', type=int, default=max(INFERENCE_BATCH_SIZE, 8),
+                        help='Frames per forward pass for both runs (default: 8 or the configured batch size)')
+    parser.add_argument('--min-object-px', type=int, default=MIN_OBJECT_PX,
+                        help=f'Smallest box of interest in model input pixels (default: {MIN_OBJECT_PX})')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+
+    if not _HAS_YOLO:
+        parser.error('ultralytics is not installed')
+    analyzers = [a.strip() for a in args.analyzers.split(',') if a.strip()]
+    unknown = [a for a in analyzers if a not in ANALYZERS]
+    if unknown:
+        parser.error(f"unknown analyzer(s): {', '.join(unknown)}")
+
+    videos = [v if os.path.exists(v) else os.path.join(VIDEOS_FOLDER, v) for v in args.videos]
+    if not videos:
+        videos = sorted(glob.glob(os.path.join(VIDEOS_FOLDER, '*.mp4')))
+
+    report = {}
+    for video_path in videos:
+        name = os.path.basename(video_path)
+        if not args.json:
+            print(f"\n🎞️  {name}")
+        rows = benchmark_video(video_path, analyzers, args.batch_size, args.min_object_px)
+        report[name] = rows
+        if args.json:
+            continue
+        print(f"   {'analyzer':<11}{'mode':<6}{'imgsz':>6}{'ms/f':>9}{'speedup':>9}"
+              f"{'boxes':>7}{'recall':>8}{'events':>8}")
+        for r in rows:
+            recalled = f"{100 * r['recall']:>7.1f}%" if r['recall'] is not None else f"{'n/a':>8}"
+            print(f"   {r['analyzer']:<11}{r['mode']:<6}{r['imgsz']:>6}{r['ms_per_frame']:>9.2f}"
+                  f"{r['speedup']:>8.2f}x{r['boxes_of_interest']:>7}{recalled}{r['events']:>8}")
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+
+    unmeasured = sorted({r['analyzer'] for rows in report.values() for r in rows
+                         if r['mode'] == 'roi' and r['recall'] is None})
+    if unmeasured:
+        print(f"⚠️  Recall not measured for {', '.join(unmeasured)}: the whole-frame run kept no boxes "
+              f"of interest (untrained weights?). Re-run with YOLO_MODEL set to the production weights "
+              f"before enabling inference.roi.", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Startup Benchmark for DriveGuard AI
+Times a cold import of each analysis entry point and fails if one of them
+pulls in a heavy dependency (torch, ultralytics, matplotlib) at import time.
+
+Heavy libraries must only load when an analyzer that needs them runs, so a
+rescoring run or the analyze client starts in well under a second.
+
+Usage:
+    python3 benchmark_startup.py [--runs N] [--budget SECONDS]
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+UTILS_DIR = os.path.abspath(os.path.dirname(__file__))
+ANALYSIS_DIR = os.path.join(UTILS_DIR, '..', 'analysis')
+
+# module name -> directory it is run from
+ENTRY_POINTS = {
+    'main_v2': ANALYSIS_DIR,
+    'analyze_video_single': ANALYSIS_DIR,
+    'analysis_worker': ANALYSIS_DIR,
+    'driving_score_calculator': ANALYSIS_DIR,
+    'enhanced_traffic_detection': ANALYSIS_DIR,
+    'speed_graph': UTILS_DIR,
+}
+
+HEAVY_MODULES = ('torch', 'ultralytics', 'matplotlib')
+
+# Runs in a fresh interpreter so nothing is already cached in sys.modules
+_PROBE = """
+import io, sys, json, time, contextlib
+sys.path.insert(0, {path!r})
+start = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def time_import(module: str, path: str):
+    """Import `module` in a new process; returns (seconds, heavy modules loaded)"""
+    code = _PROBE.format(path=path, module=module, heavy=HEAVY_MODULES)
+    proc = subprocess.run([sys.executable, '-c', code], cwd=path,
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'import failed')
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    return result['seconds'], result['heavy']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure cold import time of the analysis entry points')
+    parser.add_argument('--runs', type=int, default=3, help='Imports per module (median is reported)')
+    parser.add_argument('--budget', type=float, default=None,
+                        help='Fail if any module takes longer than this many seconds to import')
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("⏱️  DriveGuard AI - Startup Benchmark")
+    print("=" * 70)
+
+    failures = []
+    for module, path in ENTRY_POINTS.items():
+        try:
+            runs = [time_import(module, path) for _ in range(max(1, args.runs))]
+        except RuntimeError as e:
+            print(f"❌ {module:<28} could not be imported: {e}")
+            failures.append(module)
+            continue
+
+        median = statistics.median(seconds for seconds, _ in runs)
+        heavy = sorted({m for _, loaded in runs for m in loaded})
+        status = "✅"
+        if heavy:
+            status = "❌"
+            failures.append(module)
+        elif args.budget is not None and median > args.budget:
+            status = "❌"
+            failures.append(module)
+        note = f"  loads {', '.join(heavy)} at import" if heavy else ""
+        print(f"{status} {module:<28} {median * 1000:8.1f} ms{note}")
+
+    print("=" * 70)
+    if failures:
+        print(f"❌ Startup regression in: {', '.join(failures)}")
+        sys.exit(1)
+    print("✅ All entry points import without heavy dependencies")
+
+
+if __name__ == '__main__':
+    main()
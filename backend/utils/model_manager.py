@@ -1,16 +1,33 @@
 #!/usr/bin/env python3
 """
 Model Manager - Download and manage YOLO models
+
+export converts local .pt weights for CPU inference, without network access:
+- onnx       ONNX graph (dynamic batch / size) for ONNX Runtime
+- openvino   OpenVINO IR
+- --int8     post-training int8 quantization, calibrated on frames sampled
+             from backend/videos (onnxruntime.quantization for ONNX, NNCF
+             for OpenVINO)
+The analysis loads the artifact selected by "model": {"runtime", "int8"} in
+config/analysis_config.json (see analysis/yolo_models.py).
 """
 
 import os
 import sys
+import glob
 import json
+import shutil
 import urllib.request
 from pathlib import Path
 
 SCRIPT_DIR = Path(__file__).parent
 CONFIG_FILE = SCRIPT_DIR / "analysis_config.json"
+MODELS_FOLDER = SCRIPT_DIR.parent / "models"
+VIDEOS_FOLDER = SCRIPT_DIR.parent / "videos"
+ANALYSIS_DIR = SCRIPT_DIR.parent / "analysis"
+
+# Frames sampled from backend/videos to calibrate int8 quantization
+CALIB_FRAMES = 200
 
 MODEL_URLS = {
     "yolov8n.pt": "https://github.com/ultralytics/assets/releases/download/v0.0.0/yolov8n.pt",
@@ -113,6 +130,140 @@ def set_model(model_name):
     print(f"✅ Active model set to: {model_name}")
     return True
 
+def _find_weights(model_name):
+    """Local .pt weights: a path, or a name in backend/models (or next to this script)"""
+    for path in (Path(model_name), MODELS_FOLDER / model_name, SCRIPT_DIR / model_name):
+        if path.is_file():
+            return path
+    return None
+
+def _letterbox(frame, imgsz):
+    """BGR frame -> 1x3ximgszximgsz float32 RGB in [0, 1], padded like ultralytics"""
+    import cv2
+    import numpy as np
+    h, w = frame.shape[:2]
+    r = min(imgsz / h, imgsz / w)
+    nh, nw = int(round(h * r)), int(round(w * r))
+    canvas = np.full((imgsz, imgsz, 3), 114, np.uint8)
+    top, left = (imgsz - nh) // 2, (imgsz - nw) // 2
+    canvas[top:top + nh, left:left + nw] = cv2.resize(frame, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    return np.ascontiguousarray(canvas[:, :, ::-1].transpose(2, 0, 1))[None].astype(np.float32) / 255.0
+
+def calibration_frames(imgsz, count=CALIB_FRAMES):
+    """`count` frames spread evenly over the local videos, preprocessed for the model"""
+    import cv2
+    videos = sorted(glob.glob(str(VIDEOS_FOLDER / "*.mp4")) + glob.glob(str(VIDEOS_FOLDER / "*.MP4")))
+    if not videos:
+        return []
+    per_video = max(1, -(-count // len(videos)))
+    frames = []
+    for path in videos:
+        cap = cv2.VideoCapture(path)
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        for k in range(per_video):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int((k + 0.5) * total / per_video))
+            ok, frame = cap.read()
+            if ok:
+                frames.append(_letterbox(frame, imgsz))
+        cap.release()
+    return frames[:count]
+
+def _quantize_onnx(fp32_path, int8_path, frames):
+    from onnxruntime import InferenceSession
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    import onnx
+
+    input_name = InferenceSession(str(fp32_path), providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self):
+            self.frames = iter(frames)
+
+        def get_next(self):
+            frame = next(self.frames, None)
+            return None if frame is None else {input_name: frame}
+
+    quantize_static(str(fp32_path), str(int8_path), FrameReader(), quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8, per_channel=True)
+    # Keep the class names / stride ultralytics reads from the model metadata
+    src, dst = onnx.load(str(fp32_path)), onnx.load(str(int8_path))
+    del dst.metadata_props[:]
+    dst.metadata_props.extend(src.metadata_props)
+    onnx.save(dst, str(int8_path))
+
+def _quantize_openvino(fp32_dir, int8_dir, frames):
+    import nncf
+    import openvino as ov
+
+    xml = next(Path(fp32_dir).glob("*.xml"))
+    model = ov.Core().read_model(str(xml))
+    quantized = nncf.quantize(model, nncf.Dataset(frames), preset=nncf.QuantizationPreset.MIXED,
+                              subset_size=len(frames))
+    if int8_dir.exists():
+        shutil.rmtree(int8_dir)
+    int8_dir.mkdir(parents=True)
+    for meta in Path(fp32_dir).glob("*.yaml"):
+        shutil.copy(meta, int8_dir / meta.name)
+    ov.save_model(quantized, str(int8_dir / xml.name))
+
+def export_model(model_name, fmt="onnx", int8=False, imgsz=640, calib_frames=CALIB_FRAMES):
+    """Export local .pt weights to ONNX / OpenVINO next to them, optionally int8-quantized"""
+    weights = _find_weights(model_name)
+    if weights is None:
+        print(f"❌ Model {model_name} not found locally")
+        print(f"   Run: python3 model_manager.py download {model_name}")
+        return False
+    # Local files only: no requirement auto-installs, no weight downloads
+    os.environ["YOLO_AUTOINSTALL"] = "False"
+    os.environ["YOLO_OFFLINE"] = "True"
+    sys.path.insert(0, str(ANALYSIS_DIR))
+    from yolo_models import exported_weights
+    try:
+        from ultralytics import YOLO
+        if fmt == "onnx":
+            import onnx, onnxruntime  # noqa: F401 (exporter and the runtime it is for)
+        else:
+            import openvino  # noqa: F401
+            if int8:
+                import nncf  # noqa: F401
+    except ImportError as e:
+        print(f"❌ Missing package for {fmt}{' int8' if int8 else ''} export: {e.name}")
+        return False
+
+    print(f"📦 Exporting {weights.name} to {fmt} ({imgsz}px)...")
+    exported = Path(YOLO(str(weights)).export(format=fmt, imgsz=imgsz, dynamic=True, half=False, simplify=False))
+    target = Path(exported_weights(str(weights), fmt))
+    if exported.resolve() != target.resolve():
+        if target.is_dir():
+            shutil.rmtree(target)
+        elif target.exists():
+            target.unlink()
+        shutil.move(str(exported), str(target))
+    print(f"✅ Exported {target}")
+    if not int8:
+        return True
+
+    frames = calibration_frames(imgsz, calib_frames)
+    if not frames:
+        print(f"❌ No calibration videos in {VIDEOS_FOLDER}")
+        return False
+    int8_target = Path(exported_weights(str(weights), fmt, int8=True))
+    print(f"🧮 Quantizing to int8 with {len(frames)} calibration frames...")
+    if fmt == "onnx":
+        _quantize_onnx(target, int8_target, frames)
+    else:
+        _quantize_openvino(target, int8_target, frames)
+    print(f"✅ Exported {int8_target}")
+    return True
+
+def _option(args, name, default):
+    """Value following `name` in args (e.g. --imgsz 640)"""
+    if name in args:
+        i = args.index(name)
+        if i + 1 < len(args):
+            return int(args[i + 1])
+    return default
+
 def get_recommendations():
     """Get model recommendations based on use case"""
     print("\n" + "="*70)
@@ -144,10 +295,13 @@ def main():
         print("  python3 model_manager.py download <model>  - Download a model")
         print("  python3 model_manager.py set <model>       - Set active model")
         print("  python3 model_manager.py recommend         - Get recommendations")
+        print("  python3 model_manager.py export <model> [onnx|openvino] [--int8] [--imgsz N] [--calib-frames N]")
+        print("                                             - Export for CPU inference")
         print("")
         print("Examples:")
         print("  python3 model_manager.py download yolov8s.pt")
         print("  python3 model_manager.py set yolov8s.pt")
+        print("  python3 model_manager.py export yolov8s.pt openvino --int8")
         sys.exit(1)
     
     command = sys.argv[1].lower()
@@ -178,9 +332,24 @@ def main():
     elif command == "recommend":
         get_recommendations()
     
+    elif command == "export":
+        if len(sys.argv) < 3:
+            print("❌ Please specify model name")
+            print("   Example: python3 model_manager.py export yolov8s.pt onnx --int8")
+            sys.exit(1)
+        
+        model_name, options = sys.argv[2], sys.argv[3:]
+        fmt = "openvino" if "openvino" in options else "onnx"
+        int8 = "--int8" in options
+        if not export_model(model_name, fmt, int8, _option(options, "--imgsz", 640),
+                            _option(options, "--calib-frames", CALIB_FRAMES)):
+            sys.exit(1)
+        print(f"\n💡 To use it, set in config/analysis_config.json:")
+        print(f'   "model": {{"runtime": "{fmt}", "int8": {"true" if int8 else "false"}}}')
+    
     else:
         print(f"❌ Unknown command: {command}")
-        print("   Valid commands: list, download, set, recommend")
+        print("   Valid commands: list, download, set, recommend, export")
         sys.exit(1)
 
 if __name__ == "__main__":
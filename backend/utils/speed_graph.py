@@ -1,143 +1,88 @@
-import cv2
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.ticker as mticker
 import math
 import sys
 import os
 import json
+import glob
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-def create_speed_chart(video_path, config, output_path='speed_chart.png', visualize=False):
-    """
-    Analyzes a video to generate and save a smoothed speed vs. time chart
-    using the existing rectangular ROI parameters.
-    """
-    print("Step 1: Analyzing video with improved logic...")
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        print(f"Error: Cannot open video file at {video_path}")
-        return
+UTILS_DIR = os.path.abspath(os.path.dirname(__file__))
+BASE_DIR = os.path.dirname(UTILS_DIR)
+ANALYSIS_DIR = os.path.join(BASE_DIR, 'analysis')
+VIDEOS_FOLDER = os.path.join(BASE_DIR, 'videos')
+ANALYSIS_OUTPUT_FOLDER = os.path.join(BASE_DIR, 'outputs', 'analysis')
+CALIBRATION_FILE = os.path.join(BASE_DIR, 'config', 'video_calibrations.json')
+CHART_FOLDER = os.path.join(UTILS_DIR, 'output')
 
-    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-
-    # Use existing rectangular ROI parameters from the JSON file
-    roi_top = config.get('roi_top', 0.5)
-    roi_bottom = config.get('roi_bottom', 0.8)
-    # --- IMPORTANT ---
-    # The 'meters_per_pixel' from the JSON is too high for accurate graphing, causing unrealistic speeds.
-    # We will override it here with a more sensible value ONLY for this script.
-    # This will NOT affect your other scripts like Avg_speed.py.
-    # You can tune this value if speeds are still off.
-    mpp = 0.05 # Using a more realistic value for graphing.
-    # mpp = config.get('meters_per_pixel', 6.0) # This was the original line, now disabled.
-
-    roi_start_y = int(height * roi_top)
-    roi_end_y = int(height * roi_bottom)
-
-    prev_gray_frame = None
-    frame_speeds_kmph = []
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        current_gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        
-        if prev_gray_frame is None:
-            prev_gray_frame = current_gray_frame
-            continue
-
-        # Get the rectangular ROI from both frames
-        prev_roi = prev_gray_frame[roi_start_y:roi_end_y, :]
-        current_roi = current_gray_frame[roi_start_y:roi_end_y, :]
-
-        if prev_roi.size == 0:
-            continue
-
-        flow = cv2.calcOpticalFlowFarneback(prev_roi, current_roi, None, 0.5, 3, 15, 3, 5, 1.2, 0)
-        
-        speed_kmph = 0
-        if flow is not None:
-            # --- IMPROVEMENT: Filter flow vectors ---
-            # Keep only downward vertical flow (positive y-direction) which represents road movement
-            downward_flow_y = flow[..., 1][flow[..., 1] > 0]
-
-            if downward_flow_y.shape[0] > 20: # Require a minimum number of flow vectors
-                # Use a more robust percentile to ignore outliers (e.g., from shadows, reflections)
-                # This is more stable than the median for noisy data.
-                stable_flow = np.percentile(downward_flow_y, 75)
-                
-                # If flow is very small, consider it zero speed (car is stopped)
-                if stable_flow < 0.1:
-                    speed_kmph = 0
-                else:
-                    speed_mps = abs(stable_flow * mpp * fps)
-                    speed_kmph = speed_mps * 3.6
-            else:
-                # Not enough motion detected, assume speed is zero
-                speed_kmph = 0
-
-        frame_speeds_kmph.append(speed_kmph)
-        
-        if visualize:
-            vis_frame = frame.copy()
-            # Draw the rectangle on the frame
-            cv2.rectangle(vis_frame, (0, roi_start_y), (vis_frame.shape[1], roi_end_y), (0, 255, 255), 2)
-            
-            cv2.putText(vis_frame, f"Speed: {speed_kmph:.2f} km/h", (50, 50), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 0), 2)
-            
-            cv2.imshow("Speed Analysis - Press 'q' to quit", vis_frame)
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                visualize = False
-                cv2.destroyAllWindows()
-
-        prev_gray_frame = current_gray_frame
-    
-    cap.release()
-    if visualize:
-        cv2.destroyAllWindows()
-    print("Step 1 Complete.")
+sys.path.insert(0, ANALYSIS_DIR)
+from timeseries import load_timeseries
 
-    if not frame_speeds_kmph:
-        print("Could not calculate speed data.")
-        return
+# The calibrated speed analyzer's per-sample speeds (see analysis/timeseries.py)
+SPEED_SIGNAL = 'average_speed/speed_kmph'
+# Same defaults analyze_video uses for videos without a calibration entry
+DEFAULT_CALIBRATION = {'meters_per_pixel': 0.05, 'roi_top': 0.6, 'roi_bottom': 0.9}
 
-    # --- IMPROVEMENT: Smooth the speed data using a moving average ---
-    # This removes noise and jitter for a much cleaner graph.
-    window_size = int(fps / 2) # Use a half-second window for smoothing
-    if window_size < 1: window_size = 1
-    # Use 'valid' mode and adjust time points accordingly
-    smoothed_speeds = np.convolve(frame_speeds_kmph, np.ones(window_size)/window_size, mode='valid')
 
-    # --- Step 2: Aggregate speed data per second ---
-    print("Step 2: Aggregating smoothed speed data...")
-    num_smoothed_frames = len(smoothed_speeds)
-    total_seconds = int(num_smoothed_frames / fps)
-    
-    time_points = []
-    speed_points = []
-
-    for sec in range(total_seconds):
-        start_frame = int(sec * fps)
-        end_frame = int((sec + 1) * fps)
-        
-        second_speeds = smoothed_speeds[start_frame:end_frame]
-        
-        if len(second_speeds) > 0:
-            avg_speed_for_second = np.mean(second_speeds)
-            time_points.append(sec)
-            speed_points.append(avg_speed_for_second)
-    print("Step 2 Complete.")
+def timeseries_file(video_filename):
+    """<stem>_timeseries.npz written next to <stem>_analysis.json by the analysis"""
+    stem = os.path.splitext(os.path.basename(video_filename))[0]
+    return os.path.join(ANALYSIS_OUTPUT_FOLDER, f"{stem}_timeseries.npz")
 
-    # --- Step 3: Generate the chart ---
-    if not speed_points:
-        print("No speed points to plot after aggregation.")
-        return
-        
-    print(f"Step 3: Generating chart and saving to {output_path}...")
+
+def load_speed_series(video_path, config, signal=SPEED_SIGNAL):
+    """
+    (times, speeds) of one video: read from the analysis timeseries when the
+    video was analyzed, otherwise measured with the same calibrated analyzer
+    """
+    name, _, key = signal.partition('/')
+    series = load_timeseries(timeseries_file(video_path))
+    if series is not None and key in series.get(name, {}):
+        return series[name]['t'], series[name][key]
+
+    print("No analysis timeseries found, measuring speed from the video...")
+    from main_v2 import AverageSpeedAnalyzer, FLOW_ENGINES
+    from frame_pipeline import run_frame_pipeline
+    calib = dict(DEFAULT_CALIBRATION, **(config or {}))
+    analyzer = AverageSpeedAnalyzer(calib['meters_per_pixel'], calib['roi_top'], calib['roi_bottom'],
+                                    FLOW_ENGINES.get(AverageSpeedAnalyzer.name, 'farneback'))
+    measured = {}
+    run_frame_pipeline(video_path, [analyzer], series=measured)
+    signals = measured.get(analyzer.name, {})
+    return (np.asarray(signals.get('t', []), dtype=np.float32),
+            np.asarray(signals.get('speed_kmph', []), dtype=np.float32))
+
+
+def per_second_speeds(times, speeds, smooth_sec=0.5):
+    """
+    Moving-average smoothing over `smooth_sec`, then the mean speed of every
+    whole second that has samples. Returns (seconds, speeds).
+    """
+    times = np.asarray(times, dtype=np.float64)
+    speeds = np.asarray(speeds, dtype=np.float64)
+    if len(speeds) == 0:
+        return np.empty(0, np.int64), np.empty(0)
+
+    rate = 1.0 / np.median(np.diff(times)) if len(times) > 1 else 1.0
+    window = max(1, min(len(speeds), int(round(rate * smooth_sec))))
+    smoothed = np.convolve(speeds, np.ones(window) / window, mode='valid')
+    # Each smoothed value belongs to the middle of its window
+    offset = (window - 1) // 2
+    seconds = np.floor(times[offset:offset + len(smoothed)]).astype(np.int64)
+
+    counts = np.bincount(seconds)
+    sums = np.bincount(seconds, weights=smoothed)
+    have = np.nonzero(counts)[0]
+    return have, sums[have] / counts[have]
+
+
+def render_speed_chart(time_points, speed_points, output_path):
+    """Draw the chart headlessly (Agg backend) and save it as a PNG"""
+    # matplotlib is only needed (and only imported) once there is data to plot
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import matplotlib.ticker as mticker
     plt.style.use('dark_background')
     fig, ax = plt.subplots(figsize=(12, 6))
 
@@ -147,53 +92,104 @@ def create_speed_chart(video_path, config, output_path='speed_chart.png', visual
     ax.set_xlabel('Time (MM:SS)', fontsize=12, color='white')
     ax.grid(True, linestyle='--', alpha=0.4)
 
-    max_speed = max(speed_points) if speed_points else 60
+    max_speed = max(speed_points) if len(speed_points) else 60
     ax.set_ylim(0, math.ceil((max_speed + 15) / 10) * 10)
 
     def time_formatter(x, pos):
         minutes = int(x // 60)
         seconds = int(x % 60)
         return f'{minutes:02d}:{seconds:02d}'
-    
+
     ax.xaxis.set_major_formatter(mticker.FuncFormatter(time_formatter))
     ax.tick_params(axis='x', colors='white')
     ax.tick_params(axis='y', colors='white')
     fig.tight_layout()
 
-    plt.savefig(output_path, dpi=150, facecolor='darkgrey')
+    fig.savefig(output_path, dpi=150, facecolor='darkgrey')
+    plt.close(fig)  # batch workers render many charts
+
+
+def create_speed_chart(video_path, config, output_path='speed_chart.png'):
+    """
+    Generate and save a smoothed speed vs. time chart from the speed series
+    recorded during analysis (same calibration as analyze_video).
+    """
+    print(f"Step 1: Loading speed series for {os.path.basename(video_path)}...")
+    times, speeds = load_speed_series(video_path, config)
+    if len(speeds) == 0:
+        print("Could not calculate speed data.")
+        return
+    print("Step 1 Complete.")
+
+    print("Step 2: Aggregating smoothed speed data...")
+    time_points, speed_points = per_second_speeds(times, speeds)
+    print("Step 2 Complete.")
+
+    # --- Step 3: Generate the chart ---
+    if len(speed_points) == 0:
+        print("No speed points to plot after aggregation.")
+        return
+
+    print(f"Step 3: Generating chart and saving to {output_path}...")
+    render_speed_chart(time_points, speed_points, output_path)
     print("Step 3 Complete. Chart saved successfully!")
+    return output_path
 
 
-if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print("Usage: python speed_graph.py <video_filename> [--visualize]")
-        sys.exit(1)
+def chart_filename(video_filename):
+    return f"{os.path.splitext(os.path.basename(video_filename))[0]}_speed_chart_improved.png"
+
 
-    video_to_analyze = sys.argv[1]
-    visualize_mode = '--visualize' in sys.argv
+def create_speed_charts(video_paths, calibrations, output_folder=CHART_FOLDER, workers=None):
+    """Render the charts of many videos in a process pool; returns the charts written"""
+    os.makedirs(output_folder, exist_ok=True)
+    jobs = [(path, calibrations.get(os.path.basename(path)), os.path.join(output_folder, chart_filename(path)))
+            for path in video_paths]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs)))
+    if workers == 1:
+        return [out for out in (create_speed_chart(*job) for job in jobs) if out]
 
-    project_root = os.path.abspath(os.path.dirname(__file__))
-    video_folder_path = os.path.join(project_root, '..', 'videos')
-    video_file_path = os.path.join(video_folder_path, video_to_analyze)
-    calibration_file_path = os.path.join(project_root, 'video_calibrations.json')
+    written = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(create_speed_chart, *job): job[0] for job in jobs}
+        for future in as_completed(futures):
+            try:
+                out = future.result()
+            except Exception as e:
+                print(f"Error rendering chart for {os.path.basename(futures[future])}: {e}")
+                continue
+            if out:
+                written.append(out)
+    return written
 
-    if not os.path.exists(video_file_path):
-        print(f"Error: Video file not found at {video_file_path}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render speed vs. time charts from the analysis timeseries')
+    parser.add_argument('videos', nargs='*', help='Video filenames (in backend/videos) or paths')
+    parser.add_argument('--all', action='store_true', help='Every video that has an analysis timeseries')
+    parser.add_argument('--output', default=CHART_FOLDER, help='Folder for the PNG charts')
+    parser.add_argument('--workers', type=int, default=None, help='Charts rendered in parallel (default: all cores)')
+    args = parser.parse_args()
+
+    video_paths = [v if os.path.exists(v) else os.path.join(VIDEOS_FOLDER, v) for v in args.videos]
+    if args.all:
+        for npz in sorted(glob.glob(os.path.join(ANALYSIS_OUTPUT_FOLDER, '*_timeseries.npz'))):
+            stem = os.path.basename(npz)[:-len('_timeseries.npz')]
+            found = glob.glob(os.path.join(VIDEOS_FOLDER, f"{glob.escape(stem)}.*"))
+            video_paths.append(found[0] if found else os.path.join(VIDEOS_FOLDER, f"{stem}.mp4"))
+    if not video_paths:
+        parser.print_usage()
         sys.exit(1)
 
-    try:
-        with open(calibration_file_path, 'r') as f:
-            all_configs = json.load(f)
-        config = all_configs.get(os.path.basename(video_file_path))
-        if config is None:
-            print(f"Error: No configuration found for '{os.path.basename(video_file_path)}'")
-            sys.exit(1)
-    except Exception as e:
-        print(f"Error loading configuration: {e}")
+    missing = [p for p in video_paths if not os.path.exists(p) and not os.path.exists(timeseries_file(p))]
+    if missing:
+        print(f"Error: Video file not found at {missing[0]}")
         sys.exit(1)
 
-    output_filename = f"{os.path.splitext(video_to_analyze)[0]}_speed_chart_improved.png"
-    output_path = os.path.join(project_root, 'output', output_filename)
-    os.makedirs(os.path.join(project_root, 'output'), exist_ok=True)
+    calibrations = {}
+    if os.path.exists(CALIBRATION_FILE):
+        with open(CALIBRATION_FILE, 'r') as f:
+            calibrations = json.load(f)
 
-    create_speed_chart(video_file_path, config, output_path, visualize_mode)
+    written = create_speed_charts(video_paths, calibrations, args.output, args.workers)
+    print(f"Saved {len(written)} chart(s) to {args.output}")
@@ -165,6 +165,8 @@ export function VideoUpload({
       if (carNumber) formData.append('carNumber', carNumber);
       if (driverId) formData.append('driverId', driverId);
       if (vehicleId) formData.append('vehicleId', vehicleId);
+      // Indexes the result under the uploader (see results_store.py)
+      if (userData?.email) formData.append('email', userData.email);
 
       // Upload video to backend
       const uploadResponse = await fetch('http://localhost:3001/api/upload-video', {
@@ -209,7 +211,7 @@ export function VideoUpload({
       setUploadProgress(0);
       alert('Video upload failed. Please try again.');
     }
-  }, [selectedFile, carNumber, onUploadComplete]);
+  }, [selectedFile, carNumber, userData?.email, onUploadComplete]);
 
   const handleDriverSelection = () => {
     let finalDriverId = selectedDriverId;